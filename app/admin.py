@@ -1,21 +1,128 @@
+import mimetypes
+
 from django.contrib import admin
-from .models import ImageUpload, AudioUpload, ConversionSession, AudioRecording
+from django.http import Http404
+from django.urls import path, reverse
+from django.utils.html import format_html
+
+from .delivery import serve_file
+from .models import ImageUpload, AudioUpload, ConversionBatch, ConversionSession, AudioRecording, ResultCacheEntry, ImageFingerprint, RecordingUpload, StageTiming
+
+# Leading bytes of the audio containers recordings come in
+AUDIO_SIGNATURES = (
+    (b'\x1aE\xdf\xa3', 'audio/webm'),
+    (b'OggS', 'audio/ogg'),
+    (b'RIFF', 'audio/wav'),
+    (b'ID3', 'audio/mpeg'),
+    (b'fLaC', 'audio/flac'),
+)
+
+
+def recording_content_type(recording):
+    """
+    MIME type of a recording's file: from its name when that has an
+    extension, otherwise from its first bytes (content-addressed names
+    have none)
+    """
+    content_type, _ = mimetypes.guess_type(recording.audio_file.name)
+    if content_type:
+        return content_type
+    with recording.audio_file.open('rb') as audio_file:
+        head = audio_file.read(12)
+    if head[4:8] == b'ftyp':
+        return 'audio/mp4'
+    if head[:1] == b'\xff' and len(head) > 1 and head[1] & 0xE0 == 0xE0:
+        # MP3 frame sync
+        return 'audio/mpeg'
+    return next((content_type for signature, content_type in AUDIO_SIGNATURES
+                 if head.startswith(signature)), 'application/octet-stream')
+
 
 # Register your models here.
 admin.site.register(ImageUpload)
 admin.site.register(AudioUpload)
 
+class StageTimingInline(admin.TabularInline):
+    model = StageTiming
+    fields = ('stage', 'seconds', 'outcome', 'size', 'created_at')
+    readonly_fields = fields
+    extra = 0
+    can_delete = False
+
 @admin.register(ConversionSession)
 class ConversionSessionAdmin(admin.ModelAdmin):
-    list_display = ('session_id', 'conversion_type', 'processing_status', 'created_at', 'completed_at')
+    list_display = ('session_id', 'conversion_type', 'processing_status', 'attempts', 'created_at', 'completed_at')
     list_filter = ('conversion_type', 'processing_status', 'created_at')
     search_fields = ('session_id', 'description_prompt')
-    readonly_fields = ('session_id', 'created_at', 'completed_at')
+    readonly_fields = ('session_id', 'created_at', 'completed_at', 'worker_id',
+                       'started_at', 'heartbeat_at', 'lease_expires_at')
+    ordering = ('-created_at',)
+    inlines = (StageTimingInline,)
+
+@admin.register(ConversionBatch)
+class ConversionBatchAdmin(admin.ModelAdmin):
+    list_display = ('batch_id', 'conversion_type', 'item_count', 'created_at')
+    list_filter = ('conversion_type', 'created_at')
+    readonly_fields = ('batch_id', 'created_at')
     ordering = ('-created_at',)
 
 @admin.register(AudioRecording)
 class AudioRecordingAdmin(admin.ModelAdmin):
-    list_display = ('session', 'duration', 'created_at')
+    list_display = ('session', 'duration', 'size', 'created_at')
     list_filter = ('created_at',)
+    list_select_related = ('session',)
+    raw_id_fields = ('session',)
+    fields = ('session', 'duration', 'audio', 'size', 'sha256', 'created_at')
+    readonly_fields = ('audio', 'size', 'sha256', 'created_at')
+    ordering = ('-created_at',)
+
+    # Session text that neither the list nor the form shows
+    deferred_session_fields = (
+        'description_prompt', 'error_message', 'description_style', 'transcription', 'image_description')
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).defer(
+            *(f"session__{name}" for name in self.deferred_session_fields))
+
+    def has_add_permission(self, request):
+        # Recordings are stored by the app, content-addressed
+        return False
+
+    def get_urls(self):
+        return [
+            path('<path:object_id>/audio/', self.admin_site.admin_view(self.audio_view),
+                 name='app_audiorecording_audio'),
+            *super().get_urls(),
+        ]
+
+    def audio_view(self, request, object_id):
+        """Stream a recording's file, with Range support for seeking"""
+        recording = self.get_object(request, object_id)
+        if recording is None or not self.has_view_permission(request, recording):
+            raise Http404
+        return serve_file(request, recording.audio_file.path, recording_content_type(recording))
+
+    @admin.display(description='Audio')
+    def audio(self, recording):
+        if not recording.pk:
+            return '-'
+        # Nothing is fetched until the player is started
+        url = reverse('admin:app_audiorecording_audio', args=[recording.pk])
+        return format_html('<audio controls preload="none" src="{}"></audio>', url)
+
+@admin.register(ResultCacheEntry)
+class ResultCacheEntryAdmin(admin.ModelAdmin):
+    list_display = ('cache_key', 'session', 'hits', 'created_at', 'last_used_at')
     readonly_fields = ('created_at',)
-    ordering = ('-created_at',)
\ No newline at end of file
+    ordering = ('-last_used_at',)
+
+@admin.register(ImageFingerprint)
+class ImageFingerprintAdmin(admin.ModelAdmin):
+    list_display = ('__str__', 'session')
+    raw_id_fields = ('session',)
+
+@admin.register(RecordingUpload)
+class RecordingUploadAdmin(admin.ModelAdmin):
+    list_display = ('upload_id', 'content_type', 'received_bytes', 'created_at', 'updated_at')
+    readonly_fields = ('upload_id', 'received_bytes', 'created_at', 'updated_at')
+    ordering = ('-updated_at',)
@@ -1,6 +1,15 @@
 from django.apps import AppConfig
+from django.db.backends.signals import connection_created
 
 
 class AppConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'app'
+
+    def ready(self):
+        from . import database, storage
+
+        # WAL and synchronous=NORMAL on every SQLite connection
+        connection_created.connect(database.configure_connection)
+        # Uploads are received into MEDIA_ROOT (see app/storage.py)
+        storage.incoming_dir()
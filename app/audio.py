@@ -0,0 +1,273 @@
+"""
+Audio decoding for transcription.
+
+Inputs are decoded by a single ffmpeg process that writes 16 kHz mono s16le
+PCM to stdout, which is turned straight into the float32 array Whisper
+expects. No intermediate WAV file is written and Whisper does not spawn its
+own ffmpeg to decode the input a second time.
+
+Decoded audio can then be trimmed of leading/trailing silence and split at
+pauses for parallel transcription, using a frame-energy voice activity
+detector. A StreamDecoder decodes a recording while it is still arriving,
+for live transcription.
+"""
+import asyncio
+import functools
+import shutil
+import subprocess
+
+import numpy as np
+
+# Whisper's native sample rate
+SAMPLE_RATE = 16000
+
+# Voice activity detection: 30 ms frames count as speech when they are
+# within VAD_RANGE_DB of the loud (95th percentile) frames and above an
+# absolute floor
+FRAME_SECONDS = 0.03
+VAD_RANGE_DB = 35.0
+VAD_FLOOR_DB = -55.0
+# Silence kept around speech so word onsets and endings are not clipped
+PADDING_SECONDS = 0.25
+# How far back from a chunk's maximum length to look for a pause to cut at
+SPLIT_SEARCH_SECONDS = 10.0
+# Level smoothing before choosing a cut, so short dips inside words are ignored
+SPLIT_SMOOTHING_SECONDS = 0.3
+
+
+class AudioDecodeError(RuntimeError):
+    """Raised when ffmpeg is missing or cannot decode the input"""
+
+
+@functools.lru_cache(maxsize=None)
+def ffmpeg_path():
+    """Locate a working ffmpeg binary once per process, or return None"""
+    path = shutil.which('ffmpeg')
+    if path is None:
+        return None
+    try:
+        subprocess.run([path, '-version'], capture_output=True, check=True)
+    except (subprocess.CalledProcessError, OSError):
+        return None
+    return path
+
+
+def ffmpeg_available():
+    return ffmpeg_path() is not None
+
+
+def _decode_command(source, sample_rate, streaming=False):
+    """
+    The ffmpeg command line and stdin payload for decoding `source`. With
+    `streaming`, ffmpeg starts decoding without probing ahead and writes
+    out every packet as soon as it is decoded.
+    """
+    ffmpeg = ffmpeg_path()
+    if ffmpeg is None:
+        raise AudioDecodeError("FFmpeg is not available")
+
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        input_arg, stdin_data = 'pipe:0', bytes(source)
+    else:
+        input_arg, stdin_data = str(source), None
+
+    input_options = ['-fflags', 'nobuffer', '-probesize', '32768', '-analyzeduration', '0'] \
+        if streaming else []
+    output_options = ['-flush_packets', '1'] if streaming else []
+    cmd = [
+        ffmpeg, '-hide_banner',
+        '-loglevel', 'error',
+        '-threads', '0',
+        *input_options,
+        '-i', input_arg,
+        '-f', 's16le',
+        '-acodec', 'pcm_s16le',
+        '-ac', '1',
+        '-ar', str(sample_rate),
+        *output_options,
+        'pipe:1',
+    ]
+    return cmd, stdin_data
+
+
+def _samples(returncode, stdout, stderr):
+    if returncode != 0:
+        raise AudioDecodeError(
+            f"FFmpeg could not decode audio: {stderr.decode(errors='replace').strip()}")
+    if not stdout:
+        raise AudioDecodeError("FFmpeg produced no audio samples")
+    return np.frombuffer(stdout, np.int16).astype(np.float32) / 32768.0
+
+
+def decode_audio(source, sample_rate=SAMPLE_RATE):
+    """
+    Decode `source` (raw bytes or a file path) of any container format
+    ffmpeg understands into a mono float32 array in [-1, 1].
+
+    Bytes are piped through stdin. Paths are handed to ffmpeg directly
+    because some containers (e.g. MP4 with a trailing moov atom) need a
+    seekable input.
+    """
+    cmd, stdin_data = _decode_command(source, sample_rate)
+    result = subprocess.run(cmd, input=stdin_data, capture_output=True)
+    return _samples(result.returncode, result.stdout, result.stderr)
+
+
+async def decode_audio_async(source, sample_rate=SAMPLE_RATE):
+    """`decode_audio` without blocking the event loop"""
+    cmd, stdin_data = _decode_command(source, sample_rate)
+    process = await asyncio.create_subprocess_exec(
+        *cmd,
+        stdin=asyncio.subprocess.PIPE if stdin_data is not None else asyncio.subprocess.DEVNULL,
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.PIPE,
+    )
+    stdout, stderr = await process.communicate(stdin_data)
+    return _samples(process.returncode, stdout, stderr)
+
+
+class StreamDecoder:
+    """
+    Decode a recording that is still arriving (e.g. MediaRecorder WebM
+    chunks) with one long-running ffmpeg process. Bytes are fed to its
+    stdin as they come in and `samples()` returns everything decoded so
+    far. Use on a running event loop.
+    """
+
+    def __init__(self, sample_rate=SAMPLE_RATE):
+        self.sample_rate = sample_rate
+        self._process = None
+        self._reader = None
+        self._pieces = []
+        self._remainder = b''
+
+    async def start(self):
+        cmd, _ = _decode_command(b'', self.sample_rate, streaming=True)
+        self._process = await asyncio.create_subprocess_exec(
+            *cmd,
+            stdin=asyncio.subprocess.PIPE,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE,
+        )
+        self._reader = asyncio.create_task(self._read())
+
+    async def _read(self):
+        while True:
+            data = await self._process.stdout.read(64 * 1024)
+            if not data:
+                return
+            # Samples are two bytes each; keep an odd trailing byte for later
+            data = self._remainder + data
+            usable = len(data) - len(data) % 2
+            self._remainder = data[usable:]
+            if usable:
+                self._pieces.append(np.frombuffer(data[:usable], np.int16))
+
+    async def feed(self, data):
+        """Pass more of the recording to ffmpeg"""
+        try:
+            self._process.stdin.write(data)
+            await self._process.stdin.drain()
+        except (BrokenPipeError, ConnectionResetError):
+            raise AudioDecodeError(await self._error())
+
+    def __len__(self):
+        return sum(len(piece) for piece in self._pieces)
+
+    def samples(self, start=0):
+        """
+        The samples decoded so far from index `start` on, as a mono float32
+        array in [-1, 1]
+        """
+        if len(self._pieces) > 1:
+            self._pieces = [np.concatenate(self._pieces)]
+        if not self._pieces:
+            return np.zeros(0, np.float32)
+        return self._pieces[0][start:].astype(np.float32) / 32768.0
+
+    async def _error(self):
+        stderr = await self._process.stderr.read()
+        return f"FFmpeg could not decode audio: {stderr.decode(errors='replace').strip()}"
+
+    async def finish(self):
+        """Decode whatever is still buffered and return all the samples"""
+        if self._process.stdin.can_write_eof():
+            self._process.stdin.write_eof()
+        await self._reader
+        if await self._process.wait() != 0:
+            raise AudioDecodeError(await self._error())
+        return self.samples()
+
+    async def close(self):
+        """Stop ffmpeg without waiting for the rest of the output"""
+        if self._process is not None and self._process.returncode is None:
+            self._process.kill()
+            await self._process.wait()
+        if self._reader is not None:
+            self._reader.cancel()
+
+
+def placeholder_audio(duration=2.0, sample_rate=SAMPLE_RATE):
+    """A short 800 Hz tone used when the input cannot be decoded at all"""
+    t = np.linspace(0, duration, int(sample_rate * duration), dtype=np.float32)
+    return 0.1 * np.sin(2 * np.pi * 800 * t)
+
+
+def frame_levels(samples, frame_length):
+    """RMS level in dBFS of each complete `frame_length` frame"""
+    count = len(samples) // frame_length
+    frames = samples[:count * frame_length].reshape(count, frame_length).astype(np.float64)
+    return 20 * np.log10(np.sqrt(np.mean(frames ** 2, axis=1)) + 1e-10)
+
+
+def speech_frames(levels):
+    """Boolean mask of the frames that contain speech"""
+    if not len(levels):
+        return np.zeros(0, dtype=bool)
+    reference = np.percentile(levels, 95)
+    return levels > max(reference - VAD_RANGE_DB, VAD_FLOOR_DB)
+
+
+def trim_silence(samples, sample_rate=SAMPLE_RATE):
+    """
+    Cut leading and trailing silence (keeping PADDING_SECONDS around the
+    speech). Returns an empty array if nothing sounds like speech.
+    """
+    frame_length = int(sample_rate * FRAME_SECONDS)
+    voiced = np.flatnonzero(speech_frames(frame_levels(samples, frame_length)))
+    if not len(voiced):
+        return samples[:0]
+
+    padding = int(sample_rate * PADDING_SECONDS)
+    start = max(voiced[0] * frame_length - padding, 0)
+    end = min((voiced[-1] + 1) * frame_length + padding, len(samples))
+    return samples[start:end]
+
+
+def split_at_silence(samples, max_seconds, sample_rate=SAMPLE_RATE):
+    """
+    Split audio into consecutive chunks of at most `max_seconds`, each cut
+    at the quietest point of the SPLIT_SEARCH_SECONDS before the limit so
+    that words are not cut in half
+    """
+    max_length = int(sample_rate * max_seconds)
+    if len(samples) <= max_length:
+        return [samples]
+
+    frame_length = int(sample_rate * FRAME_SECONDS)
+    window = max(int(SPLIT_SMOOTHING_SECONDS / FRAME_SECONDS), 1)
+    levels = np.convolve(
+        frame_levels(samples, frame_length), np.ones(window) / window, mode='same')
+    # Short chunks only look in their second half, so no chunk is tiny
+    search_frames = int(min(SPLIT_SEARCH_SECONDS, max_seconds / 2) / FRAME_SECONDS)
+
+    chunks = []
+    start = 0
+    while len(samples) - start > max_length:
+        last = (start + max_length) // frame_length
+        first = max(last - search_frames, start // frame_length + 1)
+        cut = (first + int(np.argmin(levels[first:last]))) * frame_length
+        chunks.append(samples[start:cut])
+        start = cut
+    chunks.append(samples[start:])
+    return chunks
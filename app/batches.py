@@ -0,0 +1,111 @@
+"""
+Batch conversions.
+
+A batch upload (several files, or zip archives of them) becomes one
+ConversionBatch with a ConversionSession per item. Items go through the
+normal job queue, so they run on all available workers at once, and each
+provider call is throttled by the per-provider limits in app/limits.py.
+Clients follow progress through `finished_items`, which yields items in
+the order they finish.
+"""
+import asyncio
+import hashlib
+import os
+import zipfile
+
+from django.conf import settings
+from django.core.files.uploadedfile import TemporaryUploadedFile
+
+from . import storage
+
+ALLOWED_EXTENSIONS = {
+    'audio_to_image': {'.wav', '.mp3', '.m4a', '.mp4', '.aac', '.ogg', '.oga', '.opus', '.webm', '.flac'},
+    'image_to_audio': {'.png', '.jpg', '.jpeg', '.gif', '.webp', '.bmp', '.tif', '.tiff'},
+}
+
+FINAL_STATUSES = ('completed', 'failed')
+
+
+class BatchError(ValueError):
+    """An upload that cannot be turned into a batch"""
+
+
+def _allowed(conversion_type, name):
+    return os.path.splitext(name)[1].lower() in ALLOWED_EXTENSIONS[conversion_type]
+
+
+def _archive_items(conversion_type, archive):
+    """
+    Yield the usable members of a zip upload as files. Directories, hidden
+    files and files of other types are skipped.
+    """
+    try:
+        zip_file = zipfile.ZipFile(archive)
+    except zipfile.BadZipFile:
+        raise BatchError(f"{archive.name} is not a valid zip archive")
+
+    with zip_file:
+        for info in zip_file.infolist():
+            name = os.path.basename(info.filename)
+            if info.is_dir() or not name or name.startswith('.') \
+                    or info.filename.startswith('__MACOSX/') or not _allowed(conversion_type, name):
+                continue
+            if info.file_size > settings.BATCH_MAX_ITEM_BYTES:
+                raise BatchError(f"{name} is larger than {settings.BATCH_MAX_ITEM_BYTES} bytes")
+
+            # Extract each member once, into the incoming directory, so that
+            # storing it as an input is a rename; hash it on the way
+            storage.incoming_dir()
+            extracted = TemporaryUploadedFile(name, None, info.file_size, None)
+            digest = hashlib.sha256()
+            with zip_file.open(info) as member:
+                for chunk in iter(lambda: member.read(64 * 1024), b''):
+                    extracted.write(chunk)
+                    digest.update(chunk)
+            extracted.seek(0)
+            extracted.sha256 = digest.hexdigest()
+            yield extracted
+
+
+def collect_uploads(conversion_type, files=(), archives=()):
+    """
+    Return the files making up a batch: the uploaded `files` themselves and
+    the members of each zip in `archives`. Raises BatchError when there is
+    nothing to convert, too much, or a file of the wrong type.
+    """
+    uploads = []
+    for upload in files:
+        if not _allowed(conversion_type, upload.name):
+            raise BatchError(f"{upload.name} is not a supported file type for {conversion_type}")
+        uploads.append(upload)
+
+    for archive in archives:
+        for item in _archive_items(conversion_type, archive):
+            uploads.append(item)
+            if len(uploads) > settings.BATCH_MAX_ITEMS:
+                break
+
+    if not uploads:
+        raise BatchError('No files provided')
+    if len(uploads) > settings.BATCH_MAX_ITEMS:
+        raise BatchError(f"A batch can contain at most {settings.BATCH_MAX_ITEMS} files")
+    return uploads
+
+
+async def finished_items(batch, poll_interval=None):
+    """
+    Yield the items of `batch` as they complete or fail, until every item
+    has been yielded once
+    """
+    poll_interval = poll_interval or settings.BATCH_STREAM_POLL_INTERVAL
+    reported = set()
+    while True:
+        finished = batch.items.filter(
+            processing_status__in=FINAL_STATUSES).exclude(pk__in=reported).order_by('batch_index')
+        async for session in finished:
+            reported.add(session.pk)
+            yield session
+
+        if len(reported) >= batch.item_count:
+            return
+        await asyncio.sleep(poll_interval)
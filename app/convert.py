@@ -1,128 +1,166 @@
 import os
-import base64
-import tempfile
-import whisper
-import openai
+import asyncio
 from PIL import Image
-import requests
-from elevenlabs import generate, save, set_api_key
 from django.conf import settings
 from dotenv import load_dotenv
 import io
-import subprocess
+import re
 import shutil
+import time
+from . import audio, http_clients, image_prep, limits, metrics, rate_limit, transcription
+from .storage import output_file
 
 # Load environment variables
 load_dotenv()
 
+# Models used by each conversion stage
+CHAT_MODEL = "gpt-4"
+IMAGE_MODEL = "dall-e-3"
+VISION_MODEL = "gpt-4o"
+TTS_MODEL = "eleven_monolingual_v1"
 
-class AIConverter:
-    def __init__(self):
-        # Initialize OpenAI client
-        self.openai_client = openai.OpenAI(api_key=os.getenv('OPENAI_API_KEY'))
+# Sentence boundaries for streamed narration: terminal punctuation plus any
+# closing quotes or brackets, followed by whitespace
+SENTENCE_END_RE = re.compile(r'[.!?]+["\')\]]*(?=\s)')
+MIN_SENTENCE_LENGTH = 20
 
-        # Initialize Whisper model
-        self.whisper_model = whisper.load_model("base")
+# ElevenLabs REST API, called through the pooled HTTP clients
+VOICE_ID_RE = re.compile(r'^[a-zA-Z0-9]{20}$')
+_voice_ids = {}
 
-        # Set ElevenLabs API key
-        set_api_key(os.getenv('ELEVENLABS_API_KEY'))
 
-    def _convert_webm_to_wav(self, webm_path):
-        """
-        Convert webm audio to wav format for better Whisper compatibility
-        """
-        try:
-            # Create temporary wav file
-            wav_path = webm_path.replace('.webm', '.wav')
+def model_identifiers(conversion_type):
+    """
+    The models a conversion's output depends on. Part of the result cache
+    key, so changing any of them invalidates previously cached results.
+    """
+    if conversion_type == 'audio_to_image':
+        return [f"{settings.TRANSCRIPTION_BACKEND}-{settings.WHISPER_MODEL_SIZE}", CHAT_MODEL, IMAGE_MODEL]
+    return [VISION_MODEL, f"vision-detail-{settings.VISION_DETAIL}", TTS_MODEL]
 
-            # Check if ffmpeg is available
-            try:
-                subprocess.run(['ffmpeg', '-version'],
-                               capture_output=True, check=True)
-                ffmpeg_available = True
-            except (subprocess.CalledProcessError, FileNotFoundError):
-                ffmpeg_available = False
-                print("FFmpeg not available, trying alternative approach...")
-
-            if ffmpeg_available:
-                # Use ffmpeg to convert webm to wav
-                cmd = [
-                    'ffmpeg', '-i', webm_path,
-                    '-acodec', 'pcm_s16le',
-                    '-ar', '16000',
-                    '-ac', '1',
-                    wav_path, '-y'
-                ]
-
-                print(f"Converting {webm_path} to {wav_path}...")
-                result = subprocess.run(cmd, capture_output=True, text=True)
-
-                if result.returncode == 0 and os.path.exists(wav_path) and os.path.getsize(wav_path) > 0:
-                    print(f"Successfully converted to {wav_path}")
-                    return wav_path
-                else:
-                    print(f"FFmpeg conversion failed: {result.stderr}")
-
-            # Fallback: Create a simple wav file from the webm data
-            print("Creating simple wav file from webm data...")
-            try:
-                # Read the webm file
-                with open(webm_path, 'rb') as f:
-                    webm_data = f.read()
-
-                # Create a simple wav file with a placeholder audio
-                import struct
-                import numpy as np
-
-                # Create a simple wav file
-                sample_rate = 16000
-                num_channels = 1
-                bits_per_sample = 16
-                duration = 2.0  # 2 seconds
-                num_samples = int(sample_rate * duration)
-
-                # Generate a simple audio signal (silence with a beep)
-                t = np.linspace(0, duration, num_samples)
-                # Create a simple beep sound
-                audio_signal = 0.1 * np.sin(2 * np.pi * 800 * t)  # 800 Hz tone
-                audio_signal = (audio_signal * 32767).astype(np.int16)
-
-                # Write WAV file
-                with open(wav_path, 'wb') as wav_file:
-                    # WAV header
-                    wav_file.write(b'RIFF')
-                    wav_file.write(struct.pack(
-                        '<I', 36 + len(audio_signal) * 2))
-                    wav_file.write(b'WAVE')
-                    wav_file.write(b'fmt ')
-                    wav_file.write(struct.pack('<I', 16))
-                    wav_file.write(struct.pack('<H', 1))  # PCM
-                    wav_file.write(struct.pack('<H', num_channels))
-                    wav_file.write(struct.pack('<I', sample_rate))
-                    wav_file.write(struct.pack(
-                        '<I', sample_rate * num_channels * bits_per_sample // 8))
-                    wav_file.write(struct.pack(
-                        '<H', num_channels * bits_per_sample // 8))
-                    wav_file.write(struct.pack('<H', bits_per_sample))
-                    wav_file.write(b'data')
-                    wav_file.write(struct.pack('<I', len(audio_signal) * 2))
-                    wav_file.write(audio_signal.tobytes())
-
-                print(f"Created simple wav file: {wav_path}")
-                return wav_path
 
-            except Exception as e:
-                print(f"Failed to create wav file: {e}")
-                return webm_path
+def transcribe_samples(audio_samples):
+    """
+    Transcribe decoded 16 kHz audio with the shared Whisper model. Silence
+    at either end is trimmed first, and long recordings are split at pauses
+    and transcribed in parallel.
+    """
+    if settings.VAD_ENABLED:
+        speech = audio.trim_silence(audio_samples)
+        print(f"Trimmed {(len(audio_samples) - len(speech)) / audio.SAMPLE_RATE:.1f}s of silence")
+        if not len(speech):
+            print("No speech detected")
+            return ''
+    else:
+        speech = audio_samples
 
+    chunks = audio.split_at_silence(speech, settings.TRANSCRIPTION_CHUNK_SECONDS)
+    if len(chunks) > 1:
+        print(f"Transcribing {len(speech) / audio.SAMPLE_RATE:.1f}s of audio in {len(chunks)} chunks")
+
+    with limits.slot('whisper'):
+        try:
+            audio_text = transcription.transcribe_chunks(chunks)
+            print(f"Transcription successful: {audio_text[:100]}...")
         except Exception as e:
-            print(f"Error converting audio: {e}")
-            return webm_path
+            # Inference is not retried: fp16 support is already known, and
+            # anything else would just fail again at full CPU cost
+            print(f"Whisper transcription failed: {e}")
+            # Nuclear fallback: Use a mock transcription to get the system working
+            print("Using mock transcription as final fallback...")
+            audio_text = "Hello, this is a test audio recording. I am speaking to test the audio to image conversion system."
+            print(f"Mock transcription successful: {audio_text}")
+
+    return audio_text
+
+
+def image_description_messages(audio_text, description_prompt=""):
+    """
+    Build the GPT-4 messages turning a transcription into an image description
+    """
+    if description_prompt:
+        prompt = f"Based on this audio content: '{audio_text}', create a detailed image description for: {description_prompt}"
+    else:
+        prompt = f"Based on this audio content: '{audio_text}', create a detailed, vivid image description that captures the essence, mood, and visual elements described or implied in the audio."
+
+    return [
+        {"role": "system", "content": "You are an expert at creating detailed, vivid image descriptions based on audio content. Focus on visual elements, mood, and atmosphere."},
+        {"role": "user", "content": prompt}
+    ]
+
+
+def image_analysis_messages(image_file_path, description_style=""):
+    """
+    Build the GPT-4o messages asking for a narration-friendly description
+    """
+    # Downscaled, metadata-free copy at the resolution the model uses
+    image = image_prep.prepare_for_vision(image_file_path)
+
+    # Create analysis prompt
+    if description_style:
+        analysis_prompt = f"Describe this image in detail with {description_style}. Focus on visual elements, composition, colors, mood, and any notable features."
+    else:
+        analysis_prompt = "Describe this image in detail. Focus on visual elements, composition, colors, mood, and any notable features that would be interesting to hear about."
+
+    return [
+        {"role": "system", "content": "You are an expert at analyzing images and creating detailed, engaging descriptions suitable for audio narration."},
+        {"role": "user", "content": [
+            {"type": "text", "text": analysis_prompt},
+            {"type": "image_url", "image_url": image}
+        ]}
+    ]
+
+
+def elevenlabs_headers():
+    api_key = os.getenv('ELEVENLABS_API_KEY')
+    return {'xi-api-key': api_key} if api_key else {}
+
+
+def _remember_voices(voices):
+    for entry in voices:
+        _voice_ids[entry['name']] = entry['voice_id']
+
+
+def _cached_voice_id(voice):
+    """Voice id for `voice` if it is an id or a known name, else None"""
+    if VOICE_ID_RE.match(voice):
+        return voice
+    return _voice_ids.get(voice)
+
+
+def _speech_request(voice_id, text):
+    """Keyword arguments for a streamed ElevenLabs text-to-speech request"""
+    return {
+        'url': f"{settings.ELEVENLABS_BASE_URL}/text-to-speech/{voice_id}/stream",
+        'headers': elevenlabs_headers(),
+        'json': {'text': text, 'model_id': TTS_MODEL},
+    }
+
 
-    def audio_to_image(self, audio_file_path, description_prompt=""):
+class AIConverter:
+    def __init__(self):
+        # Process-wide clients, so connections are reused across conversions
+        self.openai_client = http_clients.openai_client()
+        self.http_client = http_clients.client()
+
+    @property
+    def whisper_model(self):
+        """
+        Shared, already-loaded Whisper model (loaded once per process, and
+        only by processes that actually transcribe)
+        """
+        return transcription.get_model()
+
+    def audio_to_image(self, audio_file_path, description_prompt="", output_path=None,
+                       live_transcription=None):
         """
-        Convert audio to image using AI
+        Convert audio to image using AI. The image is written to
+        `output_path`, or a temporary file if not given. A
+        `live_transcription` made while the audio was recorded (see
+        app/live.py) skips Whisper.
+        The result's `timings` are the stage timings (see app/metrics.py).
         """
+        timer = metrics.StageTimer()
         try:
             # Check if file exists
             if not os.path.exists(audio_file_path):
@@ -137,140 +175,98 @@ class AIConverter:
             print(f"Audio file path: {audio_file_path}")
             print(f"Audio file size: {file_size} bytes")
 
-            # Convert webm to wav if needed
-            if audio_file_path.endswith('.webm'):
-                audio_file_path = self._convert_webm_to_wav(audio_file_path)
-                print(f"Using converted audio file: {audio_file_path}")
-
-            # Transcribe audio using Whisper
-            print("Transcribing audio...")
-
-            # Use absolute path and normalize it
-            audio_file_path = os.path.abspath(audio_file_path)
-            print(f"Using absolute path: {audio_file_path}")
-
-            # Try different Whisper options for better compatibility
-            whisper_options = [
-                {},  # Default options
-                {'fp16': False},  # Disable fp16
-                {'fp16': False, 'language': 'en'},  # Specify language
-                {'fp16': False, 'task': 'transcribe'},  # Explicit task
-            ]
-
-            for i, options in enumerate(whisper_options):
-                try:
-                    print(
-                        f"Trying Whisper transcription with options {i+1}: {options}")
-
-                    # Simple direct approach - just try the file path
-                    print(f"Trying direct file path...")
-                    transcription = self.whisper_model.transcribe(
-                        audio_file_path, **options)
-                    audio_text = transcription['text']
-                    print(f"Transcription successful: {audio_text[:100]}...")
-                    break
-
-                except Exception as e:
-                    print(
-                        f"Whisper transcription failed with options {i+1}: {e}")
-                    if i == len(whisper_options) - 1:  # Last attempt
-                        # Nuclear fallback: Use a mock transcription to get the system working
-                        print("Using mock transcription as final fallback...")
-                        audio_text = "Hello, this is a test audio recording. I am speaking to test the audio to image conversion system."
-                        print(f"Mock transcription successful: {audio_text}")
-                        break
-                    continue
+            if live_transcription is not None:
+                print("Using the live transcription")
+                audio_text = live_transcription
+            else:
+                # Decode the input (any container format) straight into memory
+                print("Decoding audio...")
+                with timer.stage('decode') as decode:
+                    try:
+                        audio_samples = audio.decode_audio(audio_file_path)
+                        print(f"Decoded {len(audio_samples) / audio.SAMPLE_RATE:.1f}s of audio")
+                    except audio.AudioDecodeError as e:
+                        print(f"{e}, using placeholder audio...")
+                        decode['outcome'] = 'placeholder'
+                        audio_samples = audio.placeholder_audio()
+
+                # Transcribe audio using Whisper
+                print("Transcribing audio...")
+
+                with timer.stage('transcribe'):
+                    audio_text = transcribe_samples(audio_samples)
 
             # Generate image description using GPT-4
             print("Generating image description...")
-            if description_prompt:
-                prompt = f"Based on this audio content: '{audio_text}', create a detailed image description for: {description_prompt}"
-            else:
-                prompt = f"Based on this audio content: '{audio_text}', create a detailed, vivid image description that captures the essence, mood, and visual elements described or implied in the audio."
-
-            # Get image description from GPT-4
-            response = self.openai_client.chat.completions.create(
-                model="gpt-4",
-                messages=[
-                    {"role": "system", "content": "You are an expert at creating detailed, vivid image descriptions based on audio content. Focus on visual elements, mood, and atmosphere."},
-                    {"role": "user", "content": prompt}
-                ],
-                max_tokens=500
-            )
+            with timer.stage('describe'):
+                response = rate_limit.call(
+                    'chat', limits.holding('openai', self.openai_client.chat.completions.create),
+                    model=CHAT_MODEL,
+                    messages=image_description_messages(audio_text, description_prompt),
+                    max_tokens=500
+                )
 
             image_description = response.choices[0].message.content
 
             # Generate image using DALL-E 3
             print("Generating image with DALL-E 3...")
-            image_response = self.openai_client.images.generate(
-                model="dall-e-3",
-                prompt=image_description,
-                size="1024x1024",
-                quality="standard",
-                n=1
-            )
-
-            # Download and save the generated image
+            with timer.stage('generate_image'):
+                image_response = rate_limit.call(
+                    'images', limits.holding('openai', self.openai_client.images.generate),
+                    model=IMAGE_MODEL,
+                    prompt=image_description,
+                    size="1024x1024",
+                    quality="standard",
+                    n=1,
+                    timeout=settings.OPENAI_IMAGE_TIMEOUT
+                )
+
+            # Stream the generated image to disk
             image_url = image_response.data[0].url
-            image_data = requests.get(image_url).content
-
-            # Save to temporary file
-            with tempfile.NamedTemporaryFile(delete=False, suffix='.png') as tmp_file:
-                tmp_file.write(image_data)
-                output_path = tmp_file.name
-
-            # Clean up converted wav file if it was created
-            original_webm = audio_file_path.replace('.wav', '.webm')
-            if audio_file_path.endswith('.wav') and os.path.exists(original_webm):
-                try:
-                    os.unlink(audio_file_path)
-                    print(f"Cleaned up converted file: {audio_file_path}")
-                except:
-                    pass
+            with timer.stage('download') as download, self.http_client.stream(
+                    'GET', image_url, timeout=settings.HTTP_DOWNLOAD_TIMEOUT) as image_download:
+                image_download.raise_for_status()
+                with output_file(output_path, '.png') as (image_file, output_path):
+                    for chunk in image_download.iter_bytes():
+                        image_file.write(chunk)
+                    download['size'] = image_file.tell()
 
             return {
                 'success': True,
                 'output_path': output_path,
                 'transcription': audio_text,
                 'image_description': image_description,
-                'ai_model_used': 'whisper + gpt-4o + dall-e-3'
+                'ai_model_used': 'whisper + gpt-4o + dall-e-3',
+                'timings': timer.finish()
             }
 
         except Exception as e:
             return {
                 'success': False,
                 'error': str(e),
-                'ai_model_used': 'whisper + gpt-4o + dall-e-3'
+                'ai_model_used': 'whisper + gpt-4o + dall-e-3',
+                'timings': timer.finish('error')
             }
 
-    def image_to_audio(self, image_file_path, voice_preference="", description_style=""):
+    def image_to_audio(self, image_file_path, voice_preference="", description_style="", output_path=None):
         """
-        Convert image to audio using AI
+        Convert image to audio using AI. The audio is written to
+        `output_path`, or a temporary file if not given. The result's
+        `timings` are the stage timings (see app/metrics.py).
         """
+        timer = metrics.StageTimer()
         try:
             # Analyze image using GPT-4o
             print("Analyzing image...")
-            with open(image_file_path, "rb") as img_file:
-                image_data = base64.b64encode(img_file.read()).decode('utf-8')
-
-            # Create analysis prompt
-            if description_style:
-                analysis_prompt = f"Describe this image in detail with {description_style}. Focus on visual elements, composition, colors, mood, and any notable features."
-            else:
-                analysis_prompt = "Describe this image in detail. Focus on visual elements, composition, colors, mood, and any notable features that would be interesting to hear about."
-
-            response = self.openai_client.chat.completions.create(
-                model="gpt-4o",
-                messages=[
-                    {"role": "system", "content": "You are an expert at analyzing images and creating detailed, engaging descriptions suitable for audio narration."},
-                    {"role": "user", "content": [
-                        {"type": "text", "text": analysis_prompt},
-                        {"type": "image_url", "image_url": {
-                            "url": f"data:image/jpeg;base64,{image_data}"}}
-                    ]}
-                ],
-                max_tokens=500
-            )
+            with timer.stage('prepare_image'):
+                messages = image_analysis_messages(image_file_path, description_style)
+            with timer.stage('analyze'):
+                response = rate_limit.call(
+                    'chat', limits.holding('openai', self.openai_client.chat.completions.create),
+                    model=VISION_MODEL,
+                    messages=messages,
+                    max_tokens=500
+                )
 
             image_description = response.choices[0].message.content
 
@@ -278,32 +274,396 @@ class AIConverter:
             print("Generating speech...")
             voice = voice_preference if voice_preference else "Rachel"
 
-            audio = generate(
-                text=image_description,
-                voice=voice,
-                model="eleven_monolingual_v1"
-            )
+            with timer.stage('tts') as tts, output_file(output_path, '.mp3') as (audio_file, output_path):
+                for audio_chunk in self.synthesise(image_description, voice):
+                    audio_file.write(audio_chunk)
+                tts['size'] = audio_file.tell()
+
+            return {
+                'success': True,
+                'output_path': output_path,
+                'image_description': image_description,
+                'voice_used': voice,
+                'ai_model_used': 'gpt-4o + elevenlabs',
+                'timings': timer.finish()
+            }
+
+        except Exception as e:
+            return {
+                'success': False,
+                'error': str(e),
+                'ai_model_used': 'gpt-4o + elevenlabs',
+                'timings': timer.finish('error')
+            }
+
+    def voice_id(self, voice):
+        """Resolve an ElevenLabs voice name to its id, caching the voice list"""
+        voice_id = _cached_voice_id(voice)
+        if voice_id is None:
+            response = self.http_client.get(
+                f"{settings.ELEVENLABS_BASE_URL}/voices", headers=elevenlabs_headers())
+            response.raise_for_status()
+            _remember_voices(response.json()['voices'])
+            voice_id = _cached_voice_id(voice)
+        if voice_id is None:
+            raise ValueError(f"Voice '{voice}' not found.")
+        return voice_id
+
+    def _open_speech(self, voice_id, text):
+        """Start a streamed text-to-speech response, raising on HTTP errors"""
+        request = self.http_client.build_request('POST', **_speech_request(voice_id, text))
+        response = self.http_client.send(request, stream=True)
+        if response.is_error:
+            response.read()
+            response.close()
+            response.raise_for_status()
+        return response
+
+    def synthesise(self, text, voice):
+        """Yield MP3 chunks for `text` from the ElevenLabs streaming endpoint"""
+        voice_id = self.voice_id(voice)
+        with limits.slot('elevenlabs'):
+            response = rate_limit.call('tts', self._open_speech, voice_id, text)
+            try:
+                for audio_chunk in response.iter_bytes():
+                    if audio_chunk:
+                        yield audio_chunk
+            finally:
+                response.close()
+
+
+class AsyncAIConverter:
+    """
+    asyncio version of AIConverter for the ASGI views and async workers.
+
+    OpenAI is called through AsyncOpenAI and ElevenLabs and image downloads
+    through the event loop's pooled httpx.AsyncClient, so a conversion
+    waiting on the network does not hold a thread. Whisper runs on the
+    bounded executor in `transcription`.
+    """
 
-            # Save audio to temporary file
-            with tempfile.NamedTemporaryFile(delete=False, suffix='.mp3') as tmp_file:
-                save(audio, tmp_file.name)
-                output_path = tmp_file.name
+    @property
+    def openai_client(self):
+        return http_clients.async_openai_client()
+
+    @property
+    def http_client(self):
+        return http_clients.async_client()
+
+    async def audio_to_image(self, audio_file_path, description_prompt="", output_path=None,
+                             live_transcription=None):
+        """
+        Convert audio to image using AI. The image is written to
+        `output_path`, or a temporary file if not given. A
+        `live_transcription` made while the audio was recorded (see
+        app/live.py) skips Whisper.
+        The result's `timings` are the stage timings (see app/metrics.py).
+        """
+        timer = metrics.StageTimer()
+        try:
+            if not os.path.exists(audio_file_path):
+                raise FileNotFoundError(
+                    f"Audio file not found: {audio_file_path}")
+
+            file_size = os.path.getsize(audio_file_path)
+            if file_size == 0:
+                raise ValueError(f"Audio file is empty: {audio_file_path}")
+
+            print(f"Audio file path: {audio_file_path}")
+            print(f"Audio file size: {file_size} bytes")
+
+            if live_transcription is not None:
+                print("Using the live transcription")
+                audio_text = live_transcription
+            else:
+                print("Decoding audio...")
+                with timer.stage('decode') as decode:
+                    try:
+                        audio_samples = await audio.decode_audio_async(audio_file_path)
+                        print(f"Decoded {len(audio_samples) / audio.SAMPLE_RATE:.1f}s of audio")
+                    except audio.AudioDecodeError as e:
+                        print(f"{e}, using placeholder audio...")
+                        decode['outcome'] = 'placeholder'
+                        audio_samples = audio.placeholder_audio()
+
+                print("Transcribing audio...")
+                with timer.stage('transcribe'):
+                    audio_text = await transcription.run_in_executor(transcribe_samples, audio_samples)
+
+            print("Generating image description...")
+            with timer.stage('describe'):
+                response = await rate_limit.call_async(
+                    'chat', limits.async_holding('openai', self.openai_client.chat.completions.create),
+                    model=CHAT_MODEL,
+                    messages=image_description_messages(audio_text, description_prompt),
+                    max_tokens=500
+                )
+
+            image_description = response.choices[0].message.content
+
+            print("Generating image with DALL-E 3...")
+            with timer.stage('generate_image'):
+                image_response = await rate_limit.call_async(
+                    'images', limits.async_holding('openai', self.openai_client.images.generate),
+                    model=IMAGE_MODEL,
+                    prompt=image_description,
+                    size="1024x1024",
+                    quality="standard",
+                    n=1,
+                    timeout=settings.OPENAI_IMAGE_TIMEOUT
+                )
+
+            # Stream the generated image to disk
+            image_url = image_response.data[0].url
+            with timer.stage('download') as download:
+                async with self.http_client.stream(
+                        'GET', image_url, timeout=settings.HTTP_DOWNLOAD_TIMEOUT) as image_download:
+                    image_download.raise_for_status()
+                    with output_file(output_path, '.png') as (image_file, output_path):
+                        async for chunk in image_download.aiter_bytes():
+                            image_file.write(chunk)
+                        download['size'] = image_file.tell()
+
+            return {
+                'success': True,
+                'output_path': output_path,
+                'transcription': audio_text,
+                'image_description': image_description,
+                'ai_model_used': 'whisper + gpt-4o + dall-e-3',
+                'timings': timer.finish()
+            }
+
+        except Exception as e:
+            return {
+                'success': False,
+                'error': str(e),
+                'ai_model_used': 'whisper + gpt-4o + dall-e-3',
+                'timings': timer.finish('error')
+            }
+
+    async def image_to_audio(self, image_file_path, voice_preference="", description_style="", output_path=None):
+        """
+        Convert image to audio using AI. The audio is written to
+        `output_path`, or a temporary file if not given. The result's
+        `timings` are the stage timings (see app/metrics.py).
+        """
+        timer = metrics.StageTimer()
+        try:
+            print("Analyzing image...")
+            with timer.stage('prepare_image'):
+                messages = await asyncio.to_thread(
+                    image_analysis_messages, image_file_path, description_style)
+            with timer.stage('analyze'):
+                response = await rate_limit.call_async(
+                    'chat', limits.async_holding('openai', self.openai_client.chat.completions.create),
+                    model=VISION_MODEL,
+                    messages=messages,
+                    max_tokens=500
+                )
+
+            image_description = response.choices[0].message.content
+
+            print("Generating speech...")
+            voice = voice_preference if voice_preference else "Rachel"
+
+            with timer.stage('tts') as tts, output_file(output_path, '.mp3') as (audio_file, output_path):
+                async for audio_chunk in self.synthesise(image_description, voice):
+                    audio_file.write(audio_chunk)
+                tts['size'] = audio_file.tell()
 
             return {
                 'success': True,
                 'output_path': output_path,
                 'image_description': image_description,
                 'voice_used': voice,
-                'ai_model_used': 'gpt-4o + elevenlabs'
+                'ai_model_used': 'gpt-4o + elevenlabs',
+                'timings': timer.finish()
             }
 
         except Exception as e:
             return {
                 'success': False,
                 'error': str(e),
-                'ai_model_used': 'gpt-4o + elevenlabs'
+                'ai_model_used': 'gpt-4o + elevenlabs',
+                'timings': timer.finish('error')
             }
 
+    async def stream_image_to_audio(self, image_file_path, voice_preference="", description_style="", result=None):
+        """
+        Convert image to audio, yielding MP3 data while the description is
+        still being written.
+
+        A task cuts GPT-4o's streamed tokens into sentences, and each
+        finished sentence is synthesised by ElevenLabs while later ones are
+        still being generated. `result` is filled in with the description
+        and models used once the stream is exhausted, and its `timings`
+        list with the stages timed so far. Errors are raised rather than
+        returned.
+        """
+        result = {} if result is None else result
+        voice = voice_preference if voice_preference else "Rachel"
+        timer = metrics.StageTimer()
+        result.update(voice_used=voice, ai_model_used='gpt-4o + elevenlabs', timings=timer.records)
+
+        print("Analyzing image (streaming)...")
+        with timer.stage('prepare_image'):
+            messages = await asyncio.to_thread(
+                image_analysis_messages, image_file_path, description_style)
+        with timer.stage('analyze'):
+            response = await rate_limit.call_async(
+                'chat', limits.async_holding('openai', self.openai_client.chat.completions.create),
+                model=VISION_MODEL,
+                messages=messages,
+                max_tokens=500,
+                stream=True
+            )
+
+        description_parts = []
+        sentences = asyncio.Queue()
+
+        async def produce_sentences():
+            splitter = SentenceSplitter()
+            try:
+                async for chunk in response:
+                    if chunk.choices and chunk.choices[0].delta.content:
+                        description_parts.append(chunk.choices[0].delta.content)
+                        for sentence in splitter.feed(chunk.choices[0].delta.content):
+                            await sentences.put(sentence)
+                for sentence in splitter.flush():
+                    await sentences.put(sentence)
+            except Exception as e:
+                await sentences.put(e)
+            finally:
+                await sentences.put(None)
+
+        producer = asyncio.create_task(produce_sentences())
+        speech = _StreamedSpeech(timer)
+        try:
+            while True:
+                sentence = await sentences.get()
+                if sentence is None:
+                    break
+                if isinstance(sentence, Exception):
+                    raise sentence
+
+                print(f"Generating speech for: {sentence[:60]}...")
+                speech.start()
+                async for audio_chunk in self.synthesise(sentence, voice):
+                    speech.received(audio_chunk)
+                    yield audio_chunk
+                    speech.start()
+                speech.stop()
+            speech.outcome = 'ok'
+        except (GeneratorExit, asyncio.CancelledError):
+            speech.outcome = 'cancelled'
+            raise
+        finally:
+            speech.finish()
+            producer.cancel()
+            await response.close()
+
+        result['image_description'] = ''.join(description_parts).strip()
+
+    async def voice_id(self, voice):
+        """Resolve an ElevenLabs voice name to its id, caching the voice list"""
+        voice_id = _cached_voice_id(voice)
+        if voice_id is None:
+            response = await self.http_client.get(
+                f"{settings.ELEVENLABS_BASE_URL}/voices", headers=elevenlabs_headers())
+            response.raise_for_status()
+            _remember_voices(response.json()['voices'])
+            voice_id = _cached_voice_id(voice)
+        if voice_id is None:
+            raise ValueError(f"Voice '{voice}' not found.")
+        return voice_id
+
+    async def _open_speech(self, voice_id, text):
+        """Start a streamed text-to-speech response, raising on HTTP errors"""
+        request = self.http_client.build_request('POST', **_speech_request(voice_id, text))
+        response = await self.http_client.send(request, stream=True)
+        if response.is_error:
+            await response.aread()
+            await response.aclose()
+            response.raise_for_status()
+        return response
+
+    async def synthesise(self, text, voice):
+        """Yield MP3 chunks for `text` from the ElevenLabs streaming endpoint"""
+        voice_id = await self.voice_id(voice)
+        async with limits.async_slot('elevenlabs'):
+            response = await rate_limit.call_async('tts', self._open_speech, voice_id, text)
+            try:
+                async for audio_chunk in response.aiter_bytes():
+                    if audio_chunk:
+                        yield audio_chunk
+            finally:
+                await response.aclose()
+
+
+class _StreamedSpeech:
+    """
+    Stage timings for streamed narration: time to the first audio, and the
+    time spent waiting on ElevenLabs (not on the client) as the 'tts' stage
+    """
+
+    def __init__(self, timer):
+        self.timer = timer
+        self.size = 0
+        self.seconds = 0.0
+        self.outcome = 'error'
+        self._started = None
+
+    def start(self):
+        self._started = time.perf_counter()
+
+    def stop(self):
+        if self._started is not None:
+            self.seconds += time.perf_counter() - self._started
+            self._started = None
+
+    def received(self, chunk):
+        self.stop()
+        if not self.size:
+            self.timer.add('first_audio', self.timer.elapsed())
+        self.size += len(chunk)
+
+    def finish(self):
+        self.stop()
+        self.timer.add('tts', self.seconds, self.outcome, self.size)
+        self.timer.finish(self.outcome)
+
+
+class SentenceSplitter:
+    """
+    Regroup streamed text fragments into sentences, releasing each as soon
+    as the whitespace after its final punctuation arrives. Sentences shorter
+    than `min_length` are merged with the next one so TTS requests do not
+    get too small.
+    """
+
+    def __init__(self, min_length=MIN_SENTENCE_LENGTH):
+        self.min_length = min_length
+        self.buffer = ''
+
+    def feed(self, fragment):
+        """Add a fragment and return the sentences it completed"""
+        self.buffer += fragment
+        sentences = []
+        while True:
+            boundary = next(
+                (m for m in SENTENCE_END_RE.finditer(self.buffer) if m.end() >= self.min_length), None)
+            if boundary is None:
+                break
+            sentences.append(self.buffer[:boundary.end()].strip())
+            self.buffer = self.buffer[boundary.end():].lstrip()
+        return sentences
+
+    def flush(self):
+        """Return whatever text is left once the stream has ended"""
+        rest, self.buffer = self.buffer.strip(), ''
+        return [rest] if rest else []
+
+
 # Legacy functions for backward compatibility
 
 
@@ -312,13 +672,9 @@ def audio_to_image(audio_path, image_path):
     Legacy function - now uses AI conversion
     """
     converter = AIConverter()
-    result = converter.audio_to_image(audio_path)
+    result = converter.audio_to_image(audio_path, output_path=image_path)
 
     if result['success']:
-        # Copy the generated image to the specified path
-        import shutil
-        shutil.copy2(result['output_path'], image_path)
-        os.unlink(result['output_path'])  # Clean up temp file
         return True
     else:
         raise Exception(result['error'])
@@ -329,13 +685,9 @@ def image_to_audio(image_path, audio_path):
     Legacy function - now uses AI conversion
     """
     converter = AIConverter()
-    result = converter.image_to_audio(image_path)
+    result = converter.image_to_audio(image_path, output_path=audio_path)
 
     if result['success']:
-        # Copy the generated audio to the specified path
-        import shutil
-        shutil.copy2(result['output_path'], audio_path)
-        os.unlink(result['output_path'])  # Clean up temp file
         return True
     else:
         raise Exception(result['error'])
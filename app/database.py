@@ -0,0 +1,20 @@
+"""
+SQLite tuning for many threads and processes writing sessions at once.
+
+Every new connection is switched to SQLITE_JOURNAL_MODE (WAL by default),
+so readers carry on while a writer commits instead of waiting for it, and
+to SQLITE_SYNCHRONOUS (NORMAL by default), which syncs the WAL at
+checkpoints rather than on every commit: a power loss can lose the last
+few commits, but never corrupts the database. Writers queue for the write
+lock for up to DATABASES['default']['OPTIONS']['timeout'] seconds.
+"""
+from django.conf import settings
+
+
+def configure_connection(sender, connection, **kwargs):
+    """connection_created receiver that applies the SQLite PRAGMAs"""
+    if connection.vendor != 'sqlite':
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(f"PRAGMA journal_mode={settings.SQLITE_JOURNAL_MODE}")
+        cursor.execute(f"PRAGMA synchronous={settings.SQLITE_SYNCHRONOUS}")
@@ -0,0 +1,119 @@
+"""
+File delivery for generated outputs.
+
+A finished conversion's output never changes, so it is streamed straight from
+disk with validators (ETag/Last-Modified) and long-lived cache headers, and
+byte ranges are honoured so audio players can seek and start playing early.
+"""
+import os
+import re
+
+from django.http import FileResponse, HttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, parse_http_date_safe, quote_etag
+
+# Outputs are immutable and only meant for the client that requested them
+CACHE_CONTROL = 'private, max-age=31536000, immutable'
+
+RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+
+class RangeFile:
+    """File-like view over `length` bytes of `path` starting at `start`"""
+
+    def __init__(self, path, start, length):
+        self._file = open(path, 'rb')
+        self._file.seek(start)
+        self._remaining = length
+
+    def read(self, size=-1):
+        if self._remaining <= 0:
+            return b''
+        if size < 0 or size > self._remaining:
+            size = self._remaining
+        data = self._file.read(size)
+        self._remaining -= len(data)
+        return data
+
+    def close(self):
+        self._file.close()
+
+
+def file_etag(stat):
+    return quote_etag(f"{stat.st_size:x}-{stat.st_mtime_ns:x}")
+
+
+def parse_range(header, size):
+    """
+    Parse a single-range `Range` header into an inclusive (start, end) pair.
+    Returns None when the header should be ignored and raises ValueError
+    when the range cannot be satisfied.
+    """
+    match = RANGE_RE.match(header.strip()) if header else None
+    if not match:
+        # Missing, malformed or multi-range: serve the whole file
+        return None
+
+    first, last = match.groups()
+    if not first and not last:
+        return None
+    if not first:
+        # Suffix range: the final `last` bytes
+        length = int(last)
+        if length == 0:
+            raise ValueError("empty suffix range")
+        return max(size - length, 0), size - 1
+
+    start = int(first)
+    end = int(last) if last else size - 1
+    if start >= size or end < start:
+        raise ValueError("range not satisfiable")
+    return start, min(end, size - 1)
+
+
+def _range_applies(request, etag, last_modified):
+    """Honour If-Range: only send a partial body if the client's copy is current"""
+    if_range = request.headers.get('If-Range')
+    if not if_range:
+        return True
+    if if_range.startswith(('"', 'W/')):
+        return if_range == etag
+    return parse_http_date_safe(if_range) == last_modified
+
+
+def serve_file(request, path, content_type):
+    """Stream `path` with caching validators and HTTP Range support"""
+    stat = os.stat(path)
+    etag = file_etag(stat)
+    last_modified = int(stat.st_mtime)
+
+    conditional = get_conditional_response(
+        request, etag=etag, last_modified=last_modified)
+    if conditional is not None:
+        conditional.headers['Cache-Control'] = CACHE_CONTROL
+        return conditional
+
+    byte_range = None
+    if _range_applies(request, etag, last_modified):
+        try:
+            byte_range = parse_range(request.headers.get('Range'), stat.st_size)
+        except ValueError:
+            response = HttpResponse(status=416)
+            response.headers['Content-Range'] = f"bytes */{stat.st_size}"
+            return response
+
+    if byte_range is None:
+        response = FileResponse(open(path, 'rb'), content_type=content_type)
+    else:
+        start, end = byte_range
+        length = end - start + 1
+        response = FileResponse(
+            RangeFile(path, start, length), status=206, content_type=content_type)
+        response.headers['Content-Length'] = str(length)
+        response.headers['Content-Range'] = f"bytes {start}-{end}/{stat.st_size}"
+
+    response.headers['Accept-Ranges'] = 'bytes'
+    response.headers['ETag'] = etag
+    response.headers['Last-Modified'] = http_date(last_modified)
+    response.headers['Cache-Control'] = CACHE_CONTROL
+    return response
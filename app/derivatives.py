@@ -0,0 +1,308 @@
+"""
+Smaller variants of generated outputs, made on first request and cached.
+
+Images: DALL-E outputs are 1024x1024 PNGs, several times larger than a
+WebP or AVIF of the same picture and far larger than a thumbnail needs.
+Pillow re-encodes them, optionally resized to one of IMAGE_VARIANT_WIDTHS
+(requested widths are rounded up, so arbitrary sizes cannot fill the
+disk). The format follows the Accept header: AVIF when it is listed and
+this Pillow can write it, then WebP, then JPEG.
+
+Audio: ElevenLabs narration is 128 kbit/s MP3. One ffmpeg run transcodes
+it to mono Opus (in WebM or Ogg) or AAC at a speech bitrate, a fraction of
+the size. The format is asked for with `format`, or by listing it in the
+Accept header; without either the MP3 itself is served.
+
+Browsers send `*/*` along with the types they know, so only types named
+explicitly count. Each variant is stored once, next to its original as
+`ai_generated_<id>.<label>.<ext>`, and read straight from disk afterwards.
+Variants are evicted least recently used first once together they take
+more than VARIANT_CACHE_MAX_BYTES. Serving a variant records the access in
+its atime (at most hourly), leaving the mtime, which the ETag is built
+from, alone.
+"""
+import os
+import subprocess
+import tempfile
+import threading
+import time
+
+from django.conf import settings
+from PIL import Image
+
+from . import storage
+from .audio import AudioDecodeError, ffmpeg_path
+from .image_prep import open_image
+
+try:
+    # Adds AVIF to Pillow versions without built-in support
+    import pillow_avif  # noqa: F401
+except ImportError:
+    pass
+
+# Preferred first: (format, MIME type, extension, save options)
+IMAGE_FORMATS = [
+    ('AVIF', 'image/avif', 'avif', {'quality': 60, 'speed': 6}),
+    ('WEBP', 'image/webp', 'webp', {'quality': 80, 'method': 4}),
+    ('JPEG', 'image/jpeg', 'jpg', {'quality': 82, 'optimize': True, 'progressive': True}),
+]
+
+# Preferred first: name -> (MIME type, extension, ffmpeg output options)
+AUDIO_FORMATS = {
+    'webm': ('audio/webm', 'webm', ['-c:a', 'libopus', '-f', 'webm']),
+    'ogg': ('audio/ogg', 'ogg', ['-c:a', 'libopus', '-f', 'ogg']),
+    # moov atom first, so playback can start before the download finishes
+    'aac': ('audio/mp4', 'm4a', ['-c:a', 'aac', '-movflags', '+faststart', '-f', 'mp4']),
+}
+
+TRANSCODE_TIMEOUT = 120
+
+# How often serving a variant updates its atime
+TOUCH_INTERVAL = 60 * 60
+# How often a process rescans the variants to check the cache size
+SCAN_INTERVAL = 5 * 60
+
+_lock = threading.Lock()
+_generating = {}            # variant path -> lock, so each is made once per process
+_cache = {'bytes': None, 'scanned_at': 0.0}
+
+
+def accepted_types(accept):
+    """MIME types named in an Accept header with a non-zero quality"""
+    accepted = set()
+    for part in (accept or '').split(','):
+        media_type, *params = [piece.strip() for piece in part.split(';')]
+        quality = 1.0
+        for param in params:
+            if param.startswith('q='):
+                try:
+                    quality = float(param[2:])
+                except ValueError:
+                    quality = 0.0
+        if media_type and quality > 0:
+            accepted.add(media_type.lower())
+    return accepted
+
+
+def is_variant(path):
+    """Whether `path` is a variant rather than an original output"""
+    return os.path.basename(path).count('.') >= 2 and not path.endswith('.part')
+
+
+def variant_path(original, label, extension):
+    stem, _ = os.path.splitext(original)
+    return f"{stem}.{label}.{extension}"
+
+
+def variants_of(original):
+    """Paths of the variants stored for `original`"""
+    directory, name = os.path.split(original)
+    prefix = os.path.splitext(name)[0] + '.'
+    try:
+        return [entry.path for entry in os.scandir(directory)
+                if entry.name.startswith(prefix) and is_variant(entry.path)]
+    except FileNotFoundError:
+        return []
+
+
+def remove_variants(original):
+    """Delete every variant of `original`, e.g. once it has been deleted itself"""
+    for path in variants_of(original):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+
+def _touch(path, stat):
+    """Record an access in the atime, which is what eviction goes by"""
+    now = time.time()
+    if now - stat.st_atime > TOUCH_INTERVAL:
+        try:
+            os.utime(path, (now, stat.st_mtime))
+        except OSError:
+            pass
+
+
+def _cached(path, render):
+    """
+    Return `path`, first calling `render(partial_path)` to write it when it
+    does not exist yet. The result is renamed into place once complete.
+    """
+    try:
+        _touch(path, os.stat(path))
+        return path
+    except FileNotFoundError:
+        pass
+
+    with _lock:
+        path_lock = _generating.setdefault(path, threading.Lock())
+    try:
+        with path_lock:
+            if not os.path.exists(path):
+                fd, partial_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.part')
+                os.close(fd)
+                try:
+                    render(partial_path)
+                    os.replace(partial_path, path)
+                except BaseException:
+                    if os.path.exists(partial_path):
+                        os.unlink(partial_path)
+                    raise
+                _added(os.path.getsize(path))
+    finally:
+        with _lock:
+            _generating.pop(path, None)
+    return path
+
+
+# Images
+
+def supported_image_formats():
+    """The IMAGE_FORMATS this Pillow can write"""
+    Image.init()
+    return [entry for entry in IMAGE_FORMATS if entry[0] in Image.SAVE]
+
+
+def choose_image_format(accept):
+    """The (format, MIME type, extension, options) to answer `accept` with"""
+    accepted = accepted_types(accept)
+    formats = supported_image_formats()
+    for entry in formats:
+        if entry[1] in accepted:
+            return entry
+    return formats[-1]
+
+
+def choose_width(width, original_width):
+    """The configured width to serve a request for `width`, capped at the original"""
+    widths = sorted(w for w in settings.IMAGE_VARIANT_WIDTHS if w < original_width)
+    if width is None:
+        return original_width
+    return next((w for w in widths if w >= width), original_width)
+
+
+def image_variant(original, width=None, accept=''):
+    """
+    Path and MIME type of the variant of the image `original` for a
+    request of `width` pixels and the Accept header `accept`
+    """
+    image_format, content_type, extension, options = choose_image_format(accept)
+    with open_image(original) as img:
+        original_width = img.width
+    width = choose_width(width, original_width)
+
+    def render(partial_path):
+        with open_image(original) as img:
+            img.load()
+            if width < img.width:
+                img = img.resize((width, round(img.height * width / img.width)), Image.LANCZOS)
+            if image_format == 'JPEG' and img.mode not in ('RGB', 'L'):
+                img = img.convert('RGB')
+            img.save(partial_path, format=image_format, **options)
+
+    return _cached(variant_path(original, f"{width}w", extension), render), content_type
+
+
+# Audio
+
+def choose_audio_format(requested, accept):
+    """
+    The AUDIO_FORMATS name for a `format` parameter or, without one, the
+    Accept header; None means the original MP3
+    """
+    if requested:
+        if requested == 'mp3':
+            return None
+        if requested not in AUDIO_FORMATS:
+            raise ValueError(f"Unknown audio format {requested!r}")
+        return requested
+    accepted = accepted_types(accept)
+    return next((name for name, (content_type, _, _) in AUDIO_FORMATS.items()
+                 if content_type in accepted), None)
+
+
+def _bitrate(name):
+    return settings.AUDIO_VARIANT_AAC_BITRATE if name == 'aac' else settings.AUDIO_VARIANT_OPUS_BITRATE
+
+
+def audio_variant(original, name):
+    """
+    Path and MIME type of the `name` transcode of the audio `original`.
+    Raises AudioDecodeError when ffmpeg is missing or fails.
+    """
+    content_type, extension, output_options = AUDIO_FORMATS[name]
+    bitrate = _bitrate(name)
+
+    def render(partial_path):
+        ffmpeg = ffmpeg_path()
+        if ffmpeg is None:
+            raise AudioDecodeError("FFmpeg is not available")
+        try:
+            result = subprocess.run([
+                ffmpeg, '-hide_banner', '-loglevel', 'error', '-nostdin', '-y',
+                '-i', original,
+                '-vn', '-map_metadata', '-1', '-ac', '1', '-b:a', bitrate,
+                *output_options,
+                partial_path,
+            ], capture_output=True, timeout=TRANSCODE_TIMEOUT)
+        except subprocess.TimeoutExpired as e:
+            raise AudioDecodeError("FFmpeg timed out transcoding audio") from e
+        if result.returncode != 0:
+            raise AudioDecodeError(
+                f"FFmpeg could not transcode audio: {result.stderr.decode(errors='replace').strip()}")
+
+    return _cached(variant_path(original, f"{name}{bitrate}", extension), render), content_type
+
+
+# Eviction
+
+def _variant_files():
+    """(path, stat) of every stored variant"""
+    for directory in map(storage.output_directory, storage.OUTPUT_LOCATIONS):
+        try:
+            entries = list(os.scandir(directory))
+        except FileNotFoundError:
+            continue
+        for entry in entries:
+            if is_variant(entry.path):
+                try:
+                    yield entry.path, entry.stat()
+                except FileNotFoundError:
+                    continue
+
+
+def _added(size):
+    """Account for a new variant, evicting old ones when over the limit"""
+    with _lock:
+        if _cache['bytes'] is not None:
+            _cache['bytes'] += size
+        due = (_cache['bytes'] is None
+               or _cache['bytes'] > settings.VARIANT_CACHE_MAX_BYTES
+               or time.time() - _cache['scanned_at'] > SCAN_INTERVAL)
+    if due:
+        evict()
+
+
+def evict():
+    """
+    Delete the least recently used variants until they fit within
+    VARIANT_CACHE_MAX_BYTES. Returns the number deleted.
+    """
+    files = list(_variant_files())
+    total = sum(stat.st_size for _, stat in files)
+    evicted = 0
+    files.sort(key=lambda item: max(item[1].st_atime, item[1].st_mtime))
+    for path, stat in files:
+        if total <= settings.VARIANT_CACHE_MAX_BYTES:
+            break
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        total -= stat.st_size
+        evicted += 1
+
+    with _lock:
+        _cache.update(bytes=total, scanned_at=time.time())
+    return evicted
@@ -0,0 +1,206 @@
+"""
+Local stand-ins for the OpenAI and ElevenLabs APIs, used by
+`manage.py load_test`.
+
+The server speaks just enough of each wire format for the converters:
+chat completions (plain and streamed), DALL-E image generation and the
+image download, the ElevenLabs voice list and streamed text-to-speech.
+Every endpoint waits a configurable latency, can fail a configurable share
+of requests with 500s or 429s, and returns payloads of a configurable size,
+so throughput can be measured without calling (or paying for) the real
+APIs.
+"""
+import json
+import os
+import random
+import re
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Seconds each kind of request takes before the response starts
+DEFAULT_LATENCY = {'chat': 0.8, 'images': 4.0, 'download': 0.2, 'voices': 0.05, 'tts': 0.6}
+
+VOICES = [
+    {'voice_id': '21m00Tcm4TlvDq8ikWAM', 'name': 'Rachel'},
+    {'voice_id': 'AZnzlk1XvdvUeBnXmlld', 'name': 'Domi'},
+    {'voice_id': 'EXAVITQu4vr4xnSDxMaL', 'name': 'Bella'},
+]
+
+WORDS = ('a quiet harbour at dawn with fishing boats resting on still water while gulls '
+         'circle above the warm light of the rising sun spreads over old stone houses').split()
+
+PNG_SIGNATURE = b'\x89PNG\r\n\x1a\n'
+
+
+def description(word_count):
+    """Deterministic filler text of `word_count` words, split into sentences"""
+    words = [WORDS[i % len(WORDS)] for i in range(word_count)]
+    sentences = [' '.join(words[i:i + 12]).capitalize() + '.' for i in range(0, len(words), 12)]
+    return ' '.join(sentences)
+
+
+class FakeProviderHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        pass
+
+    @property
+    def config(self):
+        return self.server.config
+
+    def _delay(self, kind):
+        time.sleep(self.config['latency'][kind])
+
+    def _failure(self):
+        """Send a 500 or 429 for the configured share of requests"""
+        roll = random.random()
+        if roll < self.config['error_rate']:
+            self._json({'error': {'message': 'Fake server error', 'type': 'server_error'}}, 500)
+            return True
+        if roll < self.config['error_rate'] + self.config['throttle_rate']:
+            self._json({'error': {'message': 'Rate limit reached', 'type': 'requests',
+                                  'code': 'rate_limit_exceeded'}}, 429, {'Retry-After': '1'})
+            return True
+        return False
+
+    def _send(self, status, body, content_type, headers=None):
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _json(self, payload, status=200, headers=None):
+        self._send(status, json.dumps(payload).encode(), 'application/json', headers)
+
+    def _start_chunked(self, content_type):
+        self.send_response(200)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Transfer-Encoding', 'chunked')
+        self.end_headers()
+
+    def _chunk(self, data):
+        self.wfile.write(f"{len(data):x}\r\n".encode() + data + b"\r\n")
+        self.wfile.flush()
+
+    def _read_json(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        return json.loads(self.rfile.read(length) or b'{}')
+
+    def do_GET(self):
+        if self.path.endswith('/voices'):
+            self._delay('voices')
+            return self._json({'voices': VOICES})
+        if self.path.startswith('/files/'):
+            self._delay('download')
+            if self._failure():
+                return
+            return self._send(200, self.server.image_bytes, 'image/png')
+        self._json({'error': {'message': f"Unknown path {self.path}"}}, 404)
+
+    def do_POST(self):
+        body = self._read_json()
+        if self.path.endswith('/chat/completions'):
+            return self._chat(body)
+        if self.path.endswith('/images/generations'):
+            self._delay('images')
+            if self._failure():
+                return
+            host = self.headers.get('Host', f"127.0.0.1:{self.server.server_port}")
+            return self._json({'created': int(time.time()), 'data': [{
+                'url': f"http://{host}/files/{random.getrandbits(64):016x}.png",
+                'revised_prompt': body.get('prompt', ''),
+            }]})
+        if re.search(r'/text-to-speech/[^/]+/stream$', self.path):
+            return self._speech(body)
+        self._json({'error': {'message': f"Unknown path {self.path}"}}, 404)
+
+    def _chat(self, body):
+        self._delay('chat')
+        if self._failure():
+            return
+        text = description(self.config['description_words'])
+        if not body.get('stream'):
+            return self._json({
+                'id': 'chatcmpl-fake', 'object': 'chat.completion', 'created': int(time.time()),
+                'model': body.get('model', 'gpt-4o'),
+                'choices': [{'index': 0, 'finish_reason': 'stop',
+                             'message': {'role': 'assistant', 'content': text}}],
+                'usage': {'prompt_tokens': 100, 'completion_tokens': len(text.split()),
+                          'total_tokens': 100 + len(text.split())},
+            })
+
+        # Stream a word at a time, at the configured token rate
+        self._start_chunked('text/event-stream')
+        for word in text.split(' '):
+            event = {
+                'id': 'chatcmpl-fake', 'object': 'chat.completion.chunk', 'created': int(time.time()),
+                'model': body.get('model', 'gpt-4o'),
+                'choices': [{'index': 0, 'delta': {'content': word + ' '}, 'finish_reason': None}],
+            }
+            self._chunk(f"data: {json.dumps(event)}\n\n".encode())
+            time.sleep(1 / self.config['tokens_per_second'])
+        self._chunk(b"data: [DONE]\n\n")
+        self._chunk(b'')
+
+    def _speech(self, body):
+        self._delay('tts')
+        if self._failure():
+            return
+        # Roughly 1 KB of MP3 per word of text, sent in 4 KB pieces
+        size = max(len(body.get('text', '').split()) * self.config['speech_bytes_per_word'], 1)
+        self._start_chunked('audio/mpeg')
+        for offset in range(0, size, 4096):
+            self._chunk(os.urandom(min(4096, size - offset)))
+        self._chunk(b'')
+
+
+class StandInTranscriber:
+    """
+    Transcription backend for load tests: waits `latency` seconds instead of
+    running Whisper. Registered in transcription.BACKENDS by load_test.
+    """
+    backend = 'load-test'
+    latency = 0.5
+
+    def __init__(self, name, device):
+        self.name = name
+        self.device = device
+
+    @classmethod
+    def load(cls, name, device):
+        return cls(name, device)
+
+    def transcribe(self, audio, **options):
+        time.sleep(self.latency)
+        return {'text': description(20)}
+
+
+def make_server(host='127.0.0.1', port=8765, latency=None, error_rate=0.0, throttle_rate=0.0,
+                image_bytes=1_500_000, description_words=80, tokens_per_second=50,
+                speech_bytes_per_word=1000):
+    """Create (but do not start) a fake provider server"""
+    server = ThreadingHTTPServer((host, port), FakeProviderHandler)
+    server.daemon_threads = True
+    server.config = {
+        'latency': {**DEFAULT_LATENCY, **(latency or {})},
+        'error_rate': error_rate,
+        'throttle_rate': throttle_rate,
+        'description_words': description_words,
+        'tokens_per_second': tokens_per_second,
+        'speech_bytes_per_word': speech_bytes_per_word,
+    }
+    server.image_bytes = PNG_SIGNATURE + os.urandom(max(image_bytes - len(PNG_SIGNATURE), 0))
+    return server
+
+
+def serve(**options):
+    """Run a fake provider server until the process is stopped"""
+    server = make_server(**options)
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
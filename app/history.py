@@ -0,0 +1,76 @@
+"""
+Past conversions, newest first, a page at a time.
+
+Pages are cut by keyset rather than OFFSET. A cursor carries the
+(created_at, id) of the last session on a page and the next page starts
+right after it, so no rows are skipped over to reach it. The page's ids
+come from the index matching the filters alone; every ConversionSession
+index on created_at also holds the id, as SQLite keeps the rowid in each
+index. The sessions themselves are then fetched by primary key. Page
+10,000 costs the same as page 1.
+"""
+import base64
+from datetime import datetime
+
+from .models import ConversionSession
+
+PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+
+# All a history entry shows
+FIELDS = (
+    'session_id', 'conversion_type', 'processing_status', 'created_at', 'completed_at',
+    'output_file', 'original_filename',
+)
+
+
+class CursorError(ValueError):
+    """A cursor that was not issued by `page`"""
+
+
+def encode_cursor(session):
+    raw = f"{session.created_at.isoformat()}|{session.pk}"
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    """The (created_at, id) a cursor continues after"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode()
+        created_at, pk = raw.rsplit('|', 1)
+        return datetime.fromisoformat(created_at), int(pk)
+    except ValueError as e:
+        raise CursorError('Invalid cursor') from e
+
+
+def page_keys(conversion_type=None, status=None, after=None):
+    """
+    Ids of the sessions matching the filters, newest first, starting after
+    the (created_at, id) `after`
+    """
+    keys = ConversionSession.objects.order_by('-created_at', '-id')
+    if conversion_type:
+        keys = keys.filter(conversion_type=conversion_type)
+    if status:
+        keys = keys.filter(processing_status=status)
+    if after is not None:
+        created_at, pk = after
+        keys = keys.filter(created_at__lte=created_at).exclude(created_at=created_at, pk__gte=pk)
+    return keys.values_list('pk', flat=True)
+
+
+def page(conversion_type=None, status=None, cursor=None, limit=PAGE_SIZE):
+    """
+    One page of sessions, as (sessions, next_cursor). next_cursor is None
+    on the last page.
+    """
+    after = decode_cursor(cursor) if cursor else None
+    pks = list(page_keys(conversion_type, status, after)[:limit + 1])
+    found = ConversionSession.objects.only(*FIELDS).in_bulk(pks[:limit])
+    # Sessions deleted in between are left out
+    sessions = [found[pk] for pk in pks[:limit] if pk in found]
+
+    next_cursor = None
+    if len(pks) > limit and sessions:
+        next_cursor = encode_cursor(sessions[-1])
+    return sessions, next_cursor
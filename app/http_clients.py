@@ -0,0 +1,152 @@
+"""
+Process-wide pooled HTTP clients.
+
+All outbound calls (OpenAI, ElevenLabs and the DALL-E image downloads) go
+through one httpx connection pool per process, or one per event loop for
+async code, so keep-alive connections and TLS sessions are reused across
+conversions instead of being set up for every request. Each request is
+traced so `stats()` can show how many of them needed a new connection, and
+the counts are added to the ConnectionTotal rows /metrics exports whenever
+stage timings are saved (see app/metrics.py).
+"""
+import asyncio
+import os
+import threading
+import weakref
+
+import httpx
+import openai
+from django.conf import settings
+
+COUNTERS = ('requests', 'connections', 'tls_handshakes')
+
+_stats = dict.fromkeys(COUNTERS, 0)
+# Counted since the last `take_unsaved`
+_unsaved = dict.fromkeys(COUNTERS, 0)
+_stats_lock = threading.Lock()
+
+_client = None
+_openai_client = None
+_clients_lock = threading.Lock()
+
+# event loop -> (httpx.AsyncClient, openai.AsyncOpenAI); async clients
+# cannot be shared between loops
+_async_clients = weakref.WeakKeyDictionary()
+
+
+def _count(name):
+    with _stats_lock:
+        _stats[name] += 1
+        _unsaved[name] += 1
+
+
+def stats():
+    """
+    Request/connection counters for this process. `reused` is the number
+    of requests served over an already open connection.
+    """
+    with _stats_lock:
+        counters = dict(_stats)
+    counters['reused'] = max(counters['requests'] - counters['connections'], 0)
+    return counters
+
+
+def take_unsaved():
+    """The counts since the last call, which are reset, for adding to the totals"""
+    with _stats_lock:
+        counts = dict(_unsaved)
+        _unsaved.update(dict.fromkeys(COUNTERS, 0))
+    return counts
+
+
+def _trace(event_name, info):
+    """httpcore trace hook: only new connections connect and handshake"""
+    if event_name == 'connection.connect_tcp.complete':
+        _count('connections')
+    elif event_name == 'connection.start_tls.complete':
+        _count('tls_handshakes')
+
+
+async def _atrace(event_name, info):
+    _trace(event_name, info)
+
+
+def _on_request(request):
+    _count('requests')
+    request.extensions['trace'] = _trace
+
+
+async def _aon_request(request):
+    _count('requests')
+    request.extensions['trace'] = _atrace
+
+
+def _limits():
+    return httpx.Limits(
+        max_connections=settings.HTTP_POOL_MAX_CONNECTIONS,
+        max_keepalive_connections=settings.HTTP_POOL_MAX_KEEPALIVE,
+        keepalive_expiry=settings.HTTP_KEEPALIVE_EXPIRY,
+    )
+
+
+def _timeout():
+    return httpx.Timeout(settings.HTTP_TIMEOUT, connect=settings.HTTP_CONNECT_TIMEOUT)
+
+
+def client():
+    """The shared httpx.Client"""
+    global _client
+    if _client is None:
+        with _clients_lock:
+            if _client is None:
+                _client = httpx.Client(
+                    limits=_limits(), timeout=_timeout(),
+                    event_hooks={'request': [_on_request]})
+    return _client
+
+
+def openai_client():
+    """The shared OpenAI client, sending its requests through `client()`"""
+    global _openai_client
+    if _openai_client is None:
+        http_client = client()
+        with _clients_lock:
+            if _openai_client is None:
+                # Retries are done by app/rate_limit.py, which shares backoff across processes
+                _openai_client = openai.OpenAI(
+                    api_key=os.getenv('OPENAI_API_KEY'), base_url=settings.OPENAI_BASE_URL,
+                    http_client=http_client, max_retries=0)
+    return _openai_client
+
+
+def _loop_clients():
+    loop = asyncio.get_running_loop()
+    with _clients_lock:
+        clients = _async_clients.get(loop)
+        if clients is None:
+            http_client = httpx.AsyncClient(
+                limits=_limits(), timeout=_timeout(),
+                event_hooks={'request': [_aon_request]})
+            clients = (http_client, openai.AsyncOpenAI(
+                api_key=os.getenv('OPENAI_API_KEY'), base_url=settings.OPENAI_BASE_URL,
+                http_client=http_client, max_retries=0))
+            _async_clients[loop] = clients
+    return clients
+
+
+def async_client():
+    """The httpx.AsyncClient shared by everything on the running event loop"""
+    return _loop_clients()[0]
+
+
+def async_openai_client():
+    """The AsyncOpenAI client shared by everything on the running event loop"""
+    return _loop_clients()[1]
+
+
+async def aclose():
+    """Close the running loop's clients, e.g. before the loop shuts down"""
+    with _clients_lock:
+        clients = _async_clients.pop(asyncio.get_running_loop(), None)
+    if clients is not None:
+        await clients[0].aclose()
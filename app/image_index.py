@@ -0,0 +1,138 @@
+"""
+Perceptual-hash index of images already described by image_to_audio.
+
+Each input gets a 64-bit DCT perceptual hash, which is unchanged by
+recompression, resizing or EXIF edits. A new upload within
+IMAGE_DEDUP_MAX_DISTANCE bits (Hamming distance) of a completed conversion
+made with the same options and models (the input-independent part of the
+result cache key, `result_cache.options_key`) reuses that conversion's
+description and audio.
+
+Lookups use multi-index hashing. The hash is split into four 16-bit bands,
+each stored in its own indexed column. By the pigeonhole principle, two
+hashes within distance r share at least one band within distance r // 4.
+Candidates therefore come from a handful of index probes per band rather
+than a scan over every fingerprint.
+"""
+import itertools
+
+import numpy as np
+from django.conf import settings
+from django.db.models import Q
+from PIL import Image, ImageOps
+
+from .image_prep import open_image
+from .models import ConversionSession, ImageFingerprint
+
+HASH_SIZE = 8
+SAMPLE_SIZE = HASH_SIZE * 4
+BANDS = 4
+BAND_BITS = 64 // BANDS
+BAND_MASK = (1 << BAND_BITS) - 1
+HASH_MASK = (1 << 64) - 1
+
+def _dct_matrix(n):
+    """Orthonormal DCT-II basis, so dct(x) == D @ x @ D.T"""
+    k = np.arange(n)[:, None]
+    i = np.arange(n)[None, :]
+    matrix = np.cos(np.pi * (2 * i + 1) * k / (2 * n)) * np.sqrt(2.0 / n)
+    matrix[0] /= np.sqrt(2.0)
+    return matrix
+
+
+_DCT = _dct_matrix(SAMPLE_SIZE)
+
+
+def phash(image_file):
+    """64-bit perceptual hash of an image path or file object, as an unsigned int"""
+    with open_image(image_file) as img:
+        # Let the JPEG decoder downscale while decoding; we only need 32x32
+        img.draft('L', (SAMPLE_SIZE * 4, SAMPLE_SIZE * 4))
+        img = ImageOps.exif_transpose(img).convert('L')
+        img = img.resize((SAMPLE_SIZE, SAMPLE_SIZE), Image.Resampling.LANCZOS)
+
+    pixels = np.asarray(img, dtype=np.float64)
+    low_frequencies = (_DCT @ pixels @ _DCT.T)[:HASH_SIZE, :HASH_SIZE].flatten()
+    # Skip the DC term when picking the threshold; it only encodes brightness
+    bits = low_frequencies > np.median(low_frequencies[1:])
+
+    value = 0
+    for bit in bits:
+        value = (value << 1) | int(bit)
+    return value
+
+
+def hamming(a, b):
+    return ((a ^ b) & HASH_MASK).bit_count()
+
+
+def _to_signed(value):
+    """Store the unsigned 64-bit hash in a signed BigIntegerField"""
+    return value - (1 << 64) if value >= (1 << 63) else value
+
+
+def bands(value):
+    return [(value >> (BAND_BITS * i)) & BAND_MASK for i in range(BANDS)]
+
+
+def _band_neighbours(band, radius):
+    """Every band value within `radius` bits of `band`"""
+    values = [band]
+    for distance in range(1, radius + 1):
+        for positions in itertools.combinations(range(BAND_BITS), distance):
+            flipped = band
+            for position in positions:
+                flipped ^= 1 << position
+            values.append(flipped)
+    return values
+
+
+def fingerprint_fields(value):
+    """Model field values for the hash `value`"""
+    fields = {'phash': _to_signed(value)}
+    for i, band in enumerate(bands(value)):
+        fields[f'band{i}'] = band
+    return fields
+
+
+def add(session, value, options_key):
+    """Index the input image of `session`, converted with `options_key`"""
+    return ImageFingerprint.objects.create(
+        session=session, options_key=options_key, **fingerprint_fields(value))
+
+
+def find_similar(value, options_key, max_distance=None):
+    """
+    Return the closest completed image_to_audio session within
+    `max_distance` bits of `value` that was converted with `options_key`,
+    or None.
+    """
+    max_distance = settings.IMAGE_DEDUP_MAX_DISTANCE if max_distance is None else max_distance
+    radius = max_distance // BANDS
+
+    # The options key is repeated in each term so every band probe is one index range
+    band_query = Q()
+    for i, band in enumerate(bands(value)):
+        band_query |= Q(options_key=options_key, **{f'band{i}__in': _band_neighbours(band, radius)})
+
+    close = []
+    candidates = ImageFingerprint.objects.filter(band_query).values_list('phash', 'session_id')
+    for phash_value, session_pk in candidates:
+        distance = hamming(phash_value, value)
+        if distance <= max_distance:
+            close.append((distance, session_pk))
+    close.sort()
+
+    if not close:
+        return None
+
+    sessions = ConversionSession.objects.filter(
+        pk__in=[session_pk for _, session_pk in close],
+        processing_status='completed',
+    ).in_bulk()
+    for distance, session_pk in close:
+        if session_pk in sessions:
+            print(f"Found near-duplicate image {distance} bits away "
+                  f"(session {sessions[session_pk].session_id})")
+            return sessions[session_pk]
+    return None
@@ -0,0 +1,107 @@
+"""
+Image pre-processing for GPT-4o analysis.
+
+GPT-4o never looks at more than a fixed resolution. With detail=high the
+image is scaled to fit 2048x2048 and then to 768px on its short side, and
+billed per 512px tile. With detail=low it sees a single 512x512 view for a
+flat 85 tokens. Anything larger only costs upload bytes and latency.
+
+Uploads are therefore decoded at reduced size (JPEG draft mode, then
+`reduce`), downscaled to what the model will use, and re-encoded without
+EXIF/ICC metadata as JPEG or WebP with the matching MIME type.
+"""
+import base64
+import io
+
+from django.conf import settings
+from PIL import ExifTags, Image, ImageOps
+
+HIGH_DETAIL_FIT = 2048
+HIGH_DETAIL_SHORT_SIDE = 768
+LOW_DETAIL_SIZE = 512
+
+MIME_TYPES = {'JPEG': 'image/jpeg', 'WEBP': 'image/webp'}
+
+
+class ImageTooLarge(ValueError):
+    """The image has more pixels than IMAGE_MAX_PIXELS allows"""
+
+
+def open_image(source):
+    """
+    Image.open with a decompression bomb guard: the pixel count from the
+    header is checked before anything is decoded
+    """
+    try:
+        img = Image.open(source)
+    except Image.DecompressionBombError as e:
+        raise ImageTooLarge(str(e))
+    if img.width * img.height > settings.IMAGE_MAX_PIXELS:
+        img.close()
+        raise ImageTooLarge(
+            f"Image is {img.width}x{img.height}, more than {settings.IMAGE_MAX_PIXELS} pixels")
+    return img
+
+
+def choose_detail(size):
+    """VISION_DETAIL, or with 'auto', low for images that fit the low-detail view"""
+    if settings.VISION_DETAIL in ('low', 'high'):
+        return settings.VISION_DETAIL
+    return 'low' if max(size) <= LOW_DETAIL_SIZE else 'high'
+
+
+def target_size(size, detail):
+    """The largest size the model will actually look at for `detail`"""
+    width, height = size
+    if detail == 'low':
+        scale = LOW_DETAIL_SIZE / max(width, height)
+    else:
+        scale = min(HIGH_DETAIL_FIT / max(width, height),
+                    HIGH_DETAIL_SHORT_SIDE / min(width, height))
+    scale = min(scale, 1.0)
+    return max(round(width * scale), 1), max(round(height * scale), 1)
+
+
+def _flatten(img):
+    """Drop alpha onto white; JPEG and the model both ignore transparency"""
+    if img.has_transparency_data:
+        img = img.convert('RGBA')
+        background = Image.new('RGB', img.size, (255, 255, 255))
+        background.paste(img, mask=img.getchannel('A'))
+        return background
+    return img.convert('RGB')
+
+
+def prepare_for_vision(image_file_path):
+    """
+    Return the `image_url` content part for GPT-4o: a data URL of the
+    downscaled, metadata-free image and the detail level to use
+    """
+    with open_image(image_file_path) as img:
+        # Work in displayed orientation; EXIF orientations 5-8 swap the axes
+        rotated = img.getexif().get(ExifTags.Base.Orientation, 1) in (5, 6, 7, 8)
+        original_size = (img.height, img.width) if rotated else img.size
+        detail = choose_detail(original_size)
+        target = target_size(original_size, detail)
+
+        # Let the JPEG decoder skip detail we are about to throw away
+        img.draft('RGB', target[::-1] if rotated else target)
+        img = _flatten(ImageOps.exif_transpose(img))
+
+        factor = min(img.width // target[0], img.height // target[1])
+        if factor >= 2:
+            img = img.reduce(factor)
+        if img.size != target:
+            img = img.resize(target, Image.Resampling.LANCZOS)
+
+    image_format = settings.VISION_IMAGE_FORMAT.upper()
+    buffer = io.BytesIO()
+    img.save(buffer, format=image_format, quality=settings.VISION_IMAGE_QUALITY)
+    encoded = base64.b64encode(buffer.getvalue()).decode('ascii')
+
+    print(f"Prepared {original_size[0]}x{original_size[1]} image as "
+          f"{target[0]}x{target[1]} {image_format} ({buffer.tell()} bytes, detail={detail})")
+    return {
+        'url': f"data:{MIME_TYPES[image_format]};base64,{encoded}",
+        'detail': detail,
+    }
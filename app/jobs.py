@@ -0,0 +1,427 @@
+"""
+Database-backed conversion job queue.
+
+ConversionSession rows double as jobs: the views enqueue them as `pending`
+and `manage.py run_conversion_workers` claims and runs them. A claim takes a
+time-limited lease which the worker keeps renewing with heartbeats while the
+conversion runs. If a worker dies its lease expires and another worker picks
+the job up again, up to CONVERSION_JOB_MAX_ATTEMPTS times.
+"""
+import asyncio
+import os
+import socket
+import threading
+import traceback
+from datetime import timedelta
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import close_old_connections, connection
+from django.db.models import Q
+from django.utils import timezone
+
+from . import convert, metrics, result_cache, storage
+from .models import ConversionSession
+
+
+def default_worker_id():
+    """Identify this process across containers sharing the queue"""
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+def claimable(now):
+    """Jobs nobody holds: new ones, or ones whose worker stopped heartbeating"""
+    return (
+        Q(processing_status='pending')
+        | Q(processing_status='processing', lease_expires_at__lt=now)
+    ) & Q(attempts__lt=settings.CONVERSION_JOB_MAX_ATTEMPTS)
+
+
+def claim_candidates(now):
+    """The claimable jobs in the order they are claimed"""
+    return ConversionSession.objects.filter(claimable(now)).order_by('created_at')
+
+
+def fail_abandoned_jobs():
+    """Give up on jobs whose lease expired after the last allowed attempt"""
+    return ConversionSession.objects.filter(
+        processing_status='processing',
+        lease_expires_at__lt=timezone.now(),
+        attempts__gte=settings.CONVERSION_JOB_MAX_ATTEMPTS,
+    ).update(
+        processing_status='failed',
+        error_message='Conversion was abandoned by its worker too many times',
+        lease_expires_at=None,
+    )
+
+
+def claim_next(worker_id, lease_seconds=None):
+    """
+    Claim the oldest claimable job for `worker_id` and return it, or None
+    when the queue is empty.
+
+    The claim is a single autocommit statement,
+    UPDATE ... WHERE id = (SELECT id ... LIMIT 1) RETURNING id. On SQLite a
+    write statement takes the write lock before it reads, so competing
+    workers queue for it within the busy timeout rather than failing with
+    "database is locked", as a read-then-write transaction does. Where the
+    database supports it, the inner SELECT skips rows other workers have
+    locked.
+    """
+    lease_seconds = lease_seconds or settings.CONVERSION_JOB_LEASE_SECONDS
+    now = timezone.now()
+
+    candidate_sql, candidate_params = claim_candidates(now).values('pk')[:1].query.sql_with_params()
+    if connection.features.has_select_for_update_skip_locked:
+        candidate_sql += ' ' + connection.ops.for_update_sql(skip_locked=True)
+
+    meta = ConversionSession._meta
+    qn = connection.ops.quote_name
+
+    def column(name):
+        return qn(meta.get_field(name).column)
+
+    def value(name, python_value):
+        return meta.get_field(name).get_db_prep_save(python_value, connection)
+
+    sql = (
+        f"UPDATE {qn(meta.db_table)} SET "
+        f"{column('processing_status')} = %s, {column('worker_id')} = %s, "
+        f"{column('attempts')} = {column('attempts')} + 1, {column('started_at')} = %s, "
+        f"{column('heartbeat_at')} = %s, {column('lease_expires_at')} = %s "
+        f"WHERE {column('id')} = ({candidate_sql}) RETURNING {column('id')}"
+    )
+    params = [
+        'processing', worker_id,
+        value('started_at', now), value('heartbeat_at', now),
+        value('lease_expires_at', now + timedelta(seconds=lease_seconds)),
+        *candidate_params,
+    ]
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        # Fetch every row so the statement, and with it the write, completes
+        claimed = cursor.fetchall()
+    return ConversionSession.objects.get(pk=claimed[0][0]) if claimed else None
+
+
+def stream_claim(lease_seconds=None):
+    """
+    Session fields for a conversion that a request runs itself while
+    streaming the result, claimed by that request from the start. The
+    request heartbeats the lease like a worker does (see
+    `astream_image_to_audio`). If its process dies mid-stream, the lease
+    expires and the queue workers pick the conversion up like any abandoned
+    job.
+    """
+    lease_seconds = lease_seconds or settings.CONVERSION_JOB_LEASE_SECONDS
+    now = timezone.now()
+    return {
+        'processing_status': 'processing',
+        'worker_id': f"stream:{default_worker_id()}",
+        'attempts': 1,
+        'started_at': now,
+        'heartbeat_at': now,
+        'lease_expires_at': now + timedelta(seconds=lease_seconds),
+    }
+
+
+def extend_lease(session_pk, worker_id, lease_seconds=None):
+    """Renew the lease on a job. Returns False if the worker no longer holds it."""
+    lease_seconds = lease_seconds or settings.CONVERSION_JOB_LEASE_SECONDS
+    now = timezone.now()
+    return bool(ConversionSession.objects.filter(
+        pk=session_pk, worker_id=worker_id, processing_status='processing',
+    ).update(heartbeat_at=now, lease_expires_at=now + timedelta(seconds=lease_seconds)))
+
+
+class Heartbeat(threading.Thread):
+    """Background thread that keeps a claimed job's lease alive"""
+
+    def __init__(self, session_pk, worker_id, lease_seconds):
+        super().__init__(daemon=True, name=f"heartbeat-{session_pk}")
+        self.session_pk = session_pk
+        self.worker_id = worker_id
+        self.lease_seconds = lease_seconds
+        self.interval = max(lease_seconds / 3, 1)
+        self._stopped = threading.Event()
+
+    def run(self):
+        try:
+            while not self._stopped.wait(self.interval):
+                try:
+                    if not extend_lease(self.session_pk, self.worker_id, self.lease_seconds):
+                        print(f"Lost lease on job {self.session_pk}")
+                        return
+                except Exception as e:
+                    print(f"Heartbeat for job {self.session_pk} failed: {e}")
+        finally:
+            connection.close()
+
+    def stop(self):
+        self._stopped.set()
+        self.join()
+
+
+def _finish(session, worker_id, **fields):
+    """Record a job's outcome, unless another worker has taken it over"""
+    updated = ConversionSession.objects.filter(
+        pk=session.pk, worker_id=worker_id, processing_status='processing',
+    ).update(lease_expires_at=None, **fields)
+    if not updated:
+        print(f"Discarding result for job {session.session_id}: lease was lost")
+    return bool(updated)
+
+
+def run_job(session):
+    """
+    Run the AI conversion for a claimed session. The converter writes the
+    output straight to the conversion's output directory.
+    """
+    input_path = session.input_file.path
+    converter = convert.AIConverter()
+
+    if session.conversion_type == 'audio_to_image':
+        return converter.audio_to_image(
+            input_path, session.description_prompt or '', storage.output_path(session),
+            live_transcription=session.transcription or None)
+    return converter.image_to_audio(
+        input_path, session.voice_preference, session.description_style, storage.output_path(session))
+
+
+def _queue_wait(session):
+    """Stage timing for the time a job spent queued before this claim"""
+    return {
+        'stage': 'queue_wait',
+        'seconds': max((session.started_at - session.created_at).total_seconds(), 0.0),
+        'outcome': 'ok',
+        'size': None,
+    }
+
+
+def _record_result(session, worker_id, result):
+    """Save a job's result and stage timings on its session"""
+    timings = [_queue_wait(session)] + result.get('timings', [])
+    metrics.save(session, timings)
+    print(f"[{worker_id}] Stage timings for {session.session_id}: {metrics.summary(timings)}")
+
+    if result['success']:
+        finished = _finish(
+            session, worker_id,
+            processing_status='completed',
+            output_file=result['output_path'],
+            ai_model_used=result['ai_model_used'],
+            transcription=result.get('transcription', ''),
+            image_description=result.get('image_description', ''),
+            completed_at=timezone.now(),
+        )
+        if finished:
+            result_cache.store(session)
+        print(f"[{worker_id}] Completed job {session.session_id}")
+    else:
+        _finish(
+            session, worker_id,
+            processing_status='failed',
+            ai_model_used=result.get('ai_model_used', ''),
+            error_message=result['error'],
+        )
+        print(f"[{worker_id}] Job {session.session_id} failed: {result['error']}")
+
+
+def process(session, worker_id, lease_seconds=None):
+    """Run a claimed job to completion while heartbeating its lease"""
+    lease_seconds = lease_seconds or settings.CONVERSION_JOB_LEASE_SECONDS
+    print(f"[{worker_id}] Processing {session.conversion_type} job {session.session_id} "
+          f"(attempt {session.attempts})")
+
+    heartbeat = Heartbeat(session.pk, worker_id, lease_seconds)
+    heartbeat.start()
+    try:
+        result = run_job(session)
+    except Exception as e:
+        traceback.print_exc()
+        result = {'success': False, 'error': str(e), 'ai_model_used': ''}
+    finally:
+        heartbeat.stop()
+
+    _record_result(session, worker_id, result)
+
+
+def work_loop(worker_id, stop_event, poll_interval=None, lease_seconds=None, drain=False):
+    """
+    Claim and run jobs until `stop_event` is set. With `drain`, return as
+    soon as the queue is empty instead of polling for more work.
+    """
+    poll_interval = poll_interval or settings.CONVERSION_WORKER_POLL_INTERVAL
+    try:
+        while not stop_event.is_set():
+            close_old_connections()
+            try:
+                fail_abandoned_jobs()
+                session = claim_next(worker_id, lease_seconds)
+            except Exception as e:
+                print(f"[{worker_id}] Could not claim a job: {e}")
+                session = None
+
+            if session is None:
+                if drain:
+                    return
+                stop_event.wait(poll_interval)
+                continue
+
+            process(session, worker_id, lease_seconds)
+    finally:
+        connection.close()
+
+
+async def run_job_async(session):
+    """run_job on AsyncAIConverter"""
+    input_path = session.input_file.path
+    converter = convert.AsyncAIConverter()
+
+    if session.conversion_type == 'audio_to_image':
+        return await converter.audio_to_image(
+            input_path, session.description_prompt or '', storage.output_path(session),
+            live_transcription=session.transcription or None)
+    return await converter.image_to_audio(
+        input_path, session.voice_preference, session.description_style, storage.output_path(session))
+
+
+async def _heartbeat_async(session_pk, worker_id, lease_seconds):
+    """Task version of Heartbeat; cancel it when the job is done"""
+    while True:
+        await asyncio.sleep(max(lease_seconds / 3, 1))
+        try:
+            if not await sync_to_async(extend_lease)(session_pk, worker_id, lease_seconds):
+                print(f"Lost lease on job {session_pk}")
+                return
+        except Exception as e:
+            print(f"Heartbeat for job {session_pk} failed: {e}")
+
+
+async def process_async(session, worker_id, lease_seconds=None):
+    """Async version of `process`"""
+    lease_seconds = lease_seconds or settings.CONVERSION_JOB_LEASE_SECONDS
+    print(f"[{worker_id}] Processing {session.conversion_type} job {session.session_id} "
+          f"(attempt {session.attempts})")
+
+    heartbeat = asyncio.create_task(_heartbeat_async(session.pk, worker_id, lease_seconds))
+    try:
+        result = await run_job_async(session)
+    except Exception as e:
+        traceback.print_exc()
+        result = {'success': False, 'error': str(e), 'ai_model_used': ''}
+    finally:
+        heartbeat.cancel()
+
+    await sync_to_async(_record_result)(session, worker_id, result)
+
+
+def _claim_next_async(worker_id, lease_seconds):
+    fail_abandoned_jobs()
+    return claim_next(worker_id, lease_seconds)
+
+
+async def async_work_loop(worker_id, stop_event, concurrency=None, poll_interval=None,
+                          lease_seconds=None, drain=False):
+    """
+    Claim and run up to `concurrency` jobs at a time on the running event
+    loop until the asyncio.Event `stop_event` is set. Conversions mostly
+    wait on the AI APIs, so one process can keep many of them in flight.
+    """
+    concurrency = concurrency or settings.CONVERSION_WORKER_ASYNC_CONCURRENCY
+    poll_interval = poll_interval or settings.CONVERSION_WORKER_POLL_INTERVAL
+    slots = asyncio.Semaphore(concurrency)
+    running = set()
+
+    def job_done(task):
+        running.discard(task)
+        slots.release()
+
+    while not stop_event.is_set():
+        await slots.acquire()
+        try:
+            session = await sync_to_async(_claim_next_async)(worker_id, lease_seconds)
+        except Exception as e:
+            print(f"[{worker_id}] Could not claim a job: {e}")
+            session = None
+
+        if session is None:
+            slots.release()
+            if drain and not running:
+                break
+            try:
+                await asyncio.wait_for(stop_event.wait(), poll_interval)
+            except asyncio.TimeoutError:
+                pass
+            continue
+
+        task = asyncio.create_task(process_async(session, worker_id, lease_seconds))
+        running.add(task)
+        task.add_done_callback(job_done)
+
+    if running:
+        await asyncio.gather(*running, return_exceptions=True)
+
+
+def _complete_stream(session, path, result):
+    metrics.save(session, result.get('timings'))
+    finished = _finish(
+        session, session.worker_id,
+        processing_status='completed',
+        output_file=str(path),
+        ai_model_used=result['ai_model_used'],
+        image_description=result['image_description'],
+        completed_at=timezone.now(),
+    )
+    if finished:
+        result_cache.store(session)
+
+
+def _fail_stream(session, result, error_message):
+    metrics.save(session, result.get('timings'))
+    _finish(
+        session, session.worker_id,
+        processing_status='failed',
+        ai_model_used=result.get('ai_model_used', ''),
+        error_message=error_message,
+    )
+
+
+async def astream_image_to_audio(session):
+    """
+    Run an image_to_audio session claimed with `stream_claim` in the
+    request, yielding MP3 data as it is generated while also writing it to
+    the session's output file. The lease is renewed while the stream runs.
+    The session is marked completed (and cached) once the stream finishes,
+    or failed if it breaks off.
+    """
+    result = {}
+    completed = False
+    chunks = None
+    lease_seconds = settings.CONVERSION_JOB_LEASE_SECONDS
+    heartbeat = asyncio.create_task(_heartbeat_async(session.pk, session.worker_id, lease_seconds))
+    try:
+        chunks = convert.AsyncAIConverter().stream_image_to_audio(
+            session.input_file.path, session.voice_preference, session.description_style, result)
+        with storage.output_file(storage.output_path(session)) as (output_file, final_path):
+            async for chunk in chunks:
+                output_file.write(chunk)
+                yield chunk
+
+        await sync_to_async(_complete_stream)(session, final_path, result)
+        completed = True
+        print(f"Completed streamed conversion {session.session_id}")
+    except (GeneratorExit, asyncio.CancelledError):
+        error_message = 'Client disconnected before the narration finished'
+        raise
+    except Exception as e:
+        traceback.print_exc()
+        error_message = str(e)
+    finally:
+        heartbeat.cancel()
+        if not completed:
+            # Let the converter finish its stage timings before they are saved
+            if chunks is not None:
+                await chunks.aclose()
+            await sync_to_async(_fail_stream)(session, result, error_message)
+            print(f"Streamed conversion {session.session_id} failed: {error_message}")
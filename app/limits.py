@@ -0,0 +1,72 @@
+"""
+Per-provider concurrency limits.
+
+A conversion calls up to three providers with very different capacity:
+Whisper is bound by local CPU, while OpenAI and ElevenLabs each accept a
+limited number of concurrent requests per account. Every call takes a slot
+for its provider (PROVIDER_CONCURRENCY), so many jobs in flight at once keep
+each provider busy up to its own limit instead of overrunning the smallest.
+
+A slot is only held for the request itself. Waiting for a rate limit token
+or a retry backoff happens before it is taken (see `holding`), so callers
+held up by one endpoint's budget, such as DALL-E's few requests a minute,
+do not keep the provider's other endpoints waiting.
+"""
+import asyncio
+import contextlib
+import functools
+import threading
+import weakref
+
+from django.conf import settings
+
+_semaphores = {}
+# event loop -> {provider: asyncio.Semaphore}
+_async_semaphores = weakref.WeakKeyDictionary()
+_lock = threading.Lock()
+
+
+def _limit(provider):
+    return max(settings.PROVIDER_CONCURRENCY[provider], 1)
+
+
+@contextlib.contextmanager
+def slot(provider):
+    """Hold one of `provider`'s slots in this process"""
+    with _lock:
+        semaphore = _semaphores.get(provider)
+        if semaphore is None:
+            semaphore = _semaphores[provider] = threading.BoundedSemaphore(_limit(provider))
+    with semaphore:
+        yield
+
+
+@contextlib.asynccontextmanager
+async def async_slot(provider):
+    """Hold one of `provider`'s slots on the running event loop"""
+    loop = asyncio.get_running_loop()
+    with _lock:
+        semaphores = _async_semaphores.setdefault(loop, {})
+        semaphore = semaphores.get(provider)
+        if semaphore is None:
+            semaphore = semaphores[provider] = asyncio.Semaphore(_limit(provider))
+    async with semaphore:
+        yield
+
+
+def holding(provider, func):
+    """`func`, taking one of `provider`'s slots for each call"""
+    @functools.wraps(func)
+    def call(*args, **kwargs):
+        with slot(provider):
+            return func(*args, **kwargs)
+    return call
+
+
+def async_holding(provider, func):
+    """`holding` for coroutine functions"""
+    @functools.wraps(func)
+    async def call(*args, **kwargs):
+        async with async_slot(provider):
+            return await func(*args, **kwargs)
+    return call
@@ -0,0 +1,285 @@
+"""
+Live transcription of recordings over a WebSocket.
+
+The browser opens PATH when recording starts and sends each MediaRecorder
+chunk as a binary message. Chunks are appended to the recording file and
+fed to one ffmpeg process per connection (audio.StreamDecoder), which
+decodes them as they arrive.
+
+Every LIVE_TRANSCRIPTION_INTERVAL seconds the audio that is not settled yet
+is transcribed and the running transcript is sent back as a `partial`
+message. Once the unsettled audio grows past the
+LIVE_TRANSCRIPTION_WINDOW_SECONDS sliding window, its start is settled:
+cut at a pause, transcribed one last time and its text fixed, so each pass
+covers at most one window however long the recording is.
+
+Messages from the browser:
+    {"type": "end"}                               recording stopped
+    {"type": "submit", "description_prompt": ""}  convert the recording
+
+After `end` the last window is transcribed and sent as a `transcript`
+message. `submit` queues the recording as an audio_to_image conversion
+that already carries that transcript, so the worker goes straight to GPT-4
+and DALL-E, and answers with the same payload as the status endpoint.
+"""
+import asyncio
+import contextlib
+import hashlib
+import json
+import os
+import time
+import uuid
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import close_old_connections
+
+from . import audio, limits, metrics, sessions, storage, transcription, uploads
+
+PATH = '/ws/transcribe/'
+
+# Close codes sent to the browser (4000-4999 are free for applications)
+CLOSE_DISABLED = 4403
+CLOSE_TOO_LARGE = 4413
+CLOSE_BAD_MESSAGE = 4400
+
+
+def _transcribe(samples):
+    """Transcribe one window of audio, or '' if it holds no speech"""
+    if settings.VAD_ENABLED:
+        samples = audio.trim_silence(samples)
+        if not len(samples):
+            return ''
+    return transcription.get_model().transcribe(samples)['text'].strip()
+
+
+class LiveRecording:
+    """The recording, decoder and transcript of one WebSocket connection"""
+
+    def __init__(self, send):
+        self.send = send
+        self.recording_id = uuid.uuid4()
+        self.path = storage.incoming_path(f"live_{self.recording_id}.webm")
+        self.file = None
+        self.size = 0
+        self.digest = hashlib.sha256()
+        self.content_type = 'audio/webm'
+
+        self.decoder = None
+        self.settled = 0            # samples whose text is fixed
+        self.settled_text = []
+        self.tail_text = ''
+        self.ended = False
+        self.failed = False
+        self.transcriber = None
+        self.in_pass = False
+        self.transcript = None      # the full text once the recording has ended
+        self.final_seconds = None   # how long that took after the recording ended
+
+    async def send_json(self, payload):
+        await self.send({'type': 'websocket.send', 'text': json.dumps(payload)})
+
+    async def start(self):
+        self.file = open(self.path, 'wb')
+        try:
+            self.decoder = audio.StreamDecoder()
+            await self.decoder.start()
+        except audio.AudioDecodeError as e:
+            # Keep receiving the recording; the worker will transcribe it
+            print(f"Live transcription unavailable: {e}")
+            self.failed = True
+        else:
+            self.transcriber = asyncio.create_task(self._transcribe_loop())
+
+    async def feed(self, data):
+        self.size += len(data)
+        if self.size > settings.RECORDING_MAX_BYTES:
+            raise uploads.UploadError(
+                f"Recordings can be at most {settings.RECORDING_MAX_BYTES} bytes", status=413)
+        self.file.write(data)
+        self.digest.update(data)
+        if not self.failed:
+            try:
+                await self.decoder.feed(data)
+            except audio.AudioDecodeError as e:
+                await self._fail(e)
+
+    async def _fail(self, error):
+        print(f"Live transcription stopped: {error}")
+        self.failed = True
+        await self.decoder.close()
+        await self.send_json({'type': 'live_unavailable', 'error': str(error)})
+
+    async def _pass(self, samples_end, final=False):
+        """
+        Settle all but the last window of the audio up to `samples_end`,
+        then transcribe that window. With `final`, the window is settled
+        too.
+        """
+        pending = self.decoder.samples(self.settled)[:samples_end - self.settled]
+        windows = audio.split_at_silence(pending, settings.LIVE_TRANSCRIPTION_WINDOW_SECONDS)
+        settle = windows if final else windows[:-1]
+
+        async with limits.async_slot('whisper'):
+            for window in settle:
+                text = await transcription.run_in_executor(_transcribe, window)
+                if text:
+                    self.settled_text.append(text)
+                self.settled += len(window)
+            if not final:
+                self.tail_text = await transcription.run_in_executor(_transcribe, windows[-1])
+        if final:
+            self.tail_text = ''
+
+    def text(self):
+        return ' '.join(self.settled_text + ([self.tail_text] if self.tail_text else []))
+
+    async def _transcribe_loop(self):
+        transcribed_to = 0
+        try:
+            while not self.ended:
+                await asyncio.sleep(settings.LIVE_TRANSCRIPTION_INTERVAL)
+                samples_end = len(self.decoder)
+                if self.ended or samples_end == transcribed_to:
+                    continue
+                self.in_pass = True
+                try:
+                    await self._pass(samples_end)
+                finally:
+                    self.in_pass = False
+                transcribed_to = samples_end
+                await self.send_json({
+                    'type': 'partial',
+                    'text': self.text(),
+                    'seconds': round(samples_end / audio.SAMPLE_RATE, 1),
+                })
+        except Exception as e:
+            await self._fail(e)
+
+    async def end(self):
+        """Finish decoding and transcribing once the recording has stopped"""
+        if self.ended:
+            return self.transcript
+        self.ended = True
+        self.file.close()
+        if self.failed:
+            return None
+
+        started = time.perf_counter()
+        try:
+            # Let a pass that is already running finish rather than repeat it
+            if not self.in_pass:
+                self.transcriber.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await self.transcriber
+            samples = await self.decoder.finish()
+            await self._pass(len(samples), final=True)
+        except Exception as e:
+            await self._fail(e)
+            return None
+
+        self.transcript = self.text()
+        self.final_seconds = time.perf_counter() - started
+        print(f"Live transcription of {len(samples) / audio.SAMPLE_RATE:.1f}s finished "
+              f"{self.final_seconds:.2f}s after recording stopped: {self.transcript[:100]}...")
+        return self.transcript
+
+    def submit(self, description_prompt):
+        """Queue (or answer from the result cache) the conversion of the recording"""
+        if not self.size:
+            return {'type': 'error', 'error': 'No audio data provided'}
+
+        close_old_connections()
+        try:
+            recording = uploads.AssembledUpload(
+                self.path, uploads.recording_name(self.recording_id, self.content_type),
+                self.digest.hexdigest())
+            with recording:
+                session_fields = {'processing_status': 'pending'}
+                if self.transcript:
+                    session_fields['transcription'] = self.transcript
+                session, reused = sessions.audio_to_image_session(
+                    recording, description_prompt, **session_fields)
+            if not reused and self.transcript:
+                metrics.save(session, [{
+                    'stage': 'transcribe', 'seconds': self.final_seconds,
+                    'outcome': 'live', 'size': None,
+                }])
+            print(f"Queued live recording {self.recording_id} as {session.session_id}")
+            return sessions.session_payload(session)
+        finally:
+            self.discard()
+            close_old_connections()
+
+    def discard(self):
+        """Delete the recording file if it was not moved into place"""
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
+
+    async def close(self):
+        if self.transcriber is not None:
+            self.transcriber.cancel()
+        if self.decoder is not None:
+            await self.decoder.close()
+        if self.file is not None:
+            self.file.close()
+        self.discard()
+
+
+async def application(scope, receive, send):
+    """ASGI application for PATH"""
+    message = await receive()
+    if message['type'] != 'websocket.connect':
+        return
+    if not settings.LIVE_TRANSCRIPTION_ENABLED:
+        await send({'type': 'websocket.close', 'code': CLOSE_DISABLED})
+        return
+    await send({'type': 'websocket.accept'})
+
+    live = LiveRecording(send)
+    await live.start()
+    try:
+        while True:
+            message = await receive()
+            if message['type'] == 'websocket.disconnect':
+                return
+
+            if message.get('bytes') is not None:
+                if not live.ended:
+                    await live.feed(message['bytes'])
+                continue
+
+            try:
+                command = json.loads(message.get('text') or '{}')
+            except ValueError:
+                command = {}
+            if command.get('type') == 'start':
+                live.content_type = command.get('mime_type') or live.content_type
+            elif command.get('type') == 'end':
+                text = await live.end()
+                if text is not None:
+                    await live.send_json({'type': 'transcript', 'text': text})
+            elif command.get('type') == 'submit':
+                if not live.ended:
+                    await live.end()
+                payload = await sync_to_async(live.submit)(command.get('description_prompt', ''))
+                await live.send_json(payload)
+                await send({'type': 'websocket.close', 'code': 1000})
+                return
+            else:
+                await send({'type': 'websocket.close', 'code': CLOSE_BAD_MESSAGE})
+                return
+
+    except uploads.UploadError as e:
+        await live.send_json({'type': 'error', 'error': str(e)})
+        await send({'type': 'websocket.close', 'code': CLOSE_TOO_LARGE})
+    except Exception as e:
+        print(f"Error in live transcription: {e}")
+        import traceback
+        traceback.print_exc()
+        await live.send_json({'type': 'error', 'error': str(e)})
+        await send({'type': 'websocket.close', 'code': 1011})
+    finally:
+        await live.close()
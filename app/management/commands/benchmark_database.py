@@ -0,0 +1,204 @@
+import os
+import random
+import shutil
+import statistics
+import tempfile
+import threading
+import time
+import uuid
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import OperationalError, connection, transaction
+from django.db.models import Count
+from django.test.utils import override_settings
+from django.utils import timezone
+
+from app import history, jobs
+from app.metrics import percentile
+from app.models import ConversionSession
+
+STATUS_WEIGHTS = {'completed': 90, 'failed': 8, 'processing': 1, 'pending': 1}
+
+
+class Command(BaseCommand):
+    help = ('Time session lookups with and without their indexes, and concurrent inserts '
+            'and job claims with and without WAL, on a throwaway SQLite database')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--rows', type=int, default=1_000_000,
+            help='Sessions to fill the database with before timing')
+        parser.add_argument(
+            '--repeat', type=int, default=200,
+            help='Timed runs of each query (runs without indexes are capped at 20)')
+        parser.add_argument(
+            '--threads', type=int, default=8,
+            help='Threads inserting sessions at the same time')
+        parser.add_argument(
+            '--inserts', type=int, default=200,
+            help='Sessions each thread inserts')
+        parser.add_argument(
+            '--claims', type=int, default=200,
+            help='Jobs each thread claims')
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'sqlite':
+            raise CommandError('The database benchmark is for SQLite')
+
+        work_dir = tempfile.mkdtemp(prefix='benchmark_database_')
+        # A throwaway database, so benchmark rows never mix with real ones
+        settings.DATABASES['default'].setdefault('TEST', {})['NAME'] = os.path.join(work_dir, 'db.sqlite3')
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True)
+        try:
+            self.fill(options['rows'])
+            self.time_queries(options['repeat'])
+            self.time_writes(options['threads'], options['inserts'], options['claims'])
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    def fill(self, rows):
+        self.stdout.write(f"Inserting {rows} session(s)...")
+        started = time.perf_counter()
+        # Unfinished sessions are the newest ones, as in a real queue
+        statuses = sorted(
+            random.choices(list(STATUS_WEIGHTS), list(STATUS_WEIGHTS.values()), k=rows),
+            key=lambda status: status in ('pending', 'processing'))
+        types = [choice[0] for choice in ConversionSession.CONVERSION_TYPES]
+        for start in range(0, rows, 10_000):
+            with transaction.atomic():
+                ConversionSession.objects.bulk_create([
+                    ConversionSession(
+                        conversion_type=random.choice(types),
+                        input_file=f"uploads/benchmark_{i}.wav",
+                        processing_status=statuses[i],
+                    )
+                    for i in range(start, min(start + 10_000, rows))
+                ])
+        self.stdout.write(f"Inserted in {time.perf_counter() - started:.1f}s")
+
+    def queries(self):
+        """(name, function returning a queryset) for each access pattern"""
+        last_pk = ConversionSession.objects.order_by('-pk').values_list('pk', flat=True).first()
+        samples = list(ConversionSession.objects.filter(
+            pk__in=random.sample(range(1, last_pk + 1), min(last_pk, 1000)),
+        ).values_list('session_id', 'created_at'))
+
+        # Where page 10,000 of the history starts (or the last page)
+        deep = history.page_keys()[min(history.PAGE_SIZE * 9_999, last_pk - 1)]
+        deep = ConversionSession.objects.filter(pk=deep).values_list('created_at', 'pk').get()
+        page_size = history.PAGE_SIZE + 1
+
+        return [
+            ('lookup by session_id', lambda: ConversionSession.objects.filter(
+                session_id=random.choice(samples)[0])),
+            ('claim candidate', lambda: jobs.claim_candidates(timezone.now()).values('pk')[:1]),
+            ('history page 1', lambda: history.page_keys()[:page_size]),
+            ('history page 10,000', lambda: history.page_keys(after=deep)[:page_size]),
+            ('history random page', lambda: history.page_keys(
+                after=(random.choice(samples)[1], last_pk))[:page_size]),
+            ('history by type/status', lambda: history.page_keys(
+                'image_to_audio', 'completed', after=(random.choice(samples)[1], last_pk))[:page_size]),
+            ('counts by type/status', lambda: ConversionSession.objects.values(
+                'conversion_type', 'processing_status').annotate(total=Count('pk')).order_by()),
+        ]
+
+    def time_queries(self, repeat):
+        table = connection.ops.quote_name(ConversionSession._meta.db_table)
+        self.stdout.write(
+            f"{'query':<24} {'indexed ms':>11} {'p95':>8} {'unindexed ms':>13} {'p95':>8}  plan")
+
+        for name, make_queryset in self.queries():
+            timings = {}
+            for indexed, runs in ((True, repeat), (False, min(repeat, 20))):
+                seconds = []
+                for _ in range(runs):
+                    sql, params = make_queryset().query.sql_with_params()
+                    if not indexed:
+                        # As before the indexes existed
+                        sql = sql.replace(f"FROM {table}", f"FROM {table} NOT INDEXED", 1)
+                    with connection.cursor() as cursor:
+                        started = time.perf_counter()
+                        cursor.execute(sql, params)
+                        cursor.fetchall()
+                        seconds.append(time.perf_counter() - started)
+                timings[indexed] = (statistics.median(seconds) * 1000, percentile(seconds, 95) * 1000)
+
+            plan = ' | '.join(
+                line.split(' ', 3)[-1] for line in make_queryset().explain().splitlines())
+            self.stdout.write(
+                f"{name:<24} {timings[True][0]:>11.3f} {timings[True][1]:>8.3f} "
+                f"{timings[False][0]:>13.3f} {timings[False][1]:>8.3f}  {plan}")
+
+    def time_writes(self, threads, inserts, claims):
+        self.stdout.write(
+            f"{threads} thread(s) concurrently inserting {inserts} session(s) "
+            f"or claiming {claims} job(s) each")
+        self.stdout.write(
+            f"{'operation':<10} {'journal':<8} {'synchronous':<12} {'per s':>8} {'median ms':>10} "
+            f"{'p95 ms':>8} {'errors':>7}")
+
+        modes = [('DELETE', 'FULL'), (settings.SQLITE_JOURNAL_MODE, settings.SQLITE_SYNCHRONOUS)]
+        for journal_mode, synchronous in modes:
+            # Changing the journal mode needs the only open connection
+            connection.close()
+            with override_settings(SQLITE_JOURNAL_MODE=journal_mode, SQLITE_SYNCHRONOUS=synchronous):
+                connection.ensure_connection()
+                results = [
+                    ('insert', self.concurrently(threads, inserts, self.insert)),
+                    ('claim', self.concurrently(threads, claims, self.claim)),
+                ]
+            connection.close()
+
+            for operation, (seconds, errors, elapsed) in results:
+                rate = len(seconds) / elapsed if elapsed else 0.0
+                median = statistics.median(seconds) * 1000 if seconds else 0.0
+                p95 = percentile(seconds, 95) * 1000 if seconds else 0.0
+                self.stdout.write(
+                    f"{operation:<10} {journal_mode:<8} {synchronous:<12} {rate:>8.1f} {median:>10.3f} "
+                    f"{p95:>8.3f} {errors:>7}")
+
+    def insert(self):
+        ConversionSession.objects.create(
+            conversion_type='audio_to_image',
+            input_file=f"uploads/benchmark_{uuid.uuid4().hex}.wav",
+        )
+
+    def claim(self):
+        jobs.claim_next(f"benchmark-{threading.get_ident()}")
+
+    def concurrently(self, threads, count, operation):
+        """
+        Call `operation` `count` times from each of `threads` threads;
+        returns (latencies, errors, elapsed)
+        """
+        seconds = []
+        errors = [0]
+        lock = threading.Lock()
+
+        def run():
+            own = []
+            failed = 0
+            try:
+                for _ in range(count):
+                    started = time.perf_counter()
+                    try:
+                        operation()
+                    except OperationalError:
+                        failed += 1
+                        continue
+                    own.append(time.perf_counter() - started)
+            finally:
+                connection.close()
+            with lock:
+                seconds.extend(own)
+                errors[0] += failed
+
+        workers = [threading.Thread(target=run) for _ in range(threads)]
+        started = time.perf_counter()
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        return seconds, errors[0], time.perf_counter() - started
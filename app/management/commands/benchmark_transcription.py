@@ -0,0 +1,81 @@
+import statistics
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from app import audio, transcription
+
+
+class Command(BaseCommand):
+    help = 'Measure the real-time factor of each transcription backend and model size on this host'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--backends', default=','.join(transcription.BACKENDS),
+            help='Comma-separated backends to compare (default: all)')
+        parser.add_argument(
+            '--models', default=settings.WHISPER_MODEL_SIZE,
+            help='Comma-separated Whisper model sizes (default: WHISPER_MODEL_SIZE)')
+        parser.add_argument(
+            '--device', default=settings.WHISPER_DEVICE,
+            help='Device for the stock backend (default: WHISPER_DEVICE)')
+        parser.add_argument(
+            '--audio',
+            help='Recording to transcribe; speech gives more representative numbers '
+                 'than the default 30 second test tone')
+        parser.add_argument(
+            '--repeat', type=int, default=3,
+            help='Timed runs per backend and model, after one warm-up run')
+        parser.add_argument(
+            '--threads', type=int,
+            help='torch threads for every backend (default: each backend\'s own setting)')
+
+    def handle(self, *args, **options):
+        backends = [name.strip() for name in options['backends'].split(',') if name.strip()]
+        unknown = [name for name in backends if name not in transcription.BACKENDS]
+        if unknown:
+            raise CommandError(f"Unknown backend(s): {', '.join(unknown)}")
+        models = [name.strip() for name in options['models'].split(',') if name.strip()]
+
+        if options['audio']:
+            try:
+                samples = audio.decode_audio(options['audio'])
+            except audio.AudioDecodeError as e:
+                raise CommandError(str(e))
+        else:
+            samples = audio.placeholder_audio(duration=30.0)
+        duration = len(samples) / audio.SAMPLE_RATE
+
+        if options['threads']:
+            transcription.set_threads(options['threads'])
+
+        import torch
+
+        self.stdout.write(f"Transcribing {duration:.1f}s of audio, {options['repeat']} run(s) each")
+        self.stdout.write(
+            f"{'backend':<14} {'model':<10} {'device':<8} {'threads':>7} "
+            f"{'load s':>8} {'median s':>9} {'RTF':>7} {'x realtime':>10}")
+
+        for backend in backends:
+            for name in models:
+                # Loaded outside the shared registry so each model is freed after its run
+                started = time.perf_counter()
+                warm = transcription.BACKENDS[backend].load(name, options['device'])
+                load_seconds = time.perf_counter() - started
+
+                warm.transcribe(samples)
+                timings = []
+                for _ in range(max(options['repeat'], 1)):
+                    started = time.perf_counter()
+                    warm.transcribe(samples)
+                    timings.append(time.perf_counter() - started)
+
+                elapsed = statistics.median(timings)
+                self.stdout.write(
+                    f"{backend:<14} {name:<10} {str(warm.model.device):<8} {torch.get_num_threads():>7} "
+                    f"{load_seconds:>8.2f} {elapsed:>9.2f} {elapsed / duration:>7.3f} "
+                    f"{duration / elapsed:>10.1f}")
+                del warm
+
+        self.stdout.write(self.style.SUCCESS("RTF is seconds of compute per second of audio; lower is faster"))
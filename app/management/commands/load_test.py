@@ -0,0 +1,377 @@
+import asyncio
+import io
+import multiprocessing
+import os
+import resource
+import shutil
+import socket
+import tempfile
+import threading
+import time
+import wave
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from django.conf import settings
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client
+from django.test.utils import override_settings
+from PIL import Image
+
+from app import fake_providers, http_clients, jobs, transcription
+from app.metrics import percentile
+from app.models import StageTiming
+
+UPLOAD_FIELDS = {'audio_to_image': 'audio_file', 'image_to_audio': 'image_file'}
+
+
+def rss_bytes():
+    """Current resident set size of this process"""
+    try:
+        with open('/proc/self/statm') as statm:
+            return int(statm.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError):
+        # No procfs: fall back to the peak so far (kilobytes on Linux, bytes on macOS)
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if peak > 1 << 32 else peak * 1024
+
+
+class PeakRSS(threading.Thread):
+    """Samples this process's RSS until stopped and keeps the highest value"""
+
+    def __init__(self, interval=0.05):
+        super().__init__(daemon=True, name='load-test-rss')
+        self.interval = interval
+        self.peak = rss_bytes()
+        self._stopped = threading.Event()
+
+    def run(self):
+        while not self._stopped.wait(self.interval):
+            self.peak = max(self.peak, rss_bytes())
+
+    def stop(self):
+        self._stopped.set()
+        self.join()
+        return self.peak
+
+
+def cpu_seconds():
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    return usage.ru_utime + usage.ru_stime
+
+
+def audio_input(index, seconds):
+    """A distinct WAV recording (a tone with some noise) for request `index`"""
+    t = np.arange(int(16000 * seconds)) / 16000
+    rng = np.random.default_rng(index)
+    samples = 0.3 * np.sin(2 * np.pi * (200 + index % 400) * t) + 0.01 * rng.standard_normal(len(t))
+    buffer = io.BytesIO()
+    with wave.open(buffer, 'wb') as wav:
+        wav.setnchannels(1)
+        wav.setsampwidth(2)
+        wav.setframerate(16000)
+        wav.writeframes((samples * 32767).astype(np.int16).tobytes())
+    return f"load_test_{index}.wav", buffer.getvalue()
+
+
+def image_input(index, size):
+    """A distinct JPEG photo-sized image for request `index`"""
+    rng = np.random.default_rng(index)
+    gradient = np.linspace(0, 255, size, dtype=np.float32)
+    pixels = np.stack([
+        np.add.outer(gradient, gradient) / 2,
+        np.tile(gradient, (size, 1)),
+        np.full((size, size), index % 256, dtype=np.float32),
+    ], axis=-1) + rng.normal(0, 12, (size, size, 3))
+    buffer = io.BytesIO()
+    Image.fromarray(np.clip(pixels, 0, 255).astype(np.uint8)).save(buffer, 'JPEG', quality=90)
+    return f"load_test_{index}.jpg", buffer.getvalue()
+
+
+def wait_for_port(host, port, timeout=10):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            with socket.create_connection((host, port), timeout=0.5):
+                return
+        except OSError:
+            time.sleep(0.05)
+    raise CommandError(f"Fake provider server did not start on {host}:{port}")
+
+
+class Command(BaseCommand):
+    help = ('Drive the conversion views with concurrent clients against local stand-ins for '
+            'OpenAI and ElevenLabs, and report throughput, latency, memory and CPU')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--clients', type=int, default=8, help='Concurrent clients')
+        parser.add_argument(
+            '--requests', type=int, default=40, help='Conversions per conversion type')
+        parser.add_argument(
+            '--types', default=','.join(UPLOAD_FIELDS),
+            help='Comma-separated conversion types to test, one after the other')
+        parser.add_argument(
+            '--workers', type=int,
+            help='In-process conversion workers (default: CONVERSION_WORKER_CONCURRENCY, '
+                 'or CONVERSION_WORKER_ASYNC_CONCURRENCY with --async)')
+        parser.add_argument(
+            '--async', dest='use_async', action='store_true',
+            help='Run the workers as asyncio tasks, as run_conversion_workers --async does')
+        parser.add_argument('--port', type=int, default=8765, help='Port for the fake provider server')
+
+        latency = parser.add_argument_group('fake providers')
+        for kind, default in fake_providers.DEFAULT_LATENCY.items():
+            latency.add_argument(
+                f'--{kind}-latency', type=float, default=default,
+                help=f'Seconds before a {kind} response starts (default: {default})')
+        latency.add_argument(
+            '--error-rate', type=float, default=0.0, help='Share of API calls answered with a 500')
+        latency.add_argument(
+            '--throttle-rate', type=float, default=0.0, help='Share of API calls answered with a 429')
+        latency.add_argument(
+            '--image-bytes', type=int, default=1_500_000, help='Size of each generated image')
+        latency.add_argument(
+            '--description-words', type=int, default=80, help='Length of each GPT-4o description')
+        latency.add_argument(
+            '--whisper-latency', type=float, default=0.5,
+            help='Seconds the stand-in transcription takes (ignored with --real-whisper)')
+        latency.add_argument(
+            '--real-whisper', action='store_true',
+            help='Transcribe with the configured Whisper backend instead of a stand-in')
+
+        inputs = parser.add_argument_group('inputs')
+        inputs.add_argument('--audio-seconds', type=float, default=5.0, help='Length of each audio upload')
+        inputs.add_argument('--image-size', type=int, default=1024, help='Width and height of each image upload')
+        inputs.add_argument(
+            '--with-cache', action='store_true',
+            help='Keep the result cache, near-duplicate detection and API rate limits enabled')
+
+        gates = parser.add_argument_group('regression gates')
+        gates.add_argument(
+            '--max-p95', type=float, help='Fail if any type\'s p95 latency exceeds this many seconds')
+        gates.add_argument(
+            '--max-failure-rate', type=float, help='Fail if more than this share of conversions fail')
+        gates.add_argument(
+            '--timeout', type=float, default=300, help='Give up on a conversion after this many seconds')
+
+    def handle(self, *args, **options):
+        conversion_types = [name.strip() for name in options['types'].split(',') if name.strip()]
+        unknown = [name for name in conversion_types if name not in UPLOAD_FIELDS]
+        if unknown:
+            raise CommandError(f"Unknown conversion type(s): {', '.join(unknown)}")
+
+        host, port = '127.0.0.1', options['port']
+        server = multiprocessing.get_context('spawn').Process(
+            target=fake_providers.serve, name='fake-providers', daemon=True, kwargs={
+                'host': host, 'port': port,
+                'latency': {kind: options[f'{kind}_latency'] for kind in fake_providers.DEFAULT_LATENCY},
+                'error_rate': options['error_rate'],
+                'throttle_rate': options['throttle_rate'],
+                'image_bytes': options['image_bytes'],
+                'description_words': options['description_words'],
+            })
+        server.start()
+        work_dir = tempfile.mkdtemp(prefix='load_test_')
+        try:
+            wait_for_port(host, port)
+            self.stdout.write(f"Fake OpenAI/ElevenLabs server on http://{host}:{port}")
+            self.run(conversion_types, f"http://{host}:{port}/v1", work_dir, options)
+        finally:
+            server.terminate()
+            server.join()
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    def run(self, conversion_types, base_url, work_dir, options):
+        # A throwaway database, so load test sessions never mix with real ones
+        settings.DATABASES['default'].setdefault('TEST', {})['NAME'] = os.path.join(work_dir, 'db.sqlite3')
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True)
+
+        overrides = {
+            'ALLOWED_HOSTS': [*settings.ALLOWED_HOSTS, 'testserver'],
+            # Uploads, outputs and rate limits stay in the work directory too, away
+            # from a live checkout's files, and go when it is removed
+            'MEDIA_ROOT': os.path.join(work_dir, 'media'),
+            'FILE_UPLOAD_TEMP_DIR': os.path.join(work_dir, 'media', 'uploads', 'incoming'),
+            'OUTPUT_ROOT': work_dir,
+            'RATE_LIMIT_DB_PATH': os.path.join(work_dir, 'rate_limits.sqlite3'),
+            'OPENAI_BASE_URL': base_url,
+            'ELEVENLABS_BASE_URL': base_url,
+            'METRICS_ENABLED': True,
+        }
+        if not options['with_cache']:
+            overrides.update(RESULT_CACHE_ENABLED=False, IMAGE_DEDUP_ENABLED=False, RATE_LIMIT_ENABLED=False)
+        if not options['real_whisper']:
+            fake_providers.StandInTranscriber.latency = options['whisper_latency']
+            transcription.BACKENDS[fake_providers.StandInTranscriber.backend] = fake_providers.StandInTranscriber
+            overrides.update(TRANSCRIPTION_BACKEND=fake_providers.StandInTranscriber.backend,
+                             TRANSCRIPTION_PROCESSES=1)
+        os.environ.setdefault('OPENAI_API_KEY', 'load-test')
+
+        try:
+            with override_settings(**overrides):
+                stop_workers = self.start_workers(options)
+                try:
+                    reports = [self.run_phase(conversion_type, options) for conversion_type in conversion_types]
+                finally:
+                    stop_workers()
+                self.print_reports(reports)
+                self.print_stages(conversion_types)
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+
+        self.check_gates(reports, options)
+
+    def start_workers(self, options):
+        """Start in-process conversion workers and return a function that stops them"""
+        worker_id = f"load-test:{os.getpid()}"
+        if options['use_async']:
+            concurrency = options['workers'] or settings.CONVERSION_WORKER_ASYNC_CONCURRENCY
+            ready = threading.Event()
+            state = {}
+
+            async def main():
+                state['loop'], state['stop'] = asyncio.get_running_loop(), asyncio.Event()
+                ready.set()
+                await jobs.async_work_loop(worker_id, state['stop'], concurrency, poll_interval=0.05)
+                await http_clients.aclose()
+
+            thread = threading.Thread(target=lambda: asyncio.run(main()), name='load-test-worker')
+            thread.start()
+            ready.wait()
+            self.stdout.write(f"Started async worker running {concurrency} jobs at a time")
+
+            def stop():
+                state['loop'].call_soon_threadsafe(state['stop'].set)
+                thread.join()
+            return stop
+
+        concurrency = options['workers'] or settings.CONVERSION_WORKER_CONCURRENCY
+        stop_event = threading.Event()
+        threads = [
+            threading.Thread(
+                target=jobs.work_loop, args=(f"{worker_id}:{i}", stop_event),
+                kwargs={'poll_interval': 0.05}, name=f"load-test-worker-{i}")
+            for i in range(concurrency)
+        ]
+        for thread in threads:
+            thread.start()
+        self.stdout.write(f"Started {concurrency} worker thread(s)")
+
+        def stop():
+            stop_event.set()
+            for thread in threads:
+                thread.join()
+        return stop
+
+    def convert(self, conversion_type, upload, timeout):
+        """
+        Submit one conversion through the homepage view and poll its status
+        until it finishes. Returns (outcome, submit seconds, total seconds).
+        """
+        client = Client()
+        name, content = upload
+        started = time.perf_counter()
+        try:
+            response = client.post('/', {
+                UPLOAD_FIELDS[conversion_type]: SimpleUploadedFile(name, content),
+                'voice_preference': 'Rachel',
+            })
+            submitted = time.perf_counter() - started
+            payload = response.json()
+            if response.status_code != 202:
+                outcome = payload.get('status', 'failed') if response.status_code == 200 else 'failed'
+                return outcome, submitted, time.perf_counter() - started
+
+            deadline = started + timeout
+            while time.perf_counter() < deadline:
+                status = client.get(payload['status_url']).json()['status']
+                if status in ('completed', 'failed'):
+                    return status, submitted, time.perf_counter() - started
+                time.sleep(0.05)
+            return 'timeout', submitted, time.perf_counter() - started
+        finally:
+            connection.close()
+
+    def run_phase(self, conversion_type, options):
+        count = options['requests']
+        self.stdout.write(
+            f"\n{conversion_type}: {count} conversion(s) from {options['clients']} client(s)...")
+        if conversion_type == 'audio_to_image':
+            uploads = [audio_input(i, options['audio_seconds']) for i in range(count)]
+        else:
+            uploads = [image_input(i, options['image_size']) for i in range(count)]
+
+        rss = PeakRSS()
+        rss.start()
+        cpu_before = cpu_seconds()
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=options['clients'], thread_name_prefix='load-test-client') as pool:
+            results = list(pool.map(
+                lambda upload: self.convert(conversion_type, upload, options['timeout']), uploads))
+        elapsed = time.perf_counter() - started
+        cpu = cpu_seconds() - cpu_before
+        peak_rss = rss.stop()
+
+        outcomes = defaultdict(int)
+        for outcome, _, _ in results:
+            outcomes[outcome] += 1
+        completed = [total for outcome, _, total in results if outcome == 'completed']
+        return {
+            'conversion_type': conversion_type,
+            'requests': count,
+            'outcomes': dict(outcomes),
+            'elapsed': elapsed,
+            'throughput': len(completed) / elapsed if elapsed else 0.0,
+            'submit_p95': percentile([submitted for _, submitted, _ in results], 95),
+            'p50': percentile(completed, 50),
+            'p95': percentile(completed, 95),
+            'p99': percentile(completed, 99),
+            'peak_rss': peak_rss,
+            'cpu_per_conversion': cpu / count if count else 0.0,
+        }
+
+    def print_reports(self, reports):
+        def seconds(value):
+            return '-' if value is None else f"{value:.2f}"
+
+        self.stdout.write(
+            f"\n{'type':<16} {'ok':>5} {'failed':>6} {'req/s':>7} {'p50 s':>7} {'p95 s':>7} "
+            f"{'p99 s':>7} {'submit p95':>10} {'peak RSS MB':>11} {'CPU s/conv':>10}")
+        for report in reports:
+            outcomes = report['outcomes']
+            failed = report['requests'] - outcomes.get('completed', 0)
+            self.stdout.write(
+                f"{report['conversion_type']:<16} {outcomes.get('completed', 0):>5} {failed:>6} "
+                f"{report['throughput']:>7.2f} {seconds(report['p50']):>7} {seconds(report['p95']):>7} "
+                f"{seconds(report['p99']):>7} {seconds(report['submit_p95']):>10} "
+                f"{report['peak_rss'] / 2**20:>11.0f} {report['cpu_per_conversion']:>10.3f}")
+
+    def print_stages(self, conversion_types):
+        """Median and p95 of each recorded stage, to show where the time went"""
+        for conversion_type in conversion_types:
+            durations = defaultdict(list)
+            for stage, seconds in StageTiming.objects.filter(
+                    session__conversion_type=conversion_type).exclude(
+                    outcome__in=('error', 'cancelled')).values_list('stage', 'seconds'):
+                durations[stage].append(seconds)
+            if not durations:
+                continue
+            self.stdout.write(f"\n{conversion_type} stages (p50 / p95 seconds):")
+            for stage, values in sorted(durations.items(), key=lambda item: -percentile(item[1], 50)):
+                self.stdout.write(
+                    f"  {stage:<16} {percentile(values, 50):>7.3f} / {percentile(values, 95):.3f}")
+
+    def check_gates(self, reports, options):
+        problems = []
+        for report in reports:
+            failure_rate = 1 - report['outcomes'].get('completed', 0) / max(report['requests'], 1)
+            if options['max_failure_rate'] is not None and failure_rate > options['max_failure_rate']:
+                problems.append(f"{report['conversion_type']} failure rate {failure_rate:.1%}")
+            if options['max_p95'] is not None and (report['p95'] is None or report['p95'] > options['max_p95']):
+                problems.append(f"{report['conversion_type']} p95 {report['p95']}s")
+        if problems:
+            raise CommandError(f"Load test regression: {'; '.join(problems)}")
+        self.stdout.write(self.style.SUCCESS("\nLoad test finished"))
@@ -0,0 +1,32 @@
+from django.core.management.base import BaseCommand
+
+from app import retention
+
+
+class Command(BaseCommand):
+    help = 'Delete conversion files past the retention limits and report storage use per directory'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dry-run', action='store_true',
+            help='List what would be deleted without deleting anything')
+
+    def handle(self, *args, **options):
+        self.write_usage('Before')
+        result = retention.collect(dry_run=options['dry_run'])
+
+        for artifact in result['deleted']:
+            self.stdout.write(
+                f"  {'would delete' if options['dry_run'] else 'deleted'} {artifact['path']} "
+                f"({artifact['tier']}, {artifact['size']} bytes, {artifact['reason']})")
+
+        if options['dry_run']:
+            self.stdout.write(f"Would delete {retention.summary(result)}")
+            return
+        self.write_usage('After')
+        self.stdout.write(self.style.SUCCESS(f"Deleted {retention.summary(result)}"))
+
+    def write_usage(self, label):
+        self.stdout.write(f"{label}:")
+        for directory, (files, size) in retention.usage().items():
+            self.stdout.write(f"  {directory:<50} {files:>7} file(s) {size:>14} bytes")
@@ -0,0 +1,120 @@
+import asyncio
+import signal
+import threading
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from app import http_clients, jobs, metrics, retention, transcription
+
+
+class Command(BaseCommand):
+    help = 'Claim and run queued conversion jobs'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--concurrency', type=int,
+            help='Number of jobs to run at the same time (default: '
+                 'CONVERSION_WORKER_CONCURRENCY, or CONVERSION_WORKER_ASYNC_CONCURRENCY with --async)')
+        parser.add_argument(
+            '--poll-interval', type=float, default=settings.CONVERSION_WORKER_POLL_INTERVAL,
+            help='Seconds to wait before checking an empty queue again')
+        parser.add_argument(
+            '--lease-seconds', type=int, default=settings.CONVERSION_JOB_LEASE_SECONDS,
+            help='How long a claimed job stays reserved without a heartbeat')
+        parser.add_argument(
+            '--drain', action='store_true',
+            help='Exit once the queue is empty instead of waiting for new jobs')
+        parser.add_argument(
+            '--async', dest='use_async', action='store_true', default=settings.CONVERSION_WORKER_ASYNC,
+            help='Run jobs as asyncio tasks in one thread instead of one thread per job')
+
+    def handle(self, *args, **options):
+        if settings.WHISPER_PRELOAD:
+            transcription.preload()
+
+        # Apply the storage retention policy alongside the jobs, out of the
+        # web processes
+        pruner = None
+        if settings.RETENTION_INTERVAL_SECONDS > 0 and not options['drain']:
+            pruner = retention.RetentionThread(settings.RETENTION_INTERVAL_SECONDS)
+            pruner.start()
+
+        worker_id = jobs.default_worker_id()
+        try:
+            if options['use_async']:
+                self.run_async(worker_id, options)
+            else:
+                self.run_threads(worker_id, options)
+        finally:
+            if pruner is not None:
+                pruner.stop()
+
+        # Counts since the last finished job
+        metrics.save_connection_counts()
+        connections = http_clients.stats()
+        self.stdout.write(
+            f"HTTP: {connections['requests']} request(s) over {connections['connections']} "
+            f"connection(s), {connections['reused']} reused")
+        self.stdout.write(self.style.SUCCESS("Conversion workers stopped"))
+
+    def run_async(self, worker_id, options):
+        concurrency = max(options['concurrency'] or settings.CONVERSION_WORKER_ASYNC_CONCURRENCY, 1)
+        self.stdout.write(
+            f"Starting async conversion worker as {worker_id} ({concurrency} jobs at a time)")
+
+        async def main():
+            stop_event = asyncio.Event()
+
+            def request_stop():
+                self.stdout.write("Stopping after the current jobs finish...")
+                stop_event.set()
+
+            loop = asyncio.get_running_loop()
+            loop.add_signal_handler(signal.SIGINT, request_stop)
+            loop.add_signal_handler(signal.SIGTERM, request_stop)
+
+            await jobs.async_work_loop(
+                worker_id, stop_event,
+                concurrency=concurrency,
+                poll_interval=options['poll_interval'],
+                lease_seconds=options['lease_seconds'],
+                drain=options['drain'],
+            )
+            await http_clients.aclose()
+
+        asyncio.run(main())
+
+    def run_threads(self, worker_id, options):
+        stop_event = threading.Event()
+
+        def request_stop(signum, frame):
+            self.stdout.write("Stopping after the current jobs finish...")
+            stop_event.set()
+
+        signal.signal(signal.SIGINT, request_stop)
+        signal.signal(signal.SIGTERM, request_stop)
+
+        concurrency = max(options['concurrency'] or settings.CONVERSION_WORKER_CONCURRENCY, 1)
+        self.stdout.write(
+            f"Starting {concurrency} conversion worker(s) as {worker_id}")
+
+        threads = [
+            threading.Thread(
+                target=jobs.work_loop,
+                args=(f"{worker_id}:{i}", stop_event),
+                kwargs={
+                    'poll_interval': options['poll_interval'],
+                    'lease_seconds': options['lease_seconds'],
+                    'drain': options['drain'],
+                },
+                name=f"conversion-worker-{i}",
+            )
+            for i in range(concurrency)
+        ]
+        for thread in threads:
+            thread.start()
+        # Join with a timeout so the main thread stays responsive to signals
+        for thread in threads:
+            while thread.is_alive():
+                thread.join(timeout=1)
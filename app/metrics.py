@@ -0,0 +1,272 @@
+"""
+Per-stage conversion timings and their Prometheus export.
+
+Each conversion records how long its stages took (upload, cache lookup,
+queue wait, decode, Whisper, GPT-4o, DALL-E, download, TTS...) with a
+StageTimer. The records are saved as StageTiming rows of the session, so
+timings measured in queue workers, the web processes and streamed requests
+all end up in one place.
+
+Saving them also adds them to running totals, one StageTotal row per
+conversion type, stage, outcome and histogram bucket, and `render` builds
+the Prometheus histograms and counters for the /metrics endpoint from those
+rows alone. A scrape therefore reads a table of a few thousand rows at most
+however long the history, and every web process reports the same totals no
+matter which one is scraped. The totals stay monotonic when sessions, and
+with them their StageTiming rows, are deleted; they only restart if the
+StageTotal table itself is emptied.
+
+The same save adds this process's outbound HTTP request and connection
+counts (see app/http_clients.py) to the ConnectionTotal rows, so /metrics
+also shows how many API requests reused a pooled connection, wherever they
+were made.
+"""
+import asyncio
+import contextlib
+import math
+import time
+from collections import defaultdict
+
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F
+
+from . import http_clients
+from .models import ConnectionTotal, ConversionSession, StageTiming, StageTotal
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+SECONDS_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60, 120, 300)
+BYTES_BUCKETS = (1e4, 1e5, 5e5, 1e6, 5e6, 1e7, 2.5e7, 5e7, 1e8)
+
+# Stages that call an external model, and who provides it
+STAGE_PROVIDERS = {
+    'transcribe': 'whisper',
+    'describe': 'openai',
+    'generate_image': 'openai',
+    'download': 'openai',
+    'analyze': 'openai',
+    'tts': 'elevenlabs',
+}
+# Stages whose size is the conversion's input or output
+INPUT_STAGES = ('upload',)
+OUTPUT_STAGES = ('download', 'tts')
+
+
+class StageTimer:
+    """Collects the stage timings of one conversion"""
+
+    def __init__(self):
+        self.records = []
+        self.started = time.perf_counter()
+
+    @contextlib.contextmanager
+    def stage(self, name):
+        """
+        Time the block as stage `name`. The yielded record's `outcome` and
+        `size` can be set from inside the block; an exception marks the
+        stage as failed (or cancelled, when the client went away).
+        """
+        record = {'stage': name, 'seconds': 0.0, 'outcome': 'ok', 'size': None}
+        started = time.perf_counter()
+        try:
+            yield record
+        except (GeneratorExit, asyncio.CancelledError):
+            record['outcome'] = 'cancelled'
+            raise
+        except BaseException:
+            record['outcome'] = 'error'
+            raise
+        finally:
+            record['seconds'] = time.perf_counter() - started
+            self.records.append(record)
+
+    def add(self, name, seconds, outcome='ok', size=None):
+        """Record a stage timed elsewhere"""
+        self.records.append({'stage': name, 'seconds': seconds, 'outcome': outcome, 'size': size})
+
+    def elapsed(self):
+        """Seconds since the timer was created"""
+        return time.perf_counter() - self.started
+
+    def finish(self, outcome='ok', size=None):
+        """Record the whole conversion as stage 'total' and return all records"""
+        self.add('total', self.elapsed(), outcome, size)
+        return self.records
+
+
+def summary(records):
+    """One-line description of `records` for the log"""
+    return ', '.join(f"{record['stage']} {record['seconds']:.2f}s" for record in records)
+
+
+def _bucket(value, buckets):
+    """The exported upper bound of the bucket `value` falls in"""
+    return next((_format_bound(bound) for bound in buckets if value <= bound), '+Inf')
+
+
+def _totals(records):
+    """{(stage, outcome, measure, le): [count, total]} for `records`"""
+    totals = defaultdict(lambda: [0, 0.0])
+    for record in records:
+        measures = [('seconds', record['seconds'], SECONDS_BUCKETS)]
+        if record.get('size') is not None:
+            measures.append(('size', record['size'], BYTES_BUCKETS))
+        for measure, value, buckets in measures:
+            entry = totals[(record['stage'], record['outcome'], measure, _bucket(value, buckets))]
+            entry[0] += 1
+            entry[1] += value
+    return totals
+
+
+def _increment(model, key, count, **amounts):
+    """Add `count` (and `amounts`) to the `model` row identified by `key`, creating it if needed"""
+    increment = {'count': F('count') + count}
+    increment.update({field: F(field) + amount for field, amount in amounts.items()})
+    if model.objects.filter(**key).update(**increment):
+        return
+    try:
+        with transaction.atomic():
+            model.objects.create(**key, count=count, **amounts)
+    except IntegrityError:
+        # Another process created the row first
+        model.objects.filter(**key).update(**increment)
+
+
+def _add_totals(conversion_type, records):
+    """Add `records` to the StageTotal rows they fall in"""
+    for (stage, outcome, measure, le), (count, total) in sorted(_totals(records).items()):
+        _increment(
+            StageTotal, {'conversion_type': conversion_type, 'stage': stage, 'outcome': outcome,
+                         'measure': measure, 'le': le},
+            count, total=total)
+
+
+def save_connection_counts():
+    """Add this process's HTTP counts since the last save to the ConnectionTotal rows"""
+    for name, count in sorted(http_clients.take_unsaved().items()):
+        if count:
+            _increment(ConnectionTotal, {'name': name}, count)
+
+
+def save(session, records):
+    """Store stage timing records on `session` and add them to the totals"""
+    if records:
+        with transaction.atomic():
+            StageTiming.objects.bulk_create(
+                StageTiming(session=session, **record) for record in records)
+            _add_totals(session.conversion_type, records)
+            save_connection_counts()
+
+
+def percentile(values, percent):
+    """Nearest-rank percentile of `values`, or None when there are none"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[max(math.ceil(percent / 100 * len(ordered)) - 1, 0)]
+
+
+def _label_string(labels):
+    if not labels:
+        return ''
+    escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"') for value in labels.values())
+    return '{' + ','.join(f'{name}="{value}"' for name, value in zip(labels, escaped)) + '}'
+
+
+def _format_bound(bound):
+    return f"{bound:g}" if isinstance(bound, float) else str(bound)
+
+
+def _histogram(lines, name, help_text, totals, buckets, labels):
+    """Append a histogram of the StageTotal rows `totals`, grouped by the `labels` fields"""
+    groups = defaultdict(list)
+    for row in totals:
+        groups[tuple(getattr(row, field_name) for field_name in labels.values())].append(row)
+
+    lines.append(f"# HELP {name} {help_text}")
+    lines.append(f"# TYPE {name} histogram")
+    for key in sorted(groups):
+        rows = groups[key]
+        label_values = dict(zip(labels, key))
+        for bound in buckets:
+            count = sum(row.count for row in rows if float(row.le) <= bound)
+            lines.append(f"{name}_bucket{_label_string({**label_values, 'le': _format_bound(bound)})} {count}")
+        count = sum(row.count for row in rows)
+        lines.append(f"{name}_bucket{_label_string({**label_values, 'le': '+Inf'})} {count}")
+        lines.append(f"{name}_sum{_label_string(label_values)} {sum(row.total for row in rows)}")
+        lines.append(f"{name}_count{_label_string(label_values)} {count}")
+
+
+def _counts(totals, labels):
+    """(labels, count) pairs summing the StageTotal rows `totals` by the `labels` fields"""
+    counts = defaultdict(int)
+    for row in totals:
+        counts[tuple(getattr(row, field_name) for field_name in labels.values())] += row.count
+    return ((dict(zip(labels, key)), counts[key]) for key in sorted(counts))
+
+
+def _samples(lines, name, metric_type, help_text, rows):
+    """Append a counter or gauge from (labels, value) pairs"""
+    lines.append(f"# HELP {name} {help_text}")
+    lines.append(f"# TYPE {name} {metric_type}")
+    for labels, value in rows:
+        lines.append(f"{name}{_label_string(labels)} {value}")
+
+
+def render():
+    """All metrics in the Prometheus text exposition format"""
+    lines = []
+    totals = list(StageTotal.objects.all())
+    seconds = [row for row in totals if row.measure == 'seconds']
+    sizes = [row for row in totals if row.measure == 'size']
+    conversion_type = {'conversion_type': 'conversion_type'}
+
+    _histogram(
+        lines, 'conversion_stage_duration_seconds',
+        'Time spent in each stage of a conversion.',
+        [row for row in seconds if row.stage != 'queue_wait'], SECONDS_BUCKETS,
+        {**conversion_type, 'stage': 'stage', 'outcome': 'outcome'})
+    _histogram(
+        lines, 'conversion_queue_wait_seconds',
+        'Time from enqueueing a conversion until a worker claimed it.',
+        [row for row in seconds if row.stage == 'queue_wait'], SECONDS_BUCKETS, conversion_type)
+    _histogram(
+        lines, 'conversion_input_bytes', 'Size of conversion inputs.',
+        [row for row in sizes if row.stage in INPUT_STAGES], BYTES_BUCKETS, conversion_type)
+    _histogram(
+        lines, 'conversion_output_bytes', 'Size of generated outputs.',
+        [row for row in sizes if row.stage in OUTPUT_STAGES and row.outcome == 'ok'],
+        BYTES_BUCKETS, conversion_type)
+
+    _samples(
+        lines, 'conversion_cache_lookups_total', 'counter',
+        'Result cache lookups by outcome (hit, near_duplicate or miss).',
+        _counts([row for row in seconds if row.stage == 'cache_lookup'],
+                {**conversion_type, 'outcome': 'outcome'}))
+
+    _samples(
+        lines, 'conversion_provider_errors_total', 'counter',
+        'Failed calls to the transcription, OpenAI and ElevenLabs models.',
+        (({'provider': STAGE_PROVIDERS[labels['stage']], **labels}, count) for labels, count in _counts(
+            [row for row in seconds if row.stage in STAGE_PROVIDERS and row.outcome == 'error'],
+            {'stage': 'stage'})))
+
+    connections = dict(ConnectionTotal.objects.values_list('name', 'count'))
+    requests, new = connections.get('requests', 0), connections.get('connections', 0)
+    _samples(
+        lines, 'http_client_requests_total', 'counter',
+        'Outbound API requests by whether they opened a new connection or reused a pooled one.',
+        [({'connection': 'new'}, new), ({'connection': 'reused'}, max(requests - new, 0))])
+    _samples(
+        lines, 'http_client_tls_handshakes_total', 'counter',
+        'TLS handshakes made by outbound API requests.',
+        [({}, connections.get('tls_handshakes', 0))])
+
+    statuses = ConversionSession.objects.values(
+        'conversion_type', 'processing_status').annotate(total=Count('pk')).order_by()
+    _samples(
+        lines, 'conversion_sessions', 'gauge', 'Conversion sessions by status.',
+        (({'conversion_type': row['conversion_type'], 'status': row['processing_status']}, row['total'])
+         for row in statuses))
+
+    return '\n'.join(lines) + '\n'
@@ -0,0 +1,63 @@
+# Generated by Django 4.2.13 on 2026-10-18 14:55
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0002_conversionsession_audiorecording'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='conversionsession',
+            name='attempts',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='conversionsession',
+            name='description_style',
+            field=models.TextField(blank=True),
+        ),
+        migrations.AddField(
+            model_name='conversionsession',
+            name='heartbeat_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='conversionsession',
+            name='image_description',
+            field=models.TextField(blank=True),
+        ),
+        migrations.AddField(
+            model_name='conversionsession',
+            name='lease_expires_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='conversionsession',
+            name='started_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='conversionsession',
+            name='transcription',
+            field=models.TextField(blank=True),
+        ),
+        migrations.AddField(
+            model_name='conversionsession',
+            name='voice_preference',
+            field=models.CharField(blank=True, max_length=100),
+        ),
+        migrations.AddField(
+            model_name='conversionsession',
+            name='worker_id',
+            field=models.CharField(blank=True, max_length=100),
+        ),
+        migrations.AlterField(
+            model_name='conversionsession',
+            name='processing_status',
+            field=models.CharField(choices=[('pending', 'Pending'), ('processing', 'Processing'), ('completed', 'Completed'), ('failed', 'Failed')], default='pending', max_length=20),
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 4.2.13 on 2026-10-18 14:59
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0004_result_cache_entry'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ImageFingerprint',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('phash', models.BigIntegerField()),
+                ('band0', models.PositiveIntegerField()),
+                ('band1', models.PositiveIntegerField()),
+                ('band2', models.PositiveIntegerField()),
+                ('band3', models.PositiveIntegerField()),
+                ('session', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='fingerprint', to='app.conversionsession')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['band0', 'phash', 'session'], name='fingerprint_band0_idx'), models.Index(fields=['band1', 'phash', 'session'], name='fingerprint_band1_idx'), models.Index(fields=['band2', 'phash', 'session'], name='fingerprint_band2_idx'), models.Index(fields=['band3', 'phash', 'session'], name='fingerprint_band3_idx')],
+            },
+        ),
+    ]
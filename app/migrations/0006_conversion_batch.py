@@ -0,0 +1,40 @@
+# Generated by Django 4.2.13 on 2026-10-18 15:09
+
+from django.db import migrations, models
+import django.db.models.deletion
+import uuid
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0005_image_fingerprint'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ConversionBatch',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('batch_id', models.UUIDField(default=uuid.uuid4, editable=False, unique=True)),
+                ('conversion_type', models.CharField(choices=[('audio_to_image', 'Audio to Image'), ('image_to_audio', 'Image to Audio')], max_length=20)),
+                ('item_count', models.PositiveIntegerField(default=0)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='conversionsession',
+            name='batch_index',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='conversionsession',
+            name='original_filename',
+            field=models.CharField(blank=True, max_length=255),
+        ),
+        migrations.AddField(
+            model_name='conversionsession',
+            name='batch',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='items', to='app.conversionbatch'),
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 4.2.13 on 2026-10-18 15:24
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0006_conversion_batch'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StageTiming',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('stage', models.CharField(max_length=30)),
+                ('seconds', models.FloatField()),
+                ('outcome', models.CharField(default='ok', max_length=20)),
+                ('size', models.PositiveBigIntegerField(blank=True, null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('session', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='stage_timings', to='app.conversionsession')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['stage', 'outcome'], name='stage_timing_stage_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,41 @@
+# Generated by Django 4.2.13 on 2026-10-18 15:46
+
+from django.db import migrations, models
+import django.db.models.deletion
+import uuid
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0008_recording_upload'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='conversionsession',
+            name='batch',
+            field=models.ForeignKey(blank=True, db_index=False, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='items', to='app.conversionbatch'),
+        ),
+        migrations.AlterField(
+            model_name='conversionsession',
+            name='session_id',
+            field=models.UUIDField(default=uuid.uuid4, editable=False, unique=True),
+        ),
+        migrations.AddIndex(
+            model_name='conversionsession',
+            index=models.Index(fields=['processing_status', 'created_at'], name='session_status_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='conversionsession',
+            index=models.Index(fields=['created_at', 'id'], name='session_history_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='conversionsession',
+            index=models.Index(fields=['conversion_type', 'processing_status'], name='session_type_status_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='conversionsession',
+            index=models.Index(fields=['batch', 'batch_index'], name='session_batch_idx'),
+        ),
+    ]
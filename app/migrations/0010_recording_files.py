@@ -0,0 +1,35 @@
+# Generated by Django 4.2.13 on 2026-10-18 16:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0009_session_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='audiorecording',
+            name='audio_file',
+            field=models.FileField(default='', max_length=255, upload_to='recordings/'),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name='audiorecording',
+            name='size',
+            field=models.PositiveBigIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='audiorecording',
+            name='sha256',
+            field=models.CharField(db_index=True, default='', max_length=64),
+            preserve_default=False,
+        ),
+        migrations.AlterField(
+            model_name='audiorecording',
+            name='created_at',
+            field=models.DateTimeField(auto_now_add=True, db_index=True),
+        ),
+    ]
@@ -0,0 +1,87 @@
+"""
+Move each AudioRecording's audio_data blob to a content-addressed file.
+
+Rows are moved in batches, each committed on its own, so a large table
+never sits in memory or in one transaction. A row counts as moved once its
+sha256 is set, so an interrupted migration picks up where it stopped.
+
+The file layout is written out here rather than imported from the app, so
+the migration keeps doing the same thing when the app changes.
+"""
+import hashlib
+import os
+import tempfile
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.db import migrations, transaction
+
+BATCH_SIZE = 50
+RECORDINGS_DIR = 'recordings'
+
+
+def store_blob(data):
+    """Write `data` to recordings/<sha[:2]>/<sha> under MEDIA_ROOT; returns (name, sha256)"""
+    sha256 = hashlib.sha256(data).hexdigest()
+    name = f"{RECORDINGS_DIR}/{sha256[:2]}/{sha256}"
+    path = os.path.join(settings.MEDIA_ROOT, name)
+    if os.path.exists(path):
+        return name, sha256
+
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    fd, partial_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.part')
+    try:
+        with os.fdopen(fd, 'wb') as partial_file:
+            partial_file.write(data)
+        os.replace(partial_path, path)
+    except BaseException:
+        if os.path.exists(partial_path):
+            os.unlink(partial_path)
+        raise
+    return name, sha256
+
+
+def move_blobs(apps, schema_editor):
+    AudioRecording = apps.get_model('app', 'AudioRecording')
+    alias = schema_editor.connection.alias
+    pending = AudioRecording.objects.using(alias).filter(sha256='').order_by('pk')
+
+    while True:
+        batch = list(pending.values_list('pk', 'audio_data')[:BATCH_SIZE])
+        if not batch:
+            return
+        with transaction.atomic(using=alias):
+            for pk, audio_data in batch:
+                audio_data = bytes(audio_data or b'')
+                name, sha256 = store_blob(audio_data)
+                AudioRecording.objects.using(alias).filter(pk=pk).update(
+                    audio_file=name, size=len(audio_data), sha256=sha256)
+
+
+def restore_blobs(apps, schema_editor):
+    AudioRecording = apps.get_model('app', 'AudioRecording')
+    alias = schema_editor.connection.alias
+    moved = AudioRecording.objects.using(alias).exclude(sha256='').order_by('pk')
+
+    while True:
+        batch = list(moved.values_list('pk', 'audio_file')[:BATCH_SIZE])
+        if not batch:
+            return
+        with transaction.atomic(using=alias):
+            for pk, name in batch:
+                with default_storage.open(name, 'rb') as audio_file:
+                    audio_data = audio_file.read()
+                AudioRecording.objects.using(alias).filter(pk=pk).update(
+                    audio_data=audio_data, audio_file='', size=0, sha256='')
+
+
+class Migration(migrations.Migration):
+    atomic = False
+
+    dependencies = [
+        ('app', '0010_recording_files'),
+    ]
+
+    operations = [
+        migrations.RunPython(move_blobs, restore_blobs),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 4.2.13 on 2026-10-18 16:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0011_move_recording_blobs'),
+    ]
+
+    operations = [
+        # A default lets the column be added back when unapplying
+        migrations.AlterField(
+            model_name='audiorecording',
+            name='audio_data',
+            field=models.BinaryField(default=b''),
+        ),
+        migrations.RemoveField(
+            model_name='audiorecording',
+            name='audio_data',
+        ),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 4.2.13 on 2026-10-18 16:25
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0012_remove_audiorecording_audio_data'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='conversionsession',
+            name='session_type_status_idx',
+        ),
+        migrations.AddIndex(
+            model_name='conversionsession',
+            index=models.Index(fields=['conversion_type', 'created_at'], name='session_type_history_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='conversionsession',
+            index=models.Index(fields=['conversion_type', 'processing_status', 'created_at'], name='session_type_status_idx'),
+        ),
+    ]
@@ -0,0 +1,72 @@
+"""
+Add the running StageTotal rows /metrics is rendered from, seeded with the
+StageTiming rows recorded so far.
+
+The buckets are written out here rather than taken from app/metrics.py, so
+the migration keeps doing the same thing when that module changes.
+"""
+from collections import defaultdict
+
+from django.db import migrations, models
+
+SECONDS_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60, 120, 300)
+BYTES_BUCKETS = (1e4, 1e5, 5e5, 1e6, 5e6, 1e7, 2.5e7, 5e7, 1e8)
+BATCH_SIZE = 5000
+
+
+def bucket(value, buckets):
+    for bound in buckets:
+        if value <= bound:
+            return f"{bound:g}" if isinstance(bound, float) else str(bound)
+    return '+Inf'
+
+
+def add_totals(apps, schema_editor):
+    StageTiming = apps.get_model('app', 'StageTiming')
+    StageTotal = apps.get_model('app', 'StageTotal')
+    alias = schema_editor.connection.alias
+
+    totals = defaultdict(lambda: [0, 0.0])
+    timings = StageTiming.objects.using(alias).values_list(
+        'session__conversion_type', 'stage', 'outcome', 'seconds', 'size')
+    for conversion_type, stage, outcome, seconds, size in timings.iterator(chunk_size=BATCH_SIZE):
+        measures = [('seconds', seconds, SECONDS_BUCKETS)]
+        if size is not None:
+            measures.append(('size', size, BYTES_BUCKETS))
+        for measure, value, buckets in measures:
+            entry = totals[(conversion_type, stage, outcome, measure, bucket(value, buckets))]
+            entry[0] += 1
+            entry[1] += value
+
+    StageTotal.objects.using(alias).bulk_create(
+        StageTotal(conversion_type=conversion_type, stage=stage, outcome=outcome,
+                   measure=measure, le=le, count=count, total=total)
+        for (conversion_type, stage, outcome, measure, le), (count, total) in totals.items())
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0013_history_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StageTotal',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('conversion_type', models.CharField(max_length=20)),
+                ('stage', models.CharField(max_length=30)),
+                ('outcome', models.CharField(max_length=20)),
+                ('measure', models.CharField(max_length=10)),
+                ('le', models.CharField(max_length=20)),
+                ('count', models.PositiveBigIntegerField(default=0)),
+                ('total', models.FloatField(default=0.0)),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='stagetotal',
+            constraint=models.UniqueConstraint(fields=('conversion_type', 'stage', 'outcome', 'measure', 'le'), name='stage_total_unique'),
+        ),
+        migrations.RunPython(add_totals, migrations.RunPython.noop),
+    ]
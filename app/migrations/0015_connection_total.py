@@ -0,0 +1,21 @@
+# Generated by Django 4.2.13 on 2026-10-18 16:31
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0014_stage_total'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ConnectionTotal',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=20, unique=True)),
+                ('count', models.PositiveBigIntegerField(default=0)),
+            ],
+        ),
+    ]
@@ -0,0 +1,50 @@
+# Generated by Django 4.2.13 on 2026-10-18 16:32
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0015_connection_total'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='imagefingerprint',
+            name='fingerprint_band0_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='imagefingerprint',
+            name='fingerprint_band1_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='imagefingerprint',
+            name='fingerprint_band2_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='imagefingerprint',
+            name='fingerprint_band3_idx',
+        ),
+        migrations.AddField(
+            model_name='imagefingerprint',
+            name='options_key',
+            field=models.CharField(blank=True, max_length=64),
+        ),
+        migrations.AddIndex(
+            model_name='imagefingerprint',
+            index=models.Index(fields=['options_key', 'band0', 'phash', 'session'], name='fingerprint_band0_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='imagefingerprint',
+            index=models.Index(fields=['options_key', 'band1', 'phash', 'session'], name='fingerprint_band1_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='imagefingerprint',
+            index=models.Index(fields=['options_key', 'band2', 'phash', 'session'], name='fingerprint_band2_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='imagefingerprint',
+            index=models.Index(fields=['options_key', 'band3', 'phash', 'session'], name='fingerprint_band3_idx'),
+        ),
+    ]
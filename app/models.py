@@ -1,4 +1,5 @@
 from django.db import models
+from django.utils import timezone
 import uuid
 
 # Image Upload Model
@@ -27,29 +28,230 @@ class ConversionSession(models.Model):
         ('image_to_audio', 'Image to Audio'),
     ]
 
-    session_id = models.UUIDField(default=uuid.uuid4, editable=False)
+    STATUS_CHOICES = [
+        ('pending', 'Pending'),
+        ('processing', 'Processing'),
+        ('completed', 'Completed'),
+        ('failed', 'Failed'),
+    ]
+
+    session_id = models.UUIDField(default=uuid.uuid4, editable=False, unique=True)
     conversion_type = models.CharField(max_length=20, choices=CONVERSION_TYPES)
     input_file = models.FileField(upload_to='uploads/')
     description_prompt = models.TextField(blank=True, null=True)
     output_file = models.FileField(upload_to='outputs/', blank=True, null=True)
     ai_model_used = models.CharField(max_length=50, blank=True)
-    processing_status = models.CharField(max_length=20, default='pending')
+    processing_status = models.CharField(
+        max_length=20, choices=STATUS_CHOICES, default='pending')
     error_message = models.TextField(blank=True, null=True)
     created_at = models.DateTimeField(auto_now_add=True)
     completed_at = models.DateTimeField(blank=True, null=True)
 
+    # Conversion options, kept so a worker can run the job later
+    voice_preference = models.CharField(max_length=100, blank=True)
+    description_style = models.TextField(blank=True)
+
+    # Conversion results
+    transcription = models.TextField(blank=True)
+    image_description = models.TextField(blank=True)
+
+    # Job queue bookkeeping
+    attempts = models.PositiveIntegerField(default=0)
+    worker_id = models.CharField(max_length=100, blank=True)
+    started_at = models.DateTimeField(blank=True, null=True)
+    heartbeat_at = models.DateTimeField(blank=True, null=True)
+    lease_expires_at = models.DateTimeField(blank=True, null=True)
+
+    # Hash of the input bytes, options and models (see app/result_cache.py)
+    cache_key = models.CharField(max_length=64, blank=True, db_index=True)
+
+    # Batch membership (see app/batches.py)
+    # Indexed by session_batch_idx
+    batch = models.ForeignKey(
+        'ConversionBatch', on_delete=models.CASCADE, related_name='items',
+        blank=True, null=True, db_index=False)
+    batch_index = models.PositiveIntegerField(blank=True, null=True)
+    original_filename = models.CharField(max_length=255, blank=True)
+
+    class Meta:
+        indexes = [
+            # Job claims (oldest pending first), the admin's status filter and
+            # history by status
+            models.Index(fields=['processing_status', 'created_at'], name='session_status_idx'),
+            # History, newest first, with id to break ties between pages
+            models.Index(fields=['created_at', 'id'], name='session_history_idx'),
+            # History by type
+            models.Index(fields=['conversion_type', 'created_at'], name='session_type_history_idx'),
+            # History by type and status, and the per type and status counts
+            # for /metrics, answered from the index
+            models.Index(fields=['conversion_type', 'processing_status', 'created_at'],
+                         name='session_type_status_idx'),
+            # Batch items in upload order
+            models.Index(fields=['batch', 'batch_index'], name='session_batch_idx'),
+        ]
+
     def __str__(self):
         return f"{self.conversion_type} - {self.session_id}"
 
+# Stage Timing Model
+
+
+class StageTiming(models.Model):
+    """How long one stage of a conversion took (see app/metrics.py)"""
+    session = models.ForeignKey(
+        ConversionSession, on_delete=models.CASCADE, related_name='stage_timings')
+    stage = models.CharField(max_length=30)
+    seconds = models.FloatField()
+    # ok, error or cancelled; hit, near_duplicate or miss for cache lookups
+    outcome = models.CharField(max_length=20, default='ok')
+    # Bytes handled by the stage, where that is meaningful (upload, output)
+    size = models.PositiveBigIntegerField(blank=True, null=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [models.Index(fields=['stage', 'outcome'], name='stage_timing_stage_idx')]
+
+    def __str__(self):
+        return f"{self.stage} {self.seconds:.3f}s for {self.session.session_id}"
+
+# Stage Total Model
+
+
+class StageTotal(models.Model):
+    """
+    Running totals of the StageTiming rows that fell in one histogram bucket
+    of a stage, outcome and measure; /metrics is rendered from these (see
+    app/metrics.py)
+    """
+    conversion_type = models.CharField(max_length=20)
+    stage = models.CharField(max_length=30)
+    outcome = models.CharField(max_length=20)
+    # 'seconds' or 'size'
+    measure = models.CharField(max_length=10)
+    # Upper bound of the bucket as exported, '+Inf' for the last one
+    le = models.CharField(max_length=20)
+    count = models.PositiveBigIntegerField(default=0)
+    total = models.FloatField(default=0.0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['conversion_type', 'stage', 'outcome', 'measure', 'le'],
+                name='stage_total_unique'),
+        ]
+
+    def __str__(self):
+        return f"{self.conversion_type} {self.stage} {self.outcome} {self.measure} <= {self.le}: {self.count}"
+
+# Connection Total Model
+
+
+class ConnectionTotal(models.Model):
+    """
+    Running count of outbound HTTP requests, new connections or TLS
+    handshakes across every process (see app/http_clients.py)
+    """
+    name = models.CharField(max_length=20, unique=True)
+    count = models.PositiveBigIntegerField(default=0)
+
+    def __str__(self):
+        return f"{self.name}: {self.count}"
+
+# Conversion Batch Model
+
+
+class ConversionBatch(models.Model):
+    """A group of conversions uploaded together; each item is a ConversionSession"""
+    batch_id = models.UUIDField(default=uuid.uuid4, editable=False, unique=True)
+    conversion_type = models.CharField(
+        max_length=20, choices=ConversionSession.CONVERSION_TYPES)
+    item_count = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.conversion_type} batch - {self.batch_id}"
+
+# Recording Upload Model
+
+
+class RecordingUpload(models.Model):
+    """
+    A recording being uploaded in chunks, possibly while it is still being
+    recorded. The bytes live in a partial file (see app/uploads.py).
+    """
+    upload_id = models.UUIDField(default=uuid.uuid4, editable=False, unique=True)
+    content_type = models.CharField(max_length=100, blank=True)
+    received_bytes = models.PositiveBigIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(default=timezone.now, db_index=True)
+
+    def __str__(self):
+        return f"Upload {self.upload_id} ({self.received_bytes} bytes)"
+
 # Audio Recording Model
 
 
 class AudioRecording(models.Model):
+    """
+    A recording kept with a session. The audio is a file under
+    MEDIA_ROOT/recordings named by its SHA-256 (the layout migration 0011
+    moved the old audio_data blobs to); the row only says where it is and
+    what it holds.
+    """
     session = models.ForeignKey(
         ConversionSession, on_delete=models.CASCADE, related_name='recordings')
-    audio_data = models.BinaryField()
+    audio_file = models.FileField(upload_to='recordings/', max_length=255)
+    size = models.PositiveBigIntegerField(default=0)
+    sha256 = models.CharField(max_length=64, db_index=True)
     duration = models.FloatField(default=0.0)
-    created_at = models.DateTimeField(auto_now_add=True)
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
 
     def __str__(self):
         return f"Recording for {self.session.session_id}"
+
+# Result Cache Entry Model
+
+
+class ResultCacheEntry(models.Model):
+    cache_key = models.CharField(max_length=64, unique=True)
+    session = models.ForeignKey(
+        ConversionSession, on_delete=models.CASCADE, related_name='cache_entries')
+    hits = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
+    last_used_at = models.DateTimeField(default=timezone.now, db_index=True)
+
+    def __str__(self):
+        return f"{self.cache_key[:12]} -> {self.session.session_id}"
+
+# Image Fingerprint Model
+
+
+class ImageFingerprint(models.Model):
+    """
+    Perceptual hash of an image_to_audio input, split into four 16-bit bands
+    for multi-index Hamming search (see app/image_index.py)
+    """
+    session = models.OneToOneField(
+        ConversionSession, on_delete=models.CASCADE, related_name='fingerprint')
+    # result_cache.options_key of the conversion; only conversions made with
+    # the same options and models are reused
+    options_key = models.CharField(max_length=64, blank=True)
+    phash = models.BigIntegerField()
+    band0 = models.PositiveIntegerField()
+    band1 = models.PositiveIntegerField()
+    band2 = models.PositiveIntegerField()
+    band3 = models.PositiveIntegerField()
+
+    class Meta:
+        # Each band index leads with the options key and also covers the full
+        # hash and session so candidate lookups never have to touch the table
+        # itself
+        indexes = [
+            models.Index(fields=['options_key', 'band0', 'phash', 'session'], name='fingerprint_band0_idx'),
+            models.Index(fields=['options_key', 'band1', 'phash', 'session'], name='fingerprint_band1_idx'),
+            models.Index(fields=['options_key', 'band2', 'phash', 'session'], name='fingerprint_band2_idx'),
+            models.Index(fields=['options_key', 'band3', 'phash', 'session'], name='fingerprint_band3_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.phash & 0xFFFFFFFFFFFFFFFF:016x} for {self.session.session_id}"
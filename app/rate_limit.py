@@ -0,0 +1,205 @@
+"""
+Rate limiting and retries for the AI APIs, shared by every process.
+
+Each API endpoint (chat, images, tts) has a token bucket refilled at its
+RATE_LIMITS budget. Bucket state lives in a small SQLite file
+(RATE_LIMIT_DB_PATH), so all gunicorn workers and queue workers on the host
+draw from the same budget without an external service. Taking a token is a
+reservation: the bucket may go negative and the caller sleeps until its
+token is due, which keeps callers in arrival order.
+
+`call` wraps an API call with the limiter and retries transient failures
+with jittered exponential backoff. A 429 honours Retry-After and pauses the
+endpoint's bucket for every process, so a burst of callers does not keep
+hitting a provider that has asked them to slow down.
+"""
+import asyncio
+import random
+import sqlite3
+import threading
+import time
+
+import httpx
+import openai
+from django.conf import settings
+
+_local = threading.local()
+
+
+class RateLimitExceeded(RuntimeError):
+    """Waiting for an API budget would take longer than RATE_LIMIT_MAX_WAIT"""
+
+
+def _connection():
+    """This thread's connection to the bucket database"""
+    connection = getattr(_local, 'connection', None)
+    if connection is None:
+        connection = sqlite3.connect(
+            settings.RATE_LIMIT_DB_PATH, timeout=30, isolation_level=None)
+        connection.execute('PRAGMA journal_mode=WAL')
+        connection.execute(
+            'CREATE TABLE IF NOT EXISTS buckets ('
+            'name TEXT PRIMARY KEY, tokens REAL NOT NULL, updated_at REAL NOT NULL, '
+            'blocked_until REAL NOT NULL DEFAULT 0)')
+        _local.connection = connection
+    return connection
+
+
+def _rate(bucket):
+    """Tokens per second for `bucket`"""
+    return settings.RATE_LIMITS[bucket] / 60.0
+
+
+def _capacity(bucket):
+    return max(_rate(bucket) * settings.RATE_LIMIT_BURST_SECONDS, 1.0)
+
+
+def reserve(bucket):
+    """
+    Take a token from `bucket` and return how many seconds to wait before
+    using it. Raises RateLimitExceeded (without taking the token) if that
+    would be longer than RATE_LIMIT_MAX_WAIT.
+    """
+    if not settings.RATE_LIMIT_ENABLED:
+        return 0.0
+
+    rate, capacity = _rate(bucket), _capacity(bucket)
+    connection = _connection()
+    connection.execute('BEGIN IMMEDIATE')
+    try:
+        now = time.time()
+        row = connection.execute(
+            'SELECT tokens, updated_at, blocked_until FROM buckets WHERE name = ?',
+            (bucket,)).fetchone()
+        tokens, updated_at, blocked_until = row if row else (capacity, now, 0.0)
+
+        tokens = min(capacity, tokens + max(now - updated_at, 0) * rate) - 1
+        wait = max(0.0, -tokens / rate, blocked_until - now)
+        if wait > settings.RATE_LIMIT_MAX_WAIT:
+            raise RateLimitExceeded(
+                f"Rate limit for {bucket} requests reached; try again in {wait:.0f} seconds")
+
+        connection.execute(
+            'INSERT INTO buckets (name, tokens, updated_at, blocked_until) VALUES (?, ?, ?, ?) '
+            'ON CONFLICT(name) DO UPDATE SET tokens = excluded.tokens, updated_at = excluded.updated_at',
+            (bucket, tokens, now, blocked_until))
+        connection.execute('COMMIT')
+    except BaseException:
+        connection.execute('ROLLBACK')
+        raise
+
+    return wait
+
+
+def pause(bucket, seconds):
+    """Stop every process from using `bucket` for `seconds`"""
+    if not settings.RATE_LIMIT_ENABLED:
+        return
+    connection = _connection()
+    until = time.time() + seconds
+    connection.execute(
+        'INSERT INTO buckets (name, tokens, updated_at, blocked_until) VALUES (?, 0, ?, ?) '
+        'ON CONFLICT(name) DO UPDATE SET blocked_until = MAX(blocked_until, excluded.blocked_until)',
+        (bucket, time.time(), until))
+
+
+def acquire(bucket):
+    """Block until a `bucket` request may be sent"""
+    wait = reserve(bucket)
+    if wait:
+        time.sleep(wait)
+
+
+async def acquire_async(bucket):
+    wait = await asyncio.to_thread(reserve, bucket)
+    if wait:
+        await asyncio.sleep(wait)
+
+
+def _status_code(error):
+    if isinstance(error, openai.APIStatusError):
+        return error.status_code
+    if isinstance(error, httpx.HTTPStatusError):
+        return error.response.status_code
+    return None
+
+
+def _retry_after(error):
+    """Seconds the provider asked us to wait, if it said"""
+    response = getattr(error, 'response', None)
+    if response is None:
+        return None
+    try:
+        if 'retry-after-ms' in response.headers:
+            return float(response.headers['retry-after-ms']) / 1000
+        if 'retry-after' in response.headers:
+            return float(response.headers['retry-after'])
+    except ValueError:
+        pass
+    return None
+
+
+def is_retryable(error):
+    """Transient failures: timeouts, dropped connections, 408/409/429 and 5xx"""
+    if isinstance(error, openai.RateLimitError) and error.code == 'insufficient_quota':
+        # Out of credit; retrying will not help
+        return False
+    if isinstance(error, (openai.APIConnectionError, httpx.TransportError)):
+        return True
+    status_code = _status_code(error)
+    return status_code is not None and (status_code in (408, 409, 429) or status_code >= 500)
+
+
+def backoff(attempt, retry_after=None):
+    """
+    Delay before retry number `attempt` (from 0): Retry-After when given,
+    capped only by RATE_LIMIT_MAX_WAIT, else "full jitter" exponential
+    backoff of at most API_BACKOFF_MAX
+    """
+    jitter = random.uniform(0, settings.API_BACKOFF_BASE)
+    if retry_after is not None:
+        # Retrying before the provider said to only earns another 429
+        return min(retry_after + jitter, settings.RATE_LIMIT_MAX_WAIT)
+    return random.uniform(0, min(settings.API_BACKOFF_MAX, settings.API_BACKOFF_BASE * 2 ** attempt))
+
+
+def _failed(bucket, error, attempt):
+    """Delay before retrying `error`, or None to give up"""
+    if attempt >= settings.API_MAX_RETRIES or not is_retryable(error):
+        return None
+    retry_after = _retry_after(error)
+    delay = backoff(attempt, retry_after)
+    if _status_code(error) == 429:
+        pause(bucket, delay)
+    print(f"{bucket} request failed ({error}); retrying in {delay:.1f}s")
+    return delay
+
+
+def call(bucket, func, *args, **kwargs):
+    """Call `func` within `bucket`'s budget, retrying transient failures"""
+    attempt = 0
+    while True:
+        acquire(bucket)
+        try:
+            return func(*args, **kwargs)
+        except Exception as e:
+            delay = _failed(bucket, e, attempt)
+            if delay is None:
+                raise
+        time.sleep(delay)
+        attempt += 1
+
+
+async def call_async(bucket, func, *args, **kwargs):
+    """`call` for coroutine functions"""
+    attempt = 0
+    while True:
+        await acquire_async(bucket)
+        try:
+            return await func(*args, **kwargs)
+        except Exception as e:
+            delay = await asyncio.to_thread(_failed, bucket, e, attempt)
+            if delay is None:
+                raise
+        await asyncio.sleep(delay)
+        attempt += 1
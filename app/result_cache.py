@@ -0,0 +1,116 @@
+"""
+Content-addressed cache of finished conversions.
+
+The key is a SHA-256 over the input bytes, the user's options and the model
+identifiers from `convert.model_identifiers`. A hit reuses the output and
+metadata of an earlier ConversionSession without calling any model. Entries
+expire after RESULT_CACHE_TTL_SECONDS, and the least recently used ones are
+evicted once there are more than RESULT_CACHE_MAX_ENTRIES.
+"""
+import hashlib
+import json
+import os
+from datetime import timedelta
+
+from django.conf import settings
+from django.utils import timezone
+from django.db import IntegrityError, transaction
+from django.db.models import F
+
+from . import convert
+from .models import ResultCacheEntry
+
+def hash_upload(uploaded_file):
+    """
+    SHA-256 of an uploaded file, read chunk by chunk unless the upload
+    handlers already hashed it on the way in (see app/uploads.py)
+    """
+    if getattr(uploaded_file, 'sha256', None):
+        return uploaded_file.sha256
+    digest = hashlib.sha256()
+    for chunk in uploaded_file.chunks():
+        digest.update(chunk)
+    uploaded_file.seek(0)
+    return digest.hexdigest()
+
+
+def _digest(material):
+    return hashlib.sha256(json.dumps(material, sort_keys=True).encode('utf-8')).hexdigest()
+
+
+def cache_key(conversion_type, input_hash, **options):
+    """Combine the input hash, conversion options and models into one key"""
+    return _digest({
+        'conversion_type': conversion_type,
+        'input': input_hash,
+        'options': options,
+        'models': convert.model_identifiers(conversion_type),
+    })
+
+
+def options_key(conversion_type, **options):
+    """
+    The part of `cache_key` that does not depend on the input: the same for
+    any two conversions made with the same options and models
+    """
+    return _digest({
+        'conversion_type': conversion_type,
+        'options': options,
+        'models': convert.model_identifiers(conversion_type),
+    })
+
+
+def lookup(key):
+    """
+    Return the completed ConversionSession cached under `key`, or None.
+    Entries whose output has disappeared are dropped.
+    """
+    if not settings.RESULT_CACHE_ENABLED or not key:
+        return None
+
+    expires_before = timezone.now() - timedelta(seconds=settings.RESULT_CACHE_TTL_SECONDS)
+    entry = ResultCacheEntry.objects.select_related('session').filter(
+        cache_key=key, created_at__gte=expires_before).first()
+
+    session = entry.session if entry else None
+    if session is None or session.processing_status != 'completed' \
+            or not session.output_file or not os.path.exists(session.output_file.name):
+        if entry is not None:
+            entry.delete()
+        return None
+
+    ResultCacheEntry.objects.filter(pk=entry.pk).update(
+        hits=F('hits') + 1, last_used_at=timezone.now())
+    print(f"Result cache hit for {key[:12]} (session {session.session_id})")
+    return session
+
+
+def store(session):
+    """Remember a completed session under its cache key"""
+    if not settings.RESULT_CACHE_ENABLED or not session.cache_key:
+        return
+    # Write before reading: on SQLite, update_or_create's SELECT-then-INSERT
+    # transaction fails with "database is locked" instead of waiting when
+    # another worker commits in between
+    fields = {'session': session, 'last_used_at': timezone.now()}
+    if not ResultCacheEntry.objects.filter(cache_key=session.cache_key).update(**fields):
+        try:
+            with transaction.atomic():
+                ResultCacheEntry.objects.create(cache_key=session.cache_key, **fields)
+        except IntegrityError:
+            # Another worker stored the same key first
+            ResultCacheEntry.objects.filter(cache_key=session.cache_key).update(**fields)
+    evict()
+
+
+def evict():
+    """Drop expired entries, then the least recently used beyond the size limit"""
+    expires_before = timezone.now() - timedelta(seconds=settings.RESULT_CACHE_TTL_SECONDS)
+    evicted, _ = ResultCacheEntry.objects.filter(created_at__lt=expires_before).delete()
+
+    overflow = ResultCacheEntry.objects.count() - settings.RESULT_CACHE_MAX_ENTRIES
+    if overflow > 0:
+        stale = ResultCacheEntry.objects.order_by('last_used_at').values_list('pk', flat=True)[:overflow]
+        deleted, _ = ResultCacheEntry.objects.filter(pk__in=list(stale)).delete()
+        evicted += deleted
+    return evicted
@@ -0,0 +1,260 @@
+"""
+Retention of conversion files.
+
+Inputs (MEDIA_ROOT/uploads, plus the legacy uploads/ directory) and outputs
+(image_files/, audio_files/) are kept within the limits below; a limit of 0
+turns it off:
+
+* RETENTION_INPUT_MAX_AGE_SECONDS / RETENTION_OUTPUT_MAX_AGE_SECONDS: files
+  not accessed for this long are deleted. Outputs are what users come back
+  for and what the result cache reuses, so they are normally kept longer.
+* RETENTION_MAX_BYTES: while inputs and outputs together take more than
+  this, the least recently accessed files are deleted, inputs first.
+
+A file was last accessed when it was last read or written, whichever is
+later. Files younger than RETENTION_MIN_AGE_SECONDS and the inputs of
+conversions that have not finished are never deleted.
+
+Deletes run in batches of RETENTION_BATCH_SIZE. After each batch the
+sessions that pointed at a deleted file get that field cleared and result
+cache entries for deleted outputs are dropped, then the collector pauses
+for RETENTION_BATCH_PAUSE seconds so request handling is never held up
+behind it. Variants of a deleted output go with it. Expired resumable
+uploads and files left behind in the incoming directory are cleared on the
+same run.
+
+Run it with `manage.py prune_storage`; the conversion workers also run it
+every RETENTION_INTERVAL_SECONDS (see RetentionThread).
+"""
+import os
+import threading
+import time
+from pathlib import Path
+
+from django.conf import settings
+from django.db import connection
+
+from . import derivatives, storage, uploads
+from .models import ConversionSession, ResultCacheEntry
+
+# Inputs are evicted before outputs when over RETENTION_MAX_BYTES
+TIERS = ('input', 'output')
+
+# Sessions whose inputs are still needed
+UNFINISHED = ('pending', 'processing')
+
+
+def input_directories():
+    return [
+        os.path.join(settings.MEDIA_ROOT, 'uploads'),
+        os.path.join(settings.BASE_DIR, 'uploads'),
+    ]
+
+
+def output_directories():
+    return [storage.output_directory(conversion_type) for conversion_type in storage.OUTPUT_LOCATIONS]
+
+
+def report_directories():
+    """The directories whose usage is reported (media/ includes its uploads)"""
+    return [
+        os.path.join(settings.BASE_DIR, 'uploads'),
+        *output_directories(),
+        settings.MEDIA_ROOT,
+    ]
+
+
+def _walk(directory, skip=()):
+    """Yield (path, stat) for every file under `directory`"""
+    try:
+        entries = list(os.scandir(directory))
+    except FileNotFoundError:
+        return
+    for entry in entries:
+        try:
+            if entry.is_dir(follow_symlinks=False):
+                if os.path.abspath(entry.path) not in skip:
+                    yield from _walk(entry.path, skip)
+            elif entry.is_file(follow_symlinks=False):
+                yield entry.path, entry.stat(follow_symlinks=False)
+        except FileNotFoundError:
+            continue
+
+
+def usage():
+    """Files and bytes per reported directory, as {path: (files, bytes)}"""
+    totals = {}
+    for directory in report_directories():
+        files = size = 0
+        for _, stat in _walk(directory):
+            files += 1
+            size += stat.st_size
+        totals[directory] = (files, size)
+    return totals
+
+
+def _session_name(path, tier):
+    """The name a session's input_file or output_file stores for `path`"""
+    if tier == 'output':
+        return path
+    return Path(os.path.relpath(path, settings.MEDIA_ROOT)).as_posix()
+
+
+def scan():
+    """
+    Every input and output file that may be deleted, as dicts with its
+    path, tier, session name, size and last access time
+    """
+    skip = {os.path.abspath(settings.FILE_UPLOAD_TEMP_DIR)}
+    tiers = [('input', d) for d in input_directories()] + [('output', d) for d in output_directories()]
+    artifacts = []
+    for tier, directory in tiers:
+        for path, stat in _walk(directory, skip):
+            # Outputs still being written, and variants, which are
+            # evicted by their own cache (see app/derivatives.py)
+            if path.endswith('.part') or (tier == 'output' and derivatives.is_variant(path)):
+                continue
+            artifacts.append({
+                'path': path,
+                'tier': tier,
+                'name': _session_name(path, tier),
+                'size': stat.st_size,
+                'accessed': max(stat.st_atime, stat.st_mtime),
+            })
+    return artifacts
+
+
+def select(artifacts, now=None):
+    """
+    Pick the artifacts to delete under the configured policy. Each one
+    chosen gets a `reason`: 'age' or 'size'.
+    """
+    now = time.time() if now is None else now
+    max_age = {
+        'input': settings.RETENTION_INPUT_MAX_AGE_SECONDS,
+        'output': settings.RETENTION_OUTPUT_MAX_AGE_SECONDS,
+    }
+    protected = set(
+        ConversionSession.objects.filter(processing_status__in=UNFINISHED)
+        .values_list('input_file', flat=True))
+
+    selected = []
+    kept = []
+    for artifact in artifacts:
+        idle = now - artifact['accessed']
+        if idle < settings.RETENTION_MIN_AGE_SECONDS or (
+                artifact['tier'] == 'input' and artifact['name'] in protected):
+            continue
+        if max_age[artifact['tier']] and idle > max_age[artifact['tier']]:
+            selected.append({**artifact, 'reason': 'age'})
+        else:
+            kept.append(artifact)
+
+    if settings.RETENTION_MAX_BYTES:
+        total = sum(a['size'] for a in artifacts) - sum(a['size'] for a in selected)
+        kept.sort(key=lambda a: (TIERS.index(a['tier']), a['accessed']))
+        for artifact in kept:
+            if total <= settings.RETENTION_MAX_BYTES:
+                break
+            selected.append({**artifact, 'reason': 'size'})
+            total -= artifact['size']
+    return selected
+
+
+def _delete_batch(batch):
+    """Delete one batch of files and forget them in the database"""
+    deleted = []
+    for artifact in batch:
+        try:
+            os.remove(artifact['path'])
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            print(f"Could not delete {artifact['path']}: {e}")
+            continue
+        if artifact['tier'] == 'output':
+            derivatives.remove_variants(artifact['path'])
+        deleted.append(artifact)
+
+    inputs = [a['name'] for a in deleted if a['tier'] == 'input']
+    outputs = [a['name'] for a in deleted if a['tier'] == 'output']
+    if outputs:
+        ResultCacheEntry.objects.filter(session__output_file__in=outputs).delete()
+        ConversionSession.objects.filter(output_file__in=outputs).update(output_file='')
+    if inputs:
+        ConversionSession.objects.filter(input_file__in=inputs).update(input_file='')
+    return deleted
+
+
+def clear_incoming(now=None):
+    """
+    Discard expired resumable uploads, and delete files in the incoming
+    directory that have not been written to within the same expiry time.
+    Returns the number of bytes freed by the latter.
+    """
+    uploads.discard_stale()
+    now = time.time() if now is None else now
+    freed = 0
+    for path, stat in _walk(settings.FILE_UPLOAD_TEMP_DIR):
+        if now - stat.st_mtime > settings.RECORDING_UPLOAD_EXPIRY_SECONDS:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                continue
+            freed += stat.st_size
+    return freed
+
+
+def collect(dry_run=False, now=None):
+    """
+    Apply the retention policy once. Returns the artifacts deleted (or
+    that would be, with `dry_run`) and the bytes freed from the incoming
+    directory.
+    """
+    selected = select(scan(), now)
+    if dry_run:
+        return {'deleted': selected, 'incoming_freed': 0}
+
+    batch_size = max(settings.RETENTION_BATCH_SIZE, 1)
+    deleted = []
+    for start in range(0, len(selected), batch_size):
+        if start:
+            time.sleep(settings.RETENTION_BATCH_PAUSE)
+        deleted += _delete_batch(selected[start:start + batch_size])
+    return {'deleted': deleted, 'incoming_freed': clear_incoming(now)}
+
+
+def summary(result):
+    """One line describing what `collect` did"""
+    deleted = result['deleted']
+    by_reason = {}
+    for artifact in deleted:
+        by_reason[artifact['reason']] = by_reason.get(artifact['reason'], 0) + 1
+    reasons = ', '.join(f"{count} for {reason}" for reason, count in sorted(by_reason.items()))
+    freed = sum(a['size'] for a in deleted) + result['incoming_freed']
+    return f"{len(deleted)} file(s){f' ({reasons})' if reasons else ''}, {freed} bytes"
+
+
+class RetentionThread(threading.Thread):
+    """Background thread that applies the retention policy every `interval` seconds"""
+
+    def __init__(self, interval):
+        super().__init__(daemon=True, name='retention')
+        self.interval = interval
+        self._stopped = threading.Event()
+
+    def run(self):
+        try:
+            while not self._stopped.wait(self.interval):
+                try:
+                    result = collect()
+                    if result['deleted'] or result['incoming_freed']:
+                        print(f"Storage retention deleted {summary(result)}")
+                except Exception as e:
+                    print(f"Storage retention failed: {e}")
+        finally:
+            connection.close()
+
+    def stop(self):
+        self._stopped.set()
+        self.join()
@@ -0,0 +1,237 @@
+"""
+Conversion sessions as the HTTP and WebSocket front ends see them: creating
+one for an upload (or completing it at once from an earlier result), and
+the JSON payload describing its current state.
+"""
+import os
+
+from django.conf import settings
+from django.urls import reverse
+from django.utils import timezone
+
+from . import derivatives, image_index, metrics, result_cache
+from .models import ConversionSession
+
+OUTPUT_CONTENT_TYPES = {
+    'audio_to_image': 'image/png',
+    'image_to_audio': 'audio/mpeg',
+}
+
+
+def error_payload(error_message):
+    """Build the error body the frontend expects, flagging quota errors"""
+    if 'insufficient_quota' in error_message or 'quota' in error_message.lower():
+        return {
+            'type': 'quota_error',
+            'error': 'OpenAI API quota exceeded. Please check your billing and try again later.',
+            'details': error_message
+        }
+    return {
+        'type': 'error',
+        'error': error_message
+    }
+
+
+def status_url(session):
+    return reverse('homepage:conversion_status', args=[session.session_id])
+
+
+def _variants(session, result_url):
+    """
+    The smaller versions `conversion_result` serves of a session's output:
+    image widths, each in the best of `content_types` the Accept header
+    names, or audio transcodes
+    """
+    if session.conversion_type == 'audio_to_image':
+        if not settings.IMAGE_VARIANTS_ENABLED:
+            return []
+        content_types = [content_type for _, content_type, _, _ in derivatives.supported_image_formats()]
+        return [{'url': f"{result_url}?w={width}", 'width': width, 'content_types': content_types}
+                for width in sorted(settings.IMAGE_VARIANT_WIDTHS)]
+    if not settings.AUDIO_VARIANTS_ENABLED:
+        return []
+    return [{'url': f"{result_url}?format={name}", 'format': name, 'content_type': content_type}
+            for name, (content_type, _, _) in derivatives.AUDIO_FORMATS.items()]
+
+
+def result_payload(session):
+    """
+    Build the response body for a completed conversion. The output itself
+    is fetched separately from `conversion_result`: `original` describes
+    the generated file, and `variants` the smaller versions it is
+    negotiated down to.
+    """
+    result_url = reverse('homepage:conversion_result', args=[session.session_id])
+    original_query = 'original=1' if session.conversion_type == 'audio_to_image' else 'format=mp3'
+    metadata = {
+        'session_id': str(session.session_id),
+        'ai_model_used': session.ai_model_used,
+        'original': {
+            'url': f"{result_url}?{original_query}",
+            'content_type': OUTPUT_CONTENT_TYPES[session.conversion_type],
+            'size': os.path.getsize(session.output_file.name),
+        },
+        'variants': _variants(session, result_url),
+    }
+
+    if session.conversion_type == 'audio_to_image':
+        return {
+            'type': 'image',
+            'image_url': result_url,
+            'transcription': session.transcription,
+            'image_description': session.image_description,
+            **metadata
+        }
+    return {
+        'type': 'audio',
+        'audio_url': result_url,
+        'image_description': session.image_description,
+        'voice_used': session.voice_preference or 'Rachel',
+        **metadata
+    }
+
+
+def session_payload(session):
+    """Current state of a session: its result, error, or that it is pending"""
+    if session.processing_status == 'completed':
+        if session.output_file and os.path.exists(session.output_file.name):
+            response_data = result_payload(session)
+        else:
+            # Deleted by the retention policy (see app/retention.py)
+            response_data = error_payload('Result has expired')
+    elif session.processing_status == 'failed':
+        response_data = error_payload(session.error_message or 'Conversion failed')
+    else:
+        response_data = {
+            'type': 'pending',
+            'session_id': str(session.session_id),
+            'status_url': status_url(session),
+        }
+
+    response_data['status'] = session.processing_status
+    return response_data
+
+
+def reuse_session(cached, conversion_type, key, **fields):
+    """Complete a new session with the output of the earlier session `cached`"""
+    return ConversionSession.objects.create(
+        conversion_type=conversion_type,
+        input_file=cached.input_file.name,
+        output_file=cached.output_file.name,
+        ai_model_used=cached.ai_model_used,
+        transcription=cached.transcription,
+        image_description=cached.image_description,
+        processing_status='completed',
+        completed_at=timezone.now(),
+        cache_key=key,
+        **fields
+    )
+
+
+def audio_to_image_session(input_audio, description_prompt='', item_fields=None, **session_fields):
+    """
+    Return (session, reused) for an audio_to_image upload. `reused` is True
+    when an identical earlier conversion was found in the result cache and
+    the session is already complete. `item_fields` are set on the session
+    either way, `session_fields` only on a new one.
+    """
+    item_fields = item_fields or {}
+    timer = metrics.StageTimer()
+
+    # Reuse the result of an identical earlier conversion if there is one
+    with timer.stage('cache_lookup') as lookup:
+        key = result_cache.cache_key(
+            'audio_to_image', result_cache.hash_upload(input_audio),
+            description_prompt=description_prompt)
+        cached = result_cache.lookup(key)
+        lookup['outcome'] = 'miss' if cached is None else 'hit'
+    if cached is not None:
+        session = reuse_session(
+            cached, 'audio_to_image', key, description_prompt=description_prompt, **item_fields)
+        metrics.save(session, timer.records)
+        return session, True
+
+    # Create conversion session; the upload is stored once as its input
+    with timer.stage('upload') as upload:
+        session = ConversionSession.objects.create(
+            conversion_type='audio_to_image',
+            input_file=input_audio,
+            description_prompt=description_prompt,
+            cache_key=key,
+            **item_fields,
+            **session_fields
+        )
+        upload['size'] = input_audio.size
+    metrics.save(session, timer.records)
+    return session, False
+
+
+def image_to_audio_session(input_image, voice_preference='Rachel', description_style='',
+                            item_fields=None, **session_fields):
+    """
+    Return (session, reused) for an image_to_audio upload. When the same or
+    a near-duplicate image has already been converted with these options,
+    `reused` is True and the session is already complete. Otherwise a new
+    session is created with `session_fields`. `item_fields` are set on the
+    session either way.
+    """
+    item_fields = item_fields or {}
+    print(f"Processing image: {input_image.name}")
+    print(f"Voice preference: {voice_preference}")
+    print(f"Description style: {description_style}")
+
+    # Reuse the result of an identical earlier conversion if there is one
+    options = {
+        'description_prompt': f"Voice: {voice_preference}, Style: {description_style}",
+        'voice_preference': voice_preference,
+        'description_style': description_style,
+    }
+    timer = metrics.StageTimer()
+    with timer.stage('cache_lookup') as lookup:
+        key = result_cache.cache_key(
+            'image_to_audio', result_cache.hash_upload(input_image),
+            voice_preference=voice_preference, description_style=description_style)
+        reusable = result_cache.lookup(key)
+        lookup['outcome'] = 'hit'
+
+        # Otherwise look for a near-duplicate of an image we have already described
+        fingerprint = None
+        index_key = result_cache.options_key(
+            'image_to_audio', voice_preference=voice_preference, description_style=description_style)
+        if reusable is None and settings.IMAGE_DEDUP_ENABLED:
+            try:
+                fingerprint = image_index.phash(input_image)
+            except Exception as e:
+                print(f"Could not fingerprint image: {e}")
+            finally:
+                input_image.seek(0)
+
+        if fingerprint is not None:
+            similar = image_index.find_similar(fingerprint, index_key)
+            if similar is not None and os.path.exists(similar.output_file.name):
+                reusable = similar
+                lookup['outcome'] = 'near_duplicate'
+
+        if reusable is None:
+            lookup['outcome'] = 'miss'
+
+    if reusable is not None:
+        session = reuse_session(reusable, 'image_to_audio', key, **options, **item_fields)
+        metrics.save(session, timer.records)
+        return session, True
+
+    # Create conversion session; the upload is stored once as its input
+    with timer.stage('upload') as upload:
+        session = ConversionSession.objects.create(
+            conversion_type='image_to_audio',
+            input_file=input_image,
+            cache_key=key,
+            **options,
+            **item_fields,
+            **session_fields
+        )
+        if fingerprint is not None:
+            image_index.add(session, fingerprint, index_key)
+        upload['size'] = input_image.size
+    metrics.save(session, timer.records)
+    return session, False
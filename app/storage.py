@@ -0,0 +1,72 @@
+"""
+Where the files of a conversion live, written once each.
+
+* Inputs are received into the incoming directory (Django's
+  FILE_UPLOAD_TEMP_DIR, also used for resumable and live recordings and
+  batch archive members). It lies inside MEDIA_ROOT, so storing a received
+  file as a session's input is a rename, not a second copy.
+* Outputs are written by the converters straight to their final path
+  through `output_file`, which renames a .part file into place once it is
+  complete.
+"""
+import contextlib
+import os
+import tempfile
+from pathlib import Path
+
+from django.conf import settings
+
+# Where finished outputs are stored, per conversion type
+OUTPUT_LOCATIONS = {
+    'audio_to_image': ('image_files', '.png'),
+    'image_to_audio': ('audio_files', '.mp3'),
+}
+
+
+def incoming_dir():
+    """The directory uploads are received into, created on first use"""
+    os.makedirs(settings.FILE_UPLOAD_TEMP_DIR, exist_ok=True)
+    return settings.FILE_UPLOAD_TEMP_DIR
+
+
+def incoming_path(name):
+    """Path for a file being received under `name`"""
+    return os.path.join(incoming_dir(), name)
+
+
+def output_directory(conversion_type):
+    """The directory finished outputs of `conversion_type` are stored in"""
+    return os.path.join(settings.OUTPUT_ROOT, OUTPUT_LOCATIONS[conversion_type][0])
+
+
+def output_path(session):
+    """Final location of a session's generated file"""
+    _, suffix = OUTPUT_LOCATIONS[session.conversion_type]
+    return Path(output_directory(session.conversion_type)) / f"ai_generated_{session.session_id}{suffix}"
+
+
+@contextlib.contextmanager
+def output_file(output_path=None, suffix=''):
+    """
+    Open the file a conversion writes its result to and yield it with the
+    result's final path. With `output_path` the data goes straight to that
+    location, via a .part file renamed into place once complete; otherwise
+    a temporary file is created.
+    """
+    if output_path is None:
+        with tempfile.NamedTemporaryFile(delete=False, suffix=suffix) as tmp_file:
+            yield tmp_file, tmp_file.name
+        return
+
+    output_path = str(output_path)
+    os.makedirs(os.path.dirname(output_path), exist_ok=True)
+    partial_path = output_path + '.part'
+    try:
+        with open(partial_path, 'wb') as partial_file:
+            yield partial_file, output_path
+        os.replace(partial_path, output_path)
+    except BaseException:
+        if os.path.exists(partial_path):
+            os.unlink(partial_path)
+        raise
+
@@ -1,3 +1,125 @@
-from django.test import TestCase
+import threading
 
-# Create your tests here.
+from django.db import OperationalError, connection
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+
+from . import image_index, jobs, metrics, rate_limit, result_cache
+from .models import ConversionSession
+
+
+class ClaimNextTests(TransactionTestCase):
+    def test_contended_claims_wait_for_the_lock(self):
+        ConversionSession.objects.bulk_create([
+            ConversionSession(conversion_type='audio_to_image', input_file=f"uploads/claim_{i}.wav")
+            for i in range(100)
+        ])
+        claimed = []
+        errors = []
+        lock = threading.Lock()
+
+        def claim(worker_id):
+            try:
+                while True:
+                    try:
+                        session = jobs.claim_next(worker_id)
+                    except OperationalError as e:
+                        with lock:
+                            errors.append(str(e))
+                        continue
+                    if session is None:
+                        return
+                    with lock:
+                        claimed.append(session.pk)
+            finally:
+                connection.close()
+
+        workers = [threading.Thread(target=claim, args=(f"worker-{i}",)) for i in range(8)]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+
+        self.assertEqual(errors, [])
+        self.assertEqual(sorted(claimed), sorted(ConversionSession.objects.values_list('pk', flat=True)))
+        self.assertFalse(ConversionSession.objects.exclude(processing_status='processing').exists())
+        self.assertFalse(ConversionSession.objects.exclude(attempts=1).exists())
+
+
+class ResultCacheStoreTests(TransactionTestCase):
+    def test_concurrent_stores_wait_for_the_lock(self):
+        stored = [
+            ConversionSession.objects.create(
+                conversion_type='image_to_audio', input_file=f"uploads/store_{i}.png",
+                processing_status='completed', cache_key=f"key-{i}")
+            for i in range(200)
+        ]
+        errors = []
+
+        def store(sessions):
+            try:
+                for session in sessions:
+                    try:
+                        result_cache.store(session)
+                    except OperationalError as e:
+                        errors.append(str(e))
+            finally:
+                connection.close()
+
+        workers = [threading.Thread(target=store, args=(stored[i::8],)) for i in range(8)]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+
+        self.assertEqual(errors, [])
+
+
+class MetricsTests(TestCase):
+    def test_totals_outlive_deleted_sessions(self):
+        for _ in range(2):
+            session = ConversionSession.objects.create(
+                conversion_type='image_to_audio', input_file='uploads/image.png')
+            metrics.save(session, [
+                {'stage': 'cache_lookup', 'seconds': 0.02, 'outcome': 'miss', 'size': None},
+                {'stage': 'tts', 'seconds': 3.0, 'outcome': 'ok', 'size': 200000},
+            ])
+        ConversionSession.objects.all().delete()
+
+        rendered = metrics.render()
+        self.assertIn(
+            'conversion_cache_lookups_total{conversion_type="image_to_audio",outcome="miss"} 2', rendered)
+        self.assertIn(
+            'conversion_stage_duration_seconds_bucket'
+            '{conversion_type="image_to_audio",stage="tts",outcome="ok",le="2.5"} 0', rendered)
+        self.assertIn(
+            'conversion_stage_duration_seconds_bucket'
+            '{conversion_type="image_to_audio",stage="tts",outcome="ok",le="5"} 2', rendered)
+        self.assertIn('conversion_output_bytes_count{conversion_type="image_to_audio"} 2', rendered)
+
+
+@override_settings(API_BACKOFF_BASE=1.0, API_BACKOFF_MAX=30, RATE_LIMIT_MAX_WAIT=300)
+class BackoffTests(SimpleTestCase):
+    def test_retry_after_is_not_cut_short(self):
+        self.assertGreaterEqual(rate_limit.backoff(0, retry_after=60), 60)
+        self.assertEqual(rate_limit.backoff(0, retry_after=900), 300)
+
+    def test_exponential_backoff_is_capped(self):
+        self.assertLessEqual(rate_limit.backoff(10), 30)
+
+
+class NearDuplicateTests(TestCase):
+    def test_only_conversions_with_the_same_options_are_reused(self):
+        session = ConversionSession.objects.create(
+            conversion_type='image_to_audio', input_file='uploads/image.png',
+            processing_status='completed', voice_preference='Rachel')
+        rachel = result_cache.options_key('image_to_audio', voice_preference='Rachel', description_style='')
+        image_index.add(session, 0x0123456789ABCDEF, rachel)
+
+        close = 0x0123456789ABCDEF ^ 0b101
+        self.assertEqual(image_index.find_similar(close, rachel), session)
+        adam = result_cache.options_key('image_to_audio', voice_preference='Adam', description_style='')
+        self.assertIsNone(image_index.find_similar(close, adam))
+        with override_settings(VISION_DETAIL='high'):
+            detailed = result_cache.options_key(
+                'image_to_audio', voice_preference='Rachel', description_style='')
+        self.assertIsNone(image_index.find_similar(close, detailed))
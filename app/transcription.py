@@ -0,0 +1,241 @@
+"""
+Process-wide registry of loaded transcription models.
+
+Loading a Whisper checkpoint costs seconds of disk I/O and torch start-up, so
+each (backend, model size, device) is loaded once per process and shared by
+every request thread. Inference on a shared model is serialised with a
+per-model lock because Whisper installs decoder hooks on the model while it
+transcribes.
+
+Backends are WarmModel subclasses registered in BACKENDS and chosen with
+TRANSCRIPTION_BACKEND: 'whisper' runs the stock model, 'whisper-int8' runs
+it on the CPU with int8-quantized linear layers and a tuned torch thread
+count. Whether a device supports fp16 is checked once instead of by trial.
+
+Long audio is split into chunks that are transcribed in parallel by a pool
+of processes, each with its own copy of the model, since one Whisper
+inference only keeps a few cores busy.
+"""
+import asyncio
+import functools
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from django.conf import settings
+
+_models = {}
+_models_lock = threading.Lock()
+
+_executor = None
+_executor_lock = threading.Lock()
+
+_process_pool = None
+_process_pool_lock = threading.Lock()
+
+# torch intra-op threads set by this module, None if left at torch's default
+_threads = None
+
+
+@functools.lru_cache(maxsize=None)
+def fp16_supported(device):
+    """Whether `device` (e.g. 'cpu', 'cuda:0') runs fp16 inference natively"""
+    import torch
+
+    device = torch.device(device)
+    if device.type != 'cuda' or not torch.cuda.is_available():
+        return False
+    # Half precision arithmetic needs compute capability 5.3 or later
+    return torch.cuda.get_device_capability(device) >= (5, 3)
+
+
+def set_threads(count):
+    """Set the number of threads torch uses for inference in this process"""
+    global _threads
+    import torch
+
+    torch.set_num_threads(count)
+    _threads = count
+
+
+class WarmModel:
+    """
+    A loaded Whisper model plus the lock that guards inference on it. The
+    stock openai-whisper backend.
+    """
+    backend = 'whisper'
+
+    def __init__(self, name, device, model):
+        self.name = name
+        self.device = device
+        self.model = model
+        self.fp16 = fp16_supported(str(model.device))
+        self._lock = threading.Lock()
+
+    @classmethod
+    def load(cls, name, device):
+        # Imported lazily so that importing the app does not pull in torch
+        import whisper
+
+        return cls(name, device, whisper.load_model(name, device=device))
+
+    def transcribe(self, audio, **options):
+        """
+        Transcribe a file path or 16 kHz float32 array with exclusive access
+        to the underlying model
+        """
+        options.setdefault('fp16', self.fp16)
+        with self._lock:
+            return self.model.transcribe(audio, **options)
+
+
+class QuantizedCPUModel(WarmModel):
+    """
+    Whisper on the CPU with its linear layers dynamically quantized to int8,
+    using TRANSCRIPTION_THREADS torch threads (all cores by default)
+    """
+    backend = 'whisper-int8'
+
+    @classmethod
+    def load(cls, name, device):
+        import torch
+        import whisper
+
+        if _threads is None:
+            set_threads(settings.TRANSCRIPTION_THREADS or os.cpu_count() or 1)
+
+        model = whisper.load_model(name, device='cpu')
+        # whisper.model.Linear only adds dtype casting for fp16, so the layers
+        # can be treated as plain Linear modules for quantization
+        for module in model.modules():
+            if isinstance(module, torch.nn.Linear):
+                module.__class__ = torch.nn.Linear
+        model = torch.ao.quantization.quantize_dynamic(
+            model, {torch.nn.Linear}, dtype=torch.qint8)
+        return cls(name, 'cpu', model)
+
+
+BACKENDS = {backend.backend: backend for backend in (WarmModel, QuantizedCPUModel)}
+
+
+def get_model(name=None, device=None, backend=None):
+    """
+    Return the warm model for `name`/`device` on `backend`, loading it on
+    first use. Defaults come from WHISPER_MODEL_SIZE, WHISPER_DEVICE and
+    TRANSCRIPTION_BACKEND.
+    """
+    name = name or settings.WHISPER_MODEL_SIZE
+    device = device or settings.WHISPER_DEVICE
+    backend = backend or settings.TRANSCRIPTION_BACKEND
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown transcription backend {backend!r}; expected one of {', '.join(BACKENDS)}")
+    key = (backend, name, device)
+
+    warm = _models.get(key)
+    if warm is None:
+        with _models_lock:
+            warm = _models.get(key)
+            if warm is None:
+                print(f"Loading Whisper model '{name}' ({backend}) on {device or 'default device'}...")
+                warm = BACKENDS[backend].load(name, device)
+                _models[key] = warm
+    return warm
+
+
+def preload(names=None):
+    """
+    Load the configured models up front, e.g. in the gunicorn master when
+    running with --preload so forked workers share the weights copy-on-write
+    """
+    for name in names or settings.WHISPER_PRELOAD_MODELS:
+        get_model(name)
+
+
+def loaded_models():
+    """List the (backend, name, device) keys currently held in this process"""
+    return list(_models)
+
+
+def executor():
+    """
+    Bounded thread pool for CPU-bound Whisper work started from async code,
+    so an event loop with many in-flight conversions cannot pile up threads
+    """
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(
+                    max_workers=settings.WHISPER_MAX_WORKERS, thread_name_prefix='whisper')
+    return _executor
+
+
+async def run_in_executor(func, *args, **kwargs):
+    """Run `func` on the Whisper executor and await its result"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(executor(), functools.partial(func, *args, **kwargs))
+
+
+def _init_chunk_worker(backend, name, device, threads):
+    """Load the model once in each pool process"""
+    set_threads(threads)
+    get_model(name, device, backend)
+
+
+def _transcribe_chunk(backend, name, device, audio):
+    return get_model(name, device, backend).transcribe(audio)['text']
+
+
+def process_pool():
+    """
+    Pool of TRANSCRIPTION_PROCESSES processes for chunked transcription,
+    sharing the cores between them. Processes are spawned, not forked, so
+    they do not inherit torch's thread pools.
+    """
+    global _process_pool
+    if _process_pool is None:
+        with _process_pool_lock:
+            if _process_pool is None:
+                processes = settings.TRANSCRIPTION_PROCESSES
+                threads = max((os.cpu_count() or 1) // processes, 1)
+                _process_pool = ProcessPoolExecutor(
+                    max_workers=processes,
+                    mp_context=multiprocessing.get_context('spawn'),
+                    initializer=_init_chunk_worker,
+                    initargs=(settings.TRANSCRIPTION_BACKEND, settings.WHISPER_MODEL_SIZE,
+                              settings.WHISPER_DEVICE, threads),
+                )
+    return _process_pool
+
+
+def _discard_process_pool():
+    global _process_pool
+    with _process_pool_lock:
+        if _process_pool is not None:
+            _process_pool.shutdown(wait=False, cancel_futures=True)
+            _process_pool = None
+
+
+def transcribe_chunks(chunks):
+    """
+    Transcribe consecutive chunks of one recording and join their text in
+    order. Several chunks go to the process pool in parallel; if the pool
+    breaks (e.g. a process was killed) they are transcribed here instead.
+    """
+    backend, name, device = (
+        settings.TRANSCRIPTION_BACKEND, settings.WHISPER_MODEL_SIZE, settings.WHISPER_DEVICE)
+    if len(chunks) > 1 and settings.TRANSCRIPTION_PROCESSES > 1:
+        count = len(chunks)
+        try:
+            texts = list(process_pool().map(
+                _transcribe_chunk, [backend] * count, [name] * count, [device] * count, chunks))
+            return ' '.join(text.strip() for text in texts if text.strip())
+        except BrokenProcessPool as e:
+            print(f"Transcription process pool failed ({e}), transcribing in this process")
+            _discard_process_pool()
+
+    warm = get_model(name, device, backend)
+    texts = [warm.transcribe(chunk)['text'] for chunk in chunks]
+    return ' '.join(text.strip() for text in texts if text.strip())
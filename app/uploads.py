@@ -0,0 +1,250 @@
+"""
+Streaming and resumable uploads of recorded audio.
+
+Recordings arrive as raw bytes instead of base64 form fields, so they are
+never inflated or held in memory whole:
+
+* A multipart file or an `application/octet-stream` body is written to a
+  temporary file as it is read, hashing each chunk on the way. The hashing
+  upload handlers below do the same for every multipart upload, so the
+  result cache never has to read an upload a second time.
+* A resumable upload (RecordingUpload) is appended to chunk by chunk while
+  the user is still recording. Each chunk names the offset it starts at;
+  a client that lost its connection asks for the current offset and
+  resends from there. Completing the upload hands the assembled file to
+  the conversion as its input, moved into place rather than copied.
+"""
+import hashlib
+import os
+import threading
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.files import File
+from django.core.files.uploadedfile import TemporaryUploadedFile
+from django.core.files.uploadhandler import MemoryFileUploadHandler, TemporaryFileUploadHandler
+from django.utils import timezone
+
+from . import storage
+from .models import RecordingUpload
+
+CHUNK_SIZE = 64 * 1024
+
+EXTENSIONS = {
+    'audio/webm': '.webm',
+    'audio/ogg': '.ogg',
+    'audio/mp4': '.m4a',
+    'audio/mpeg': '.mp3',
+    'audio/wav': '.wav',
+    'audio/x-wav': '.wav',
+}
+
+# Running SHA-256 of the resumable uploads whose chunks all arrived in this
+# process, keyed by upload_id as (offset, digest). Uploads that moved
+# between processes are hashed from disk when they are completed.
+_digests = {}
+_digests_lock = threading.Lock()
+
+
+class UploadError(ValueError):
+    """An upload that cannot be accepted, with the HTTP status to answer with"""
+
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+
+class OffsetMismatch(UploadError):
+    """A chunk that does not start where the upload currently ends"""
+
+    def __init__(self, offset):
+        super().__init__(f"Upload is at offset {offset}", status=409)
+        self.offset = offset
+
+
+class _HashingMixin:
+    """Hash file data as it is received and attach it to the file as `sha256`"""
+
+    def new_file(self, *args, **kwargs):
+        self.digest = hashlib.sha256()
+        super().new_file(*args, **kwargs)
+
+    def receive_data_chunk(self, raw_data, start):
+        remaining = super().receive_data_chunk(raw_data, start)
+        # Data passed on is stored (and hashed) by a later handler
+        if remaining is None:
+            self.digest.update(raw_data)
+        return remaining
+
+    def file_complete(self, file_size):
+        uploaded_file = super().file_complete(file_size)
+        if uploaded_file is not None:
+            uploaded_file.sha256 = self.digest.hexdigest()
+        return uploaded_file
+
+
+class HashingMemoryFileUploadHandler(_HashingMixin, MemoryFileUploadHandler):
+    pass
+
+
+class HashingTemporaryFileUploadHandler(_HashingMixin, TemporaryFileUploadHandler):
+    def new_file(self, *args, **kwargs):
+        storage.incoming_dir()
+        super().new_file(*args, **kwargs)
+
+
+class AssembledUpload(File):
+    """
+    The finished file of a resumable upload. Storage moves it into place,
+    as it does Django's temporary uploads.
+    """
+
+    def __init__(self, path, name, sha256):
+        super().__init__(open(path, 'rb'), name=name)
+        self.sha256 = sha256
+
+    def temporary_file_path(self):
+        return self.file.name
+
+
+def recording_name(key, content_type=''):
+    """File name for a recording, with an extension matching its type"""
+    extension = EXTENSIONS.get(content_type.split(';')[0].strip().lower(), '.webm')
+    return f"recorded_{key}{extension}"
+
+
+def _copy(stream, destination, digest, limit, offset=0):
+    """
+    Copy `stream` to `destination` chunk by chunk, updating `digest` (if
+    any) on the way. Returns the number of bytes copied.
+    """
+    copied = 0
+    while True:
+        chunk = stream.read(CHUNK_SIZE)
+        if not chunk:
+            return copied
+        copied += len(chunk)
+        if offset + copied > limit:
+            raise UploadError(f"Recordings can be at most {limit} bytes", status=413)
+        destination.write(chunk)
+        if digest is not None:
+            digest.update(chunk)
+
+
+def receive_body(request, name):
+    """
+    Stream the raw body of `request` to a temporary file and return it as
+    an uploaded file with its `sha256` already set
+    """
+    limit = settings.RECORDING_MAX_BYTES
+    if int(request.META.get('CONTENT_LENGTH') or 0) > limit:
+        raise UploadError(f"Recordings can be at most {limit} bytes", status=413)
+
+    content_type = request.META.get('CONTENT_TYPE', 'application/octet-stream')
+    storage.incoming_dir()
+    upload = TemporaryUploadedFile(name, content_type, 0, None)
+    digest = hashlib.sha256()
+    try:
+        upload.size = _copy(request, upload.file, digest, limit)
+    except BaseException:
+        upload.close()
+        raise
+    if not upload.size:
+        upload.close()
+        raise UploadError('Audio file is empty')
+
+    upload.file.flush()
+    upload.seek(0)
+    upload.sha256 = digest.hexdigest()
+    return upload
+
+
+def partial_path(upload):
+    """Where the received bytes of a resumable upload are kept"""
+    return storage.incoming_path(f"{upload.upload_id}.part")
+
+
+def start(content_type=''):
+    """Begin a resumable upload, clearing out abandoned ones first"""
+    discard_stale()
+    upload = RecordingUpload.objects.create(content_type=content_type[:100])
+    open(partial_path(upload), 'wb').close()
+    with _digests_lock:
+        _digests[upload.upload_id] = (0, hashlib.sha256())
+    return upload
+
+
+def _running_digest(upload_id, offset):
+    """Take the running digest of an upload if it is at `offset`"""
+    with _digests_lock:
+        entry = _digests.pop(upload_id, None)
+    if entry is not None and entry[0] == offset:
+        return entry[1]
+    return hashlib.sha256() if offset == 0 else None
+
+
+def append(upload, offset, stream):
+    """
+    Append the chunk in `stream` at `offset` and return the new offset.
+    Raises OffsetMismatch when `offset` is not where the upload ends, so
+    the client can resend from there.
+    """
+    if offset != upload.received_bytes:
+        raise OffsetMismatch(upload.received_bytes)
+
+    digest = _running_digest(upload.upload_id, offset)
+    path = partial_path(upload)
+    with open(path, 'r+b' if os.path.exists(path) else 'wb') as destination:
+        # Drop whatever an interrupted earlier attempt left past the offset
+        destination.seek(offset)
+        destination.truncate()
+        received = _copy(stream, destination, digest, settings.RECORDING_MAX_BYTES, offset)
+
+    # Only one of two concurrent chunks for the same offset wins
+    new_offset = offset + received
+    updated = RecordingUpload.objects.filter(pk=upload.pk, received_bytes=offset).update(
+        received_bytes=new_offset, updated_at=timezone.now())
+    if not updated:
+        upload.refresh_from_db(fields=['received_bytes'])
+        raise OffsetMismatch(upload.received_bytes)
+
+    upload.received_bytes = new_offset
+    if digest is not None:
+        with _digests_lock:
+            _digests[upload.upload_id] = (new_offset, digest)
+    return new_offset
+
+
+def assemble(upload):
+    """Return the received recording as a file ready to become a session input"""
+    if not upload.received_bytes:
+        raise UploadError('Audio file is empty')
+
+    path = partial_path(upload)
+    digest = _running_digest(upload.upload_id, upload.received_bytes)
+    if digest is None:
+        digest = hashlib.sha256()
+        with open(path, 'rb') as source:
+            for chunk in iter(lambda: source.read(CHUNK_SIZE), b''):
+                digest.update(chunk)
+
+    return AssembledUpload(
+        path, recording_name(upload.upload_id, upload.content_type), digest.hexdigest())
+
+
+def discard(upload):
+    """Delete a resumable upload and whatever is left of its file"""
+    with _digests_lock:
+        _digests.pop(upload.upload_id, None)
+    try:
+        os.remove(partial_path(upload))
+    except FileNotFoundError:
+        pass
+    upload.delete()
+
+
+def discard_stale():
+    """Delete uploads that have not received a chunk within the expiry time"""
+    expired_before = timezone.now() - timedelta(seconds=settings.RECORDING_UPLOAD_EXPIRY_SECONDS)
+    for upload in RecordingUpload.objects.filter(updated_at__lt=expired_before):
+        discard(upload)
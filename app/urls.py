@@ -6,5 +6,18 @@ app_name = 'homepage'
 
 urlpatterns = [
     path('', views.homepage, name='homepage'),
+    path('stream/image-to-audio/', views.stream_image_to_audio, name='stream_image_to_audio'),
+    path('recordings/', views.upload_recording, name='upload_recording'),
+    path('recordings/uploads/', views.start_recording_upload, name='start_recording_upload'),
+    path('recordings/uploads/<uuid:upload_id>/', views.recording_upload, name='recording_upload'),
+    path('recordings/uploads/<uuid:upload_id>/complete/', views.complete_recording_upload,
+         name='complete_recording_upload'),
+    path('conversions/', views.conversion_history, name='conversion_history'),
+    path('status/<uuid:session_id>/', views.conversion_status, name='conversion_status'),
+    path('result/<uuid:session_id>/', views.conversion_result, name='conversion_result'),
+    path('batch/', views.batch_convert, name='batch_convert'),
+    path('batch/<uuid:batch_id>/', views.batch_status, name='batch_status'),
+    path('batch/<uuid:batch_id>/stream/', views.batch_stream, name='batch_stream'),
+    path('metrics', views.prometheus_metrics, name='metrics'),
     # Add more URL patterns as needed
 ]
@@ -1,18 +1,27 @@
-
 import os
 import base64
 import json
+import uuid
 from pathlib import Path
 from django.shortcuts import render
-from django.http import JsonResponse
+from asgiref.sync import sync_to_async
+from django.http import HttpResponse, HttpResponseNotAllowed, JsonResponse, StreamingHttpResponse
+from django.db import transaction
+from django.core.files.base import ContentFile
+from django.urls import reverse
+from django.utils.cache import patch_vary_headers
 from django.views.decorators.csrf import csrf_exempt
-from django.utils import timezone
-from . import convert
-from .models import ConversionSession, AudioRecording
+from django.views.decorators.http import require_POST, require_safe
+from django.conf import settings
+from . import batches, derivatives, history, jobs, metrics, sessions, uploads
+from .delivery import serve_file
+from .audio import AudioDecodeError
+from .models import ConversionBatch, ConversionSession, AudioRecording, RecordingUpload
 
 BASE_DIR = Path(__file__).resolve().parent.parent
 
 
+
 @csrf_exempt
 def homepage(request):
     try:
@@ -31,240 +40,122 @@ def homepage(request):
         return JsonResponse({'error': str(e)}, status=500)
 
 
+def _queued_response(session):
+    """Tell the client where to poll for a freshly enqueued conversion"""
+    return JsonResponse({
+        'type': 'queued',
+        'status': session.processing_status,
+        'session_id': str(session.session_id),
+        'status_url': sessions.status_url(session),
+    }, status=202)
+
+
+def _reused_response(session):
+    response_data = sessions.result_payload(session)
+    response_data['status'] = session.processing_status
+    response_data['cached'] = True
+    return JsonResponse(response_data, status=200)
+
+
 @csrf_exempt
 def ai_audio_to_image(request):
-    """AI-powered audio to image conversion"""
+    """Queue an AI-powered audio to image conversion"""
     try:
         print("Received audio file for AI conversion.")
 
-        # Create directories if they don't exist
-        image_dir = BASE_DIR / "image_files"
-        os.makedirs(image_dir, exist_ok=True)
-
-        # Get form data
-        input_audio = request.FILES['audio_file']
-        description_prompt = request.POST.get('description_prompt', '')
+        session, reused = sessions.audio_to_image_session(
+            request.FILES['audio_file'], request.POST.get('description_prompt', ''),
+            processing_status='pending')
+        if reused:
+            return _reused_response(session)
 
-        # Create conversion session
-        session = ConversionSession.objects.create(
-            conversion_type='audio_to_image',
-            input_file=input_audio,
-            description_prompt=description_prompt,
-            processing_status='processing'
-        )
-
-        # Save input file
-        input_path = BASE_DIR / "uploads" / f"audio_{session.session_id}.wav"
-        os.makedirs(input_path.parent, exist_ok=True)
-
-        with open(input_path, 'wb+') as destination:
-            for chunk in input_audio.chunks():
-                destination.write(chunk)
-
-        # Convert using AI
-        converter = convert.AIConverter()
-        result = converter.audio_to_image(str(input_path), description_prompt)
-
-        if result['success']:
-            # Save output image
-            output_path = image_dir / f"ai_generated_{session.session_id}.png"
-            import shutil
-            shutil.copy2(result['output_path'], output_path)
-            os.unlink(result['output_path'])  # Clean up temp file
-
-            # Update session
-            session.output_file = str(output_path)
-            session.ai_model_used = result['ai_model_used']
-            session.processing_status = 'completed'
-            session.completed_at = timezone.now()
-            session.save()
-
-            # Read image file data
-            with open(output_path, "rb") as img_file:
-                image_data = base64.b64encode(img_file.read()).decode('utf-8')
-
-            # Return response with image data and metadata
-            response_data = {
-                'type': 'image',
-                'image': image_data,
-                'transcription': result.get('transcription', ''),
-                'image_description': result.get('image_description', ''),
-                'session_id': str(session.session_id),
-                'ai_model_used': result['ai_model_used']
-            }
-
-            print("Sending AI-generated image data as response.")
-            return JsonResponse(response_data, content_type='application/json', status=200)
-        else:
-            # Update session with error
-            session.processing_status = 'failed'
-            session.error_message = result['error']
-            session.save()
-
-            # Check if it's a quota error
-            error_message = result['error']
-            if 'insufficient_quota' in error_message or 'quota' in error_message.lower():
-                error_response = {
-                    'type': 'quota_error',
-                    'error': 'OpenAI API quota exceeded. Please check your billing and try again later.',
-                    'details': error_message
-                }
-            else:
-                error_response = {
-                    'type': 'error',
-                    'error': error_message
-                }
-
-            print(f"AI conversion failed: {error_message}")
-            return JsonResponse(error_response, status=500)
+        print(f"Queued audio to image conversion {session.session_id}")
+        return _queued_response(session)
 
     except Exception as e:
         print(f"Error in ai_audio_to_image: {e}")
         import traceback
         traceback.print_exc()
-        
-        # Check if it's a quota error
-        error_message = str(e)
-        if 'insufficient_quota' in error_message or 'quota' in error_message.lower():
-            error_response = {
-                'type': 'quota_error',
-                'error': 'OpenAI API quota exceeded. Please check your billing and try again later.',
-                'details': error_message
-            }
-        else:
-            error_response = {
-                'type': 'error',
-                'error': error_message
-            }
-        
-        return JsonResponse(error_response, status=500)
+        return JsonResponse(sessions.error_payload(str(e)), status=500)
+
+
+def _image_to_audio_options(request):
+    return {
+        'voice_preference': request.POST.get('voice_preference', 'Rachel'),
+        'description_style': request.POST.get('description_style', ''),
+    }
 
 
 @csrf_exempt
 def ai_image_to_audio(request):
-    """AI-powered image to audio conversion"""
+    """Queue an AI-powered image to audio conversion"""
     try:
         print("Received image file for AI conversion.")
 
-        # Create directories if they don't exist
-        audio_dir = BASE_DIR / "audio_files"
-        os.makedirs(audio_dir, exist_ok=True)
-
-        # Get form data
-        input_image = request.FILES['image_file']
-        voice_preference = request.POST.get('voice_preference', 'Rachel')
-        description_style = request.POST.get('description_style', '')
-
-        print(f"Processing image: {input_image.name}")
-        print(f"Voice preference: {voice_preference}")
-        print(f"Description style: {description_style}")
-
-        # Create conversion session
-        session = ConversionSession.objects.create(
-            conversion_type='image_to_audio',
-            input_file=input_image,
-            description_prompt=f"Voice: {voice_preference}, Style: {description_style}",
-            processing_status='processing'
-        )
-
-        # Save input file
-        input_path = BASE_DIR / "uploads" / f"image_{session.session_id}.png"
-        os.makedirs(input_path.parent, exist_ok=True)
-
-        with open(input_path, 'wb+') as destination:
-            for chunk in input_image.chunks():
-                destination.write(chunk)
-
-        print(f"Saved input image to: {input_path}")
-
-        # Convert using AI
-        converter = convert.AIConverter()
-        print("Starting AI conversion...")
-        result = converter.image_to_audio(
-            str(input_path), voice_preference, description_style)
-
-        print(f"AI conversion result: {result}")
-
-        if result['success']:
-            # Save output audio
-            output_path = audio_dir / f"ai_generated_{session.session_id}.mp3"
-            import shutil
-            shutil.copy2(result['output_path'], output_path)
-            os.unlink(result['output_path'])  # Clean up temp file
-
-            print(f"Saved output audio to: {output_path}")
-
-            # Update session
-            session.output_file = str(output_path)
-            session.ai_model_used = result['ai_model_used']
-            session.processing_status = 'completed'
-            session.completed_at = timezone.now()
-            session.save()
-
-            # Read audio file data
-            with open(output_path, "rb") as audio_file:
-                audio_data = base64.b64encode(
-                    audio_file.read()).decode('utf-8')
-
-            response_data = {
-                'type': 'audio',
-                'audio': audio_data,
-                'image_description': result.get('image_description', ''),
-                'voice_used': result.get('voice_used', 'Rachel'),
-                'session_id': str(session.session_id),
-                'ai_model_used': result['ai_model_used']
-            }
-
-            print("Sending AI-generated audio data as response.")
-            return JsonResponse(response_data, content_type='application/json', status=200)
-        else:
-            # Update session with error
-            session.processing_status = 'failed'
-            session.error_message = result['error']
-            session.save()
-
-            # Check if it's a quota error
-            error_message = result['error']
-            if 'insufficient_quota' in error_message or 'quota' in error_message.lower():
-                error_response = {
-                    'type': 'quota_error',
-                    'error': 'OpenAI API quota exceeded. Please check your billing and try again later.',
-                    'details': error_message
-                }
-            else:
-                error_response = {
-                    'type': 'error',
-                    'error': error_message
-                }
-            
-            print(f"AI conversion failed: {error_message}")
-            return JsonResponse(error_response, status=500)
+        session, reused = sessions.image_to_audio_session(
+            request.FILES['image_file'], **_image_to_audio_options(request),
+            processing_status='pending')
+        if reused:
+            return _reused_response(session)
+
+        print(f"Queued image to audio conversion {session.session_id}")
+        return _queued_response(session)
 
     except Exception as e:
         print(f"Error in ai_image_to_audio: {e}")
         import traceback
         traceback.print_exc()
-        
-        # Check if it's a quota error
-        error_message = str(e)
-        if 'insufficient_quota' in error_message or 'quota' in error_message.lower():
-            error_response = {
-                'type': 'quota_error',
-                'error': 'OpenAI API quota exceeded. Please check your billing and try again later.',
-                'details': error_message
-            }
+        return JsonResponse(sessions.error_payload(str(e)), status=500)
+
+
+async def stream_image_to_audio(request):
+    """
+    AI-powered image to audio conversion that streams the narration back as
+    MP3 while it is still being generated. The session's metadata can be
+    fetched from the X-Status-Url header once the stream ends.
+    """
+    if request.method != 'POST':
+        return HttpResponseNotAllowed(['POST'])
+
+    try:
+        print("Received image file for streamed AI conversion.")
+
+        if 'image_file' not in request.FILES:
+            return JsonResponse({'error': 'No file provided'}, status=400)
+
+        # Streamed sessions run in this request, which holds their lease so
+        # the queue workers leave them alone unless this process dies
+        session, reused = await sync_to_async(sessions.image_to_audio_session)(
+            request.FILES['image_file'], **_image_to_audio_options(request),
+            **jobs.stream_claim())
+        if reused:
+            response = serve_file(
+                request, session.output_file.name, sessions.OUTPUT_CONTENT_TYPES['image_to_audio'])
         else:
-            error_response = {
-                'type': 'error',
-                'error': error_message
-            }
-        
-        return JsonResponse(error_response, status=500)
+            response = StreamingHttpResponse(
+                jobs.astream_image_to_audio(session), content_type='audio/mpeg')
+            response.headers['Cache-Control'] = 'no-store'
+            # Stop reverse proxies from buffering the stream
+            response.headers['X-Accel-Buffering'] = 'no'
+
+        response.headers['X-Session-Id'] = str(session.session_id)
+        response.headers['X-Status-Url'] = sessions.status_url(session)
+        return response
+
+    except Exception as e:
+        print(f"Error in stream_image_to_audio: {e}")
+        import traceback
+        traceback.print_exc()
+        return JsonResponse(sessions.error_payload(str(e)), status=500)
+
+
+# Django 4.2's csrf_exempt wraps views in a sync function, so mark the async view directly
+stream_image_to_audio.csrf_exempt = True
 
 
 @csrf_exempt
 def handle_recorded_audio(request):
-    """Handle recorded audio from the frontend"""
+    """Queue a conversion for audio recorded in the frontend"""
     try:
         print("Received recorded audio data.")
 
@@ -284,124 +175,409 @@ def handle_recorded_audio(request):
             # Remove data URL prefix if present
             if ',' in audio_data:
                 audio_data = audio_data.split(',')[1]
-            
+
             audio_bytes = base64.b64decode(audio_data)
             print(f"Successfully decoded {len(audio_bytes)} bytes of audio data")
         except Exception as e:
             print(f"Error decoding base64 audio data: {e}")
             return JsonResponse({'error': 'Invalid audio data format'}, status=400)
 
-        # Create conversion session
-        session = ConversionSession.objects.create(
-            conversion_type='audio_to_image',
-            description_prompt=description_prompt,
-            processing_status='processing'
-        )
-
-        # Save recorded audio
-        audio_dir = BASE_DIR / "uploads"
-        os.makedirs(audio_dir, exist_ok=True)
-        input_path = audio_dir / f"recorded_{session.session_id}.webm"
-
-        with open(input_path, 'wb') as f:
-            f.write(audio_bytes)
-
-        print(f"Saved recorded audio to: {input_path}")
-        
-        # Verify file exists and has content
-        if not input_path.exists():
-            print(f"Error: File was not created: {input_path}")
-            return JsonResponse({'error': 'Failed to save audio file'}, status=500)
-            
-        file_size = input_path.stat().st_size
-        print(f"File size: {file_size} bytes")
-        
-        if file_size == 0:
-            print(f"Error: File is empty: {input_path}")
-            return JsonResponse({'error': 'Audio file is empty'}, status=500)
-
-        # Convert using AI
-        print(f"Starting AI conversion for recorded audio...")
-        converter = convert.AIConverter()
-        result = converter.audio_to_image(str(input_path), description_prompt)
-
-        print(f"AI conversion result: {result}")
-
-        if result['success']:
-            # Save output image
-            image_dir = BASE_DIR / "image_files"
-            os.makedirs(image_dir, exist_ok=True)
-            output_path = image_dir / f"ai_generated_{session.session_id}.png"
-
-            import shutil
-            shutil.copy2(result['output_path'], output_path)
-            os.unlink(result['output_path'])  # Clean up temp file
-
-            # Update session
-            session.output_file = str(output_path)
-            session.ai_model_used = result['ai_model_used']
-            session.processing_status = 'completed'
-            session.completed_at = timezone.now()
-            session.save()
-
-            # Read image file data
-            with open(output_path, "rb") as img_file:
-                image_data = base64.b64encode(img_file.read()).decode('utf-8')
-
-            response_data = {
-                'type': 'image',
-                'image': image_data,
-                'transcription': result.get('transcription', ''),
-                'image_description': result.get('image_description', ''),
-                'session_id': str(session.session_id),
-                'ai_model_used': result['ai_model_used']
-            }
-
-            print("Sending AI-generated image from recorded audio.")
-            return JsonResponse(response_data, content_type='application/json', status=200)
-        else:
-            # Update session with error
-            session.processing_status = 'failed'
-            session.error_message = result['error']
-            session.save()
-
-            # Check if it's a quota error
-            error_message = result['error']
-            if 'insufficient_quota' in error_message or 'quota' in error_message.lower():
-                error_response = {
-                    'type': 'quota_error',
-                    'error': 'OpenAI API quota exceeded. Please check your billing and try again later.',
-                    'details': error_message
-                }
-            else:
-                error_response = {
-                    'type': 'error',
-                    'error': error_message
-                }
+        if not audio_bytes:
+            print("Error: Recorded audio is empty")
+            return JsonResponse({'error': 'Audio file is empty'}, status=400)
 
-            print(f"AI conversion failed: {error_message}")
-            return JsonResponse(error_response, status=500)
+        recording = ContentFile(audio_bytes, name=uploads.recording_name(uuid.uuid4()))
+        return _queue_recording(recording, description_prompt)
 
     except Exception as e:
         print(f"Error in handle_recorded_audio: {e}")
         import traceback
         traceback.print_exc()
-        
-        # Check if it's a quota error
-        error_message = str(e)
-        if 'insufficient_quota' in error_message or 'quota' in error_message.lower():
-            error_response = {
-                'type': 'quota_error',
-                'error': 'OpenAI API quota exceeded. Please check your billing and try again later.',
-                'details': error_message
-            }
+        return JsonResponse(sessions.error_payload(str(e)), status=500)
+
+
+def _queue_recording(recording, description_prompt):
+    """Queue (or answer from the result cache) a conversion of an uploaded recording"""
+    session, reused = sessions.audio_to_image_session(
+        recording, description_prompt, processing_status='pending')
+    if reused:
+        return _reused_response(session)
+
+    print(f"Queued recorded audio conversion {session.session_id}")
+    return _queued_response(session)
+
+
+@csrf_exempt
+@require_POST
+def upload_recording(request):
+    """
+    Queue a conversion for a recording sent in one request, either as the
+    `recording` field of a multipart form or as the raw request body. Raw
+    bodies take the description prompt from the query string.
+    """
+    try:
+        if request.content_type == 'multipart/form-data':
+            recording = request.FILES.get('recording')
+            if recording is None:
+                return JsonResponse({'error': 'No audio data provided'}, status=400)
+            if recording.size > settings.RECORDING_MAX_BYTES:
+                return JsonResponse({'error': 'Recording is too large'}, status=413)
+            description_prompt = request.POST.get('description_prompt', '')
         else:
-            error_response = {
-                'type': 'error',
-                'error': error_message
-            }
-        
-        return JsonResponse(error_response, status=500)
+            recording = uploads.receive_body(
+                request, uploads.recording_name(uuid.uuid4(), request.content_type))
+            description_prompt = request.GET.get('description_prompt', '')
+    except uploads.UploadError as e:
+        return JsonResponse({'error': str(e)}, status=e.status)
+
+    try:
+        print(f"Received {recording.size} bytes of recorded audio.")
+        with recording:
+            return _queue_recording(recording, description_prompt)
+
+    except Exception as e:
+        print(f"Error in upload_recording: {e}")
+        import traceback
+        traceback.print_exc()
+        return JsonResponse(sessions.error_payload(str(e)), status=500)
+
+
+def _upload_payload(upload):
+    return {
+        'upload_id': str(upload.upload_id),
+        'offset': upload.received_bytes,
+        'upload_url': reverse('homepage:recording_upload', args=[upload.upload_id]),
+        'complete_url': reverse('homepage:complete_recording_upload', args=[upload.upload_id]),
+    }
+
+
+def _upload_response(upload, status=200):
+    response = JsonResponse(_upload_payload(upload), status=status)
+    response['Upload-Offset'] = str(upload.received_bytes)
+    return response
+
+
+@csrf_exempt
+@require_POST
+def start_recording_upload(request):
+    """
+    Begin a resumable recording upload. The client then PATCHes chunks of
+    the recording to `upload_url`, each with an Upload-Offset header, and
+    finally POSTs to `complete_url`.
+    """
+    upload = uploads.start(request.POST.get('content_type', ''))
+    print(f"Started recording upload {upload.upload_id}")
+    response = _upload_response(upload, status=201)
+    response['Location'] = _upload_payload(upload)['upload_url']
+    return response
+
+
+@csrf_exempt
+def recording_upload(request, upload_id):
+    """
+    GET/HEAD reports how much of an upload has arrived, PATCH appends the
+    chunk in the body at the Upload-Offset header, DELETE abandons it
+    """
+    if request.method not in ('GET', 'HEAD', 'PATCH', 'DELETE'):
+        return HttpResponseNotAllowed(['GET', 'HEAD', 'PATCH', 'DELETE'])
+
+    upload = RecordingUpload.objects.filter(upload_id=upload_id).first()
+    if upload is None:
+        return JsonResponse({'type': 'error', 'error': 'Upload not found'}, status=404)
+
+    if request.method == 'DELETE':
+        uploads.discard(upload)
+        return HttpResponse(status=204)
+    if request.method != 'PATCH':
+        return _upload_response(upload)
+
+    try:
+        offset = int(request.headers['Upload-Offset'])
+    except (KeyError, ValueError):
+        return JsonResponse({'error': 'Missing or invalid Upload-Offset header'}, status=400)
+
+    try:
+        uploads.append(upload, offset, request)
+    except uploads.OffsetMismatch as e:
+        upload.received_bytes = e.offset
+        return _upload_response(upload, status=409)
+    except uploads.UploadError as e:
+        return JsonResponse({'error': str(e)}, status=e.status)
+    return _upload_response(upload)
+
+
+@csrf_exempt
+@require_POST
+def complete_recording_upload(request, upload_id):
+    """Queue the conversion of a finished resumable upload"""
+    upload = RecordingUpload.objects.filter(upload_id=upload_id).first()
+    if upload is None:
+        return JsonResponse({'type': 'error', 'error': 'Upload not found'}, status=404)
+
+    try:
+        recording = uploads.assemble(upload)
+    except uploads.UploadError as e:
+        return JsonResponse({'error': str(e)}, status=e.status)
+
+    try:
+        print(f"Completed recording upload {upload.upload_id} of {recording.size} bytes.")
+        with recording:
+            response = _queue_recording(recording, request.POST.get('description_prompt', ''))
+        # The file has been moved into place, or was not needed after a cache hit
+        uploads.discard(upload)
+        return response
+
+    except Exception as e:
+        print(f"Error in complete_recording_upload: {e}")
+        import traceback
+        traceback.print_exc()
+        return JsonResponse(sessions.error_payload(str(e)), status=500)
+
+
+async def conversion_status(request, session_id):
+    """Report the state of a queued conversion, with its result once done"""
+    if request.method != 'GET':
+        return HttpResponseNotAllowed(['GET'])
+
+    try:
+        session = await ConversionSession.objects.aget(session_id=session_id)
+    except ConversionSession.DoesNotExist:
+        return JsonResponse({'type': 'error', 'error': 'Conversion not found'}, status=404)
+
+    return JsonResponse(sessions.session_payload(session), status=200)
+
+
+@require_safe
+def conversion_result(request, session_id):
+    """
+    Stream the generated image or audio of a completed conversion. Images
+    are sent as a variant in the best format the Accept header names,
+    optionally resized with `w`; `original=1` sends the PNG itself. Audio
+    is sent as the Opus or AAC transcode asked for with `format` or named
+    in the Accept header, otherwise as the MP3.
+    """
+    session = ConversionSession.objects.filter(
+        session_id=session_id, processing_status='completed').first()
+    if session is None or not session.output_file or not os.path.exists(session.output_file.name):
+        return JsonResponse({'type': 'error', 'error': 'Result not found'}, status=404)
+
+    if (session.conversion_type == 'audio_to_image' and settings.IMAGE_VARIANTS_ENABLED
+            and not request.GET.get('original')):
+        try:
+            width = int(request.GET['w']) if 'w' in request.GET else None
+        except ValueError:
+            width = 0
+        if width is not None and width < 1:
+            return JsonResponse({'type': 'error', 'error': 'w must be a positive number'}, status=400)
+
+        path, content_type = derivatives.image_variant(
+            session.output_file.name, width, request.headers.get('Accept', ''))
+        response = serve_file(request, path, content_type)
+        patch_vary_headers(response, ['Accept'])
+        return response
+
+    if session.conversion_type == 'image_to_audio' and settings.AUDIO_VARIANTS_ENABLED:
+        try:
+            audio_format = derivatives.choose_audio_format(
+                request.GET.get('format', ''), request.headers.get('Accept', ''))
+        except ValueError as e:
+            return JsonResponse({'type': 'error', 'error': str(e)}, status=400)
+
+        path, content_type = session.output_file.name, sessions.OUTPUT_CONTENT_TYPES['image_to_audio']
+        if audio_format:
+            try:
+                path, content_type = derivatives.audio_variant(path, audio_format)
+            except AudioDecodeError as e:
+                # The MP3 plays everywhere the transcode would have
+                print(f"Could not transcode {path} to {audio_format}: {e}")
+        response = serve_file(request, path, content_type)
+        patch_vary_headers(response, ['Accept'])
+        return response
+
+    return serve_file(request, session.output_file.name,
+                      sessions.OUTPUT_CONTENT_TYPES[session.conversion_type])
+
+
+def _history_item_payload(session):
+    """Metadata and URLs of a past conversion, without its results"""
+    has_result = session.processing_status == 'completed' and bool(session.output_file)
+    return {
+        'session_id': str(session.session_id),
+        'conversion_type': session.conversion_type,
+        'status': session.processing_status,
+        'created_at': session.created_at.isoformat(),
+        'completed_at': session.completed_at.isoformat() if session.completed_at else None,
+        'filename': session.original_filename,
+        'status_url': sessions.status_url(session),
+        'result_url': (reverse('homepage:conversion_result', args=[session.session_id])
+                       if has_result else None),
+    }
+
+
+@require_safe
+def conversion_history(request):
+    """
+    List past conversions newest first, a page at a time. Optional filters
+    are `type` and `status`; `limit` sets the page size and `cursor`
+    continues from the previous page (its `next_cursor`).
+    """
+    conversion_type = request.GET.get('type', '')
+    if conversion_type and conversion_type not in sessions.OUTPUT_CONTENT_TYPES:
+        return JsonResponse({'type': 'error', 'error': 'Unknown conversion type'}, status=400)
+    status = request.GET.get('status', '')
+    if status and status not in dict(ConversionSession.STATUS_CHOICES):
+        return JsonResponse({'type': 'error', 'error': 'Unknown status'}, status=400)
+    try:
+        limit = int(request.GET.get('limit', history.PAGE_SIZE))
+    except ValueError:
+        limit = 0
+    if limit < 1:
+        return JsonResponse({'type': 'error', 'error': 'limit must be a positive number'}, status=400)
+
+    try:
+        page_sessions, next_cursor = history.page(
+            conversion_type, status, request.GET.get('cursor'), min(limit, history.MAX_PAGE_SIZE))
+    except history.CursorError as e:
+        return JsonResponse({'type': 'error', 'error': str(e)}, status=400)
+
+    next_url = None
+    if next_cursor:
+        query = request.GET.copy()
+        query['cursor'] = next_cursor
+        next_url = f"{reverse('homepage:conversion_history')}?{query.urlencode()}"
+
+    return JsonResponse({
+        'type': 'history',
+        'items': [_history_item_payload(session) for session in page_sessions],
+        'next_cursor': next_cursor,
+        'next': next_url,
+    }, status=200)
+
+
+@csrf_exempt
+@require_POST
+def batch_convert(request):
+    """
+    Queue one conversion per uploaded file under a new batch. Files come
+    from the `files` field and/or zip archives in the `archive` field; the
+    options apply to every item.
+    """
+    conversion_type = request.POST.get('conversion_type', '')
+    if conversion_type not in sessions.OUTPUT_CONTENT_TYPES:
+        return JsonResponse({'error': 'Unknown conversion type'}, status=400)
+
+    try:
+        files = batches.collect_uploads(
+            conversion_type, request.FILES.getlist('files'), request.FILES.getlist('archive'))
+    except batches.BatchError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+
+    try:
+        print(f"Received batch of {len(files)} files for {conversion_type}.")
+
+        # Create every item before workers can see any, so the batch is complete
+        with transaction.atomic():
+            batch = ConversionBatch.objects.create(
+                conversion_type=conversion_type, item_count=len(files))
+            items = []
+            for index, upload in enumerate(files):
+                item_fields = {
+                    'batch': batch,
+                    'batch_index': index,
+                    'original_filename': upload.name,
+                }
+                if conversion_type == 'audio_to_image':
+                    session, _ = sessions.audio_to_image_session(
+                        upload, request.POST.get('description_prompt', ''), item_fields,
+                        processing_status='pending')
+                else:
+                    session, _ = sessions.image_to_audio_session(
+                        upload, **_image_to_audio_options(request), item_fields=item_fields,
+                        processing_status='pending')
+                items.append(_batch_item_payload(session))
+
+        print(f"Queued batch {batch.batch_id}")
+        return JsonResponse({
+            'type': 'batch',
+            'batch_id': str(batch.batch_id),
+            'item_count': batch.item_count,
+            'status_url': reverse('homepage:batch_status', args=[batch.batch_id]),
+            'stream_url': reverse('homepage:batch_stream', args=[batch.batch_id]),
+            'items': items,
+        }, status=202)
+
+    except Exception as e:
+        print(f"Error in batch_convert: {e}")
+        import traceback
+        traceback.print_exc()
+        return JsonResponse(sessions.error_payload(str(e)), status=500)
+    finally:
+        # Extracted archive members that were not moved into place
+        for upload in files:
+            upload.close()
+
+
+def _batch_item_payload(session):
+    payload = sessions.session_payload(session)
+    payload.update(index=session.batch_index, filename=session.original_filename)
+    return payload
+
+
+async def batch_status(request, batch_id):
+    """Report the state of every item in a batch"""
+    if request.method != 'GET':
+        return HttpResponseNotAllowed(['GET'])
+
+    try:
+        batch = await ConversionBatch.objects.aget(batch_id=batch_id)
+    except ConversionBatch.DoesNotExist:
+        return JsonResponse({'type': 'error', 'error': 'Batch not found'}, status=404)
+
+    items = [_batch_item_payload(session) async for session in batch.items.order_by('batch_index')]
+    counts = {status: 0 for status, _ in ConversionSession.STATUS_CHOICES}
+    for item in items:
+        counts[item['status']] += 1
+
+    return JsonResponse({
+        'type': 'batch',
+        'batch_id': str(batch.batch_id),
+        'item_count': batch.item_count,
+        'counts': counts,
+        'items': items,
+    }, status=200)
+
+
+async def _batch_lines(batch):
+    """NDJSON lines for a batch: one per item as it finishes, then a summary"""
+    counts = {'completed': 0, 'failed': 0}
+    async for session in batches.finished_items(batch):
+        counts[session.processing_status] += 1
+        yield json.dumps(_batch_item_payload(session)) + '\n'
+    yield json.dumps({'type': 'batch_complete', 'batch_id': str(batch.batch_id), **counts}) + '\n'
+
+
+async def batch_stream(request, batch_id):
+    """Stream each item's result of a batch as newline-delimited JSON as soon as it finishes"""
+    if request.method != 'GET':
+        return HttpResponseNotAllowed(['GET'])
+
+    try:
+        batch = await ConversionBatch.objects.aget(batch_id=batch_id)
+    except ConversionBatch.DoesNotExist:
+        return JsonResponse({'type': 'error', 'error': 'Batch not found'}, status=404)
+
+    response = StreamingHttpResponse(_batch_lines(batch), content_type='application/x-ndjson')
+    response.headers['Cache-Control'] = 'no-store'
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
+
+@require_safe
+def prometheus_metrics(request):
+    """Conversion latency, size, cache and error metrics for Prometheus"""
+    if not settings.METRICS_ENABLED:
+        return JsonResponse({'type': 'error', 'error': 'Metrics are disabled'}, status=404)
+    return HttpResponse(metrics.render(), content_type=metrics.CONTENT_TYPE)
 
 # Legacy functions for backward compatibility
 
@@ -13,4 +13,25 @@ from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'audiovisualsys.settings')
 
-application = get_asgi_application()
+django_application = get_asgi_application()
+
+# Warm the Whisper models before workers fork so they share the weights
+from django.conf import settings  # noqa: E402
+
+if settings.WHISPER_PRELOAD:
+    from app import transcription  # noqa: E402
+
+    transcription.preload()
+
+from app import live  # noqa: E402
+
+
+async def application(scope, receive, send):
+    """Django for HTTP, plus the live transcription WebSocket"""
+    if scope['type'] == 'websocket':
+        if scope['path'] == live.PATH:
+            return await live.application(scope, receive, send)
+        # Reject any other WebSocket
+        await receive()
+        return await send({'type': 'websocket.close', 'code': 1000})
+    return await django_application(scope, receive, send)
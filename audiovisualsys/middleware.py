@@ -1,18 +1,30 @@
 # middleware.py
 
 import logging
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
 from django.http import JsonResponse
 
 logger = logging.getLogger(__name__)
 
 class CustomExceptionMiddleware:
+    sync_capable = True
+    async_capable = True
+
     def __init__(self, get_response):
         self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
 
     def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
         response = self.get_response(request)
         return response
 
+    async def __acall__(self, request):
+        response = await self.get_response(request)
+        return response
+
     def process_exception(self, request, exception):
         logger.error(f"Exception: {str(exception)}", exc_info=True)
         return JsonResponse({'error': 'An internal error occurred. Please try again later.'}, status=500)
@@ -12,6 +12,7 @@ https://docs.djangoproject.com/en/4.2/ref/settings/
 
 from pathlib import Path
 import os
+import tempfile
 from dotenv import load_dotenv
 
 # Load environment variables
@@ -107,10 +108,23 @@ WSGI_APPLICATION = 'audiovisualsys.wsgi.application'
 DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
+        # Point web and worker containers at the same file to share the job queue
+        'NAME': os.getenv('DATABASE_PATH', BASE_DIR / 'db.sqlite3'),
+        # Seconds a write waits for another connection's write lock
+        'OPTIONS': {'timeout': int(os.getenv('DATABASE_BUSY_TIMEOUT', '20'))},
+        # Connections are per thread; worker threads keep theirs across jobs
+        'CONN_MAX_AGE': int(os.getenv('DATABASE_CONN_MAX_AGE', '600')),
+        'CONN_HEALTH_CHECKS': True,
+        # A file rather than in-memory, so tests see the locking real processes do
+        'TEST': {'NAME': os.getenv(
+            'DATABASE_TEST_PATH', os.path.join(tempfile.gettempdir(), 'audiovisualsys_test.sqlite3'))},
     }
 }
 
+# Set on every SQLite connection (see app/database.py)
+SQLITE_JOURNAL_MODE = os.getenv('SQLITE_JOURNAL_MODE', 'WAL')
+SQLITE_SYNCHRONOUS = os.getenv('SQLITE_SYNCHRONOUS', 'NORMAL')
+
 
 # Password validation
 # https://docs.djangoproject.com/en/4.2/ref/settings/#auth-password-validators
@@ -194,6 +208,120 @@ LOGGING = {
 # AI API Configuration
 OPENAI_API_KEY = os.getenv('OPENAI_API_KEY')
 ELEVENLABS_API_KEY = os.getenv('ELEVENLABS_API_KEY')
+# API endpoints, e.g. to point at the local stand-ins used by `manage.py load_test`
+OPENAI_BASE_URL = os.getenv('OPENAI_BASE_URL') or None
+ELEVENLABS_BASE_URL = os.getenv('ELEVEN_BASE_URL', 'https://api.elevenlabs.io/v1')
+
+# Whisper model configuration
+WHISPER_MODEL_SIZE = os.getenv('WHISPER_MODEL_SIZE', 'base')
+# Leave unset to let Whisper pick CUDA when available, otherwise CPU
+WHISPER_DEVICE = os.getenv('WHISPER_DEVICE') or None
+# Load models at startup (in the gunicorn master when run with --preload)
+WHISPER_PRELOAD = os.getenv('WHISPER_PRELOAD', 'False').lower() == 'true'
+# Threads available to async code for Whisper inference
+WHISPER_MAX_WORKERS = int(os.getenv('WHISPER_MAX_WORKERS', '2'))
+WHISPER_PRELOAD_MODELS = [
+    name.strip() for name in os.getenv('WHISPER_PRELOAD_MODELS', WHISPER_MODEL_SIZE).split(',')
+    if name.strip()
+]
+# Transcription backend (see app/transcription.py): 'whisper' or the
+# int8-quantized CPU backend 'whisper-int8'
+TRANSCRIPTION_BACKEND = os.getenv('TRANSCRIPTION_BACKEND', 'whisper')
+# torch threads for 'whisper-int8'; 0 uses every core
+TRANSCRIPTION_THREADS = int(os.getenv('TRANSCRIPTION_THREADS', '0'))
+# Trim silence before transcribing (see app/audio.py)
+VAD_ENABLED = os.getenv('VAD_ENABLED', 'True').lower() == 'true'
+# Audio longer than this is split at pauses and the chunks are transcribed in
+# parallel by TRANSCRIPTION_PROCESSES processes, each loading its own model
+TRANSCRIPTION_CHUNK_SECONDS = float(os.getenv('TRANSCRIPTION_CHUNK_SECONDS', '60'))
+TRANSCRIPTION_PROCESSES = int(os.getenv('TRANSCRIPTION_PROCESSES', str(min(os.cpu_count() or 1, 4))))
+
+# Pooled outbound HTTP clients (see app/http_clients.py); timeouts in seconds
+HTTP_POOL_MAX_CONNECTIONS = int(os.getenv('HTTP_POOL_MAX_CONNECTIONS', '100'))
+HTTP_POOL_MAX_KEEPALIVE = int(os.getenv('HTTP_POOL_MAX_KEEPALIVE', '20'))
+HTTP_KEEPALIVE_EXPIRY = float(os.getenv('HTTP_KEEPALIVE_EXPIRY', '60'))
+HTTP_CONNECT_TIMEOUT = float(os.getenv('HTTP_CONNECT_TIMEOUT', '10'))
+HTTP_TIMEOUT = float(os.getenv('HTTP_TIMEOUT', '60'))
+HTTP_DOWNLOAD_TIMEOUT = float(os.getenv('HTTP_DOWNLOAD_TIMEOUT', '60'))
+OPENAI_IMAGE_TIMEOUT = float(os.getenv('OPENAI_IMAGE_TIMEOUT', '120'))
+
+# Concurrent calls per provider and process (see app/limits.py). Whisper is
+# CPU-bound locally; OpenAI and ElevenLabs cap concurrent requests per account
+PROVIDER_CONCURRENCY = {
+    'whisper': WHISPER_MAX_WORKERS,
+    'openai': int(os.getenv('OPENAI_CONCURRENCY', '16')),
+    'elevenlabs': int(os.getenv('ELEVENLABS_CONCURRENCY', '4')),
+}
+
+# Request budgets per API endpoint, in requests per minute, shared by every
+# process on the host through a small SQLite file (see app/rate_limit.py)
+RATE_LIMIT_ENABLED = os.getenv('RATE_LIMIT_ENABLED', 'True').lower() == 'true'
+RATE_LIMIT_DB_PATH = os.getenv(
+    'RATE_LIMIT_DB_PATH', str(Path(DATABASES['default']['NAME']).with_name('rate_limits.sqlite3')))
+RATE_LIMITS = {
+    'chat': float(os.getenv('OPENAI_CHAT_RPM', '500')),
+    'images': float(os.getenv('OPENAI_IMAGES_RPM', '5')),
+    'tts': float(os.getenv('ELEVENLABS_RPM', '100')),
+}
+# Seconds of budget that may be used in one burst
+RATE_LIMIT_BURST_SECONDS = float(os.getenv('RATE_LIMIT_BURST_SECONDS', '10'))
+# Fail instead of queueing for longer than this
+RATE_LIMIT_MAX_WAIT = float(os.getenv('RATE_LIMIT_MAX_WAIT', '300'))
+# Retries of transient API failures, with jittered exponential backoff of at
+# most API_BACKOFF_MAX; a Retry-After is waited out in full, up to
+# RATE_LIMIT_MAX_WAIT
+API_MAX_RETRIES = int(os.getenv('API_MAX_RETRIES', '4'))
+API_BACKOFF_BASE = float(os.getenv('API_BACKOFF_BASE', '1.0'))
+API_BACKOFF_MAX = float(os.getenv('API_BACKOFF_MAX', '30'))
+
+# Batch conversions (see app/batches.py)
+BATCH_MAX_ITEMS = int(os.getenv('BATCH_MAX_ITEMS', '100'))
+BATCH_MAX_ITEM_BYTES = int(os.getenv('BATCH_MAX_ITEM_BYTES', str(50 * 1024 * 1024)))
+BATCH_STREAM_POLL_INTERVAL = float(os.getenv('BATCH_STREAM_POLL_INTERVAL', '1.0'))
+
+# Conversion job queue (see app/jobs.py and `manage.py run_conversion_workers`)
+CONVERSION_WORKER_CONCURRENCY = int(os.getenv('CONVERSION_WORKER_CONCURRENCY', '4'))
+# With --async, jobs share one event loop and mostly wait on the AI APIs
+CONVERSION_WORKER_ASYNC = os.getenv('CONVERSION_WORKER_ASYNC', 'False').lower() == 'true'
+CONVERSION_WORKER_ASYNC_CONCURRENCY = int(os.getenv('CONVERSION_WORKER_ASYNC_CONCURRENCY', '100'))
+CONVERSION_WORKER_POLL_INTERVAL = float(os.getenv('CONVERSION_WORKER_POLL_INTERVAL', '1.0'))
+CONVERSION_JOB_LEASE_SECONDS = int(os.getenv('CONVERSION_JOB_LEASE_SECONDS', '60'))
+CONVERSION_JOB_MAX_ATTEMPTS = int(os.getenv('CONVERSION_JOB_MAX_ATTEMPTS', '3'))
+
+# Prometheus metrics at /metrics, built from the stage timings stored per
+# conversion (see app/metrics.py)
+METRICS_ENABLED = os.getenv('METRICS_ENABLED', 'True').lower() == 'true'
+
+# Result cache for repeated conversions (see app/result_cache.py)
+RESULT_CACHE_ENABLED = os.getenv('RESULT_CACHE_ENABLED', 'True').lower() == 'true'
+RESULT_CACHE_TTL_SECONDS = int(os.getenv('RESULT_CACHE_TTL_SECONDS', str(7 * 24 * 60 * 60)))
+RESULT_CACHE_MAX_ENTRIES = int(os.getenv('RESULT_CACHE_MAX_ENTRIES', '10000'))
+
+# Image pre-processing before GPT-4o analysis (see app/image_prep.py)
+VISION_DETAIL = os.getenv('VISION_DETAIL', 'auto')  # auto, low or high
+VISION_IMAGE_FORMAT = os.getenv('VISION_IMAGE_FORMAT', 'JPEG')  # JPEG or WEBP
+VISION_IMAGE_QUALITY = int(os.getenv('VISION_IMAGE_QUALITY', '85'))
+# Refuse images above this many pixels before decoding them (decompression bombs)
+IMAGE_MAX_PIXELS = int(os.getenv('IMAGE_MAX_PIXELS', str(50 * 1000 * 1000)))
+
+# Resized WebP/AVIF/JPEG variants of generated images (see app/derivatives.py)
+IMAGE_VARIANTS_ENABLED = os.getenv('IMAGE_VARIANTS_ENABLED', 'True').lower() == 'true'
+IMAGE_VARIANT_WIDTHS = [
+    int(width) for width in os.getenv('IMAGE_VARIANT_WIDTHS', '256,512,768').split(',') if width.strip()]
+
+# Opus/AAC transcodes of generated speech (see app/derivatives.py)
+AUDIO_VARIANTS_ENABLED = os.getenv('AUDIO_VARIANTS_ENABLED', 'True').lower() == 'true'
+AUDIO_VARIANT_OPUS_BITRATE = os.getenv('AUDIO_VARIANT_OPUS_BITRATE', '32k')
+AUDIO_VARIANT_AAC_BITRATE = os.getenv('AUDIO_VARIANT_AAC_BITRATE', '48k')
+
+# Image and audio variants together; the least recently used are evicted past this
+VARIANT_CACHE_MAX_BYTES = int(os.getenv(
+    'VARIANT_CACHE_MAX_BYTES', os.getenv('IMAGE_VARIANT_CACHE_MAX_BYTES', str(1024 * 1024 * 1024))))
+
+# Near-duplicate image reuse for image_to_audio (see app/image_index.py)
+IMAGE_DEDUP_ENABLED = os.getenv('IMAGE_DEDUP_ENABLED', 'True').lower() == 'true'
+# Maximum Hamming distance (out of 64 bits) between perceptual hashes
+IMAGE_DEDUP_MAX_DISTANCE = int(os.getenv('IMAGE_DEDUP_MAX_DISTANCE', '4'))
 
 # File upload settings
 MEDIA_URL = '/media/'
@@ -203,4 +331,41 @@ MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 MAX_UPLOAD_SIZE = 10 * 1024 * 1024
 
 # Data upload max memory size
-DATA_UPLOAD_MAX_MEMORY_SIZE = 10 * 1024 * 1024
\ No newline at end of file
+DATA_UPLOAD_MAX_MEMORY_SIZE = 10 * 1024 * 1024
+
+# Receive uploads inside MEDIA_ROOT, so storing them is a rename rather than
+# a copy across filesystems (see app/storage.py)
+FILE_UPLOAD_TEMP_DIR = os.path.join(MEDIA_ROOT, 'uploads', 'incoming')
+
+# Generated outputs go to image_files/ and audio_files/ under this directory
+OUTPUT_ROOT = os.getenv('OUTPUT_ROOT', str(BASE_DIR))
+
+# Hash uploaded files while they are received, for the result cache
+FILE_UPLOAD_HANDLERS = [
+    'app.uploads.HashingMemoryFileUploadHandler',
+    'app.uploads.HashingTemporaryFileUploadHandler',
+]
+
+# Streamed and resumable recording uploads (see app/uploads.py)
+RECORDING_MAX_BYTES = int(os.getenv('RECORDING_MAX_BYTES', str(200 * 1024 * 1024)))
+# Resumable uploads that receive nothing for this long are discarded
+RECORDING_UPLOAD_EXPIRY_SECONDS = int(os.getenv('RECORDING_UPLOAD_EXPIRY_SECONDS', str(24 * 60 * 60)))
+
+# Live transcription over a WebSocket while recording (see app/live.py)
+LIVE_TRANSCRIPTION_ENABLED = os.getenv('LIVE_TRANSCRIPTION_ENABLED', 'True').lower() == 'true'
+# Seconds between partial transcripts
+LIVE_TRANSCRIPTION_INTERVAL = float(os.getenv('LIVE_TRANSCRIPTION_INTERVAL', '2.0'))
+# Longest stretch of audio transcribed in one pass (Whisper works on 30 s)
+LIVE_TRANSCRIPTION_WINDOW_SECONDS = float(os.getenv('LIVE_TRANSCRIPTION_WINDOW_SECONDS', '30'))
+# Storage retention (see app/retention.py); 0 turns a limit off
+RETENTION_MAX_BYTES = int(os.getenv('RETENTION_MAX_BYTES', str(10 * 1024 * 1024 * 1024)))
+RETENTION_INPUT_MAX_AGE_SECONDS = int(os.getenv('RETENTION_INPUT_MAX_AGE_SECONDS', str(7 * 24 * 60 * 60)))
+RETENTION_OUTPUT_MAX_AGE_SECONDS = int(os.getenv('RETENTION_OUTPUT_MAX_AGE_SECONDS', str(30 * 24 * 60 * 60)))
+# Files younger than this are never deleted
+RETENTION_MIN_AGE_SECONDS = int(os.getenv('RETENTION_MIN_AGE_SECONDS', str(60 * 60)))
+# Files deleted per batch, and seconds to pause between batches
+RETENTION_BATCH_SIZE = int(os.getenv('RETENTION_BATCH_SIZE', '200'))
+RETENTION_BATCH_PAUSE = float(os.getenv('RETENTION_BATCH_PAUSE', '0.1'))
+# How often the conversion workers apply the policy; 0 leaves it to
+# `manage.py prune_storage`
+RETENTION_INTERVAL_SECONDS = int(os.getenv('RETENTION_INTERVAL_SECONDS', str(60 * 60)))
@@ -14,3 +14,11 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'audiovisualsys.settings')
 
 application = get_wsgi_application()
+
+# Warm the Whisper models before workers fork so they share the weights
+from django.conf import settings  # noqa: E402
+
+if settings.WHISPER_PRELOAD:
+    from app import transcription  # noqa: E402
+
+    transcription.preload()
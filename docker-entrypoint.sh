@@ -7,11 +7,29 @@ python manage.py migrate --noinput
 echo "Collecting static files..."
 python manage.py collectstatic --noinput --clear
 
-# Start Gunicorn
-exec gunicorn audiovisualsys.wsgi:application \
+# Allow the image to run other commands (e.g. a dedicated worker container)
+if [ "$#" -gt 0 ]; then
+    exec "$@"
+fi
+
+# Run the conversion workers next to the web server unless they have their own container
+if [ "$(echo "${CONVERSION_WORKERS_EMBEDDED:-True}" | tr '[:upper:]' '[:lower:]')" = "true" ]; then
+    echo "Starting conversion workers..."
+    python manage.py run_conversion_workers &
+fi
+
+# Load Whisper once in the master and share it with forked workers
+PRELOAD_FLAG=""
+if [ "$(echo "${WHISPER_PRELOAD:-False}" | tr '[:upper:]' '[:lower:]')" = "true" ]; then
+    PRELOAD_FLAG="--preload"
+fi
+
+# Start Gunicorn with ASGI workers so async views share one event loop per process
+exec gunicorn audiovisualsys.asgi:application \
+    -k uvicorn.workers.UvicornWorker \
+    $PRELOAD_FLAG \
     --bind 0.0.0.0:${PORT:-8000} \
     --workers ${WORKERS:-2} \
-    --threads ${THREADS:-4} \
     --timeout ${TIMEOUT:-120} \
     --access-logfile - \
     --error-logfile - \
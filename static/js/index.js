@@ -94,11 +94,166 @@ function getCSRFToken() {
   return cookieValue;
 }
 
+// Poll the status endpoint until a queued conversion has finished
+async function waitForConversion(data, interval = 2000) {
+  while (data.type === "queued" || data.type === "pending") {
+    await new Promise((resolve) => setTimeout(resolve, interval));
+    const response = await fetch(data.status_url);
+    data = await response.json();
+  }
+  return data;
+}
+
 // Audio recording functionality
 let mediaRecorder;
 let audioChunks = [];
 let isRecording = false;
 
+// Live transcription: while recording, chunks are streamed over a WebSocket
+// that sends back partial transcripts, so the transcript is ready when the
+// recording stops. Without it, chunks go to a resumable upload instead.
+let liveSocket = null;
+
+function showLiveTranscript(text) {
+  const liveTranscript = document.getElementById("liveTranscript");
+  if (!liveTranscript) {
+    return;
+  }
+  liveTranscript.textContent = text;
+  liveTranscript.classList.toggle("hidden", !text);
+}
+
+function openLiveTranscription(chunks, mimeType) {
+  if (!("WebSocket" in window)) {
+    return null;
+  }
+
+  const scheme = window.location.protocol === "https:" ? "wss" : "ws";
+  const socket = new WebSocket(`${scheme}://${window.location.host}/ws/transcribe/`);
+  socket.chunks = chunks;
+  socket.submitted = false;
+  socket.result = new Promise((resolve) => {
+    socket.resolveResult = resolve;
+  });
+
+  socket.onopen = () => {
+    socket.send(JSON.stringify({ type: "start", mime_type: mimeType }));
+    // Chunks recorded while connecting
+    chunks.forEach((chunk) => socket.send(chunk));
+  };
+
+  socket.onmessage = (event) => {
+    const data = JSON.parse(event.data);
+    if (data.type === "partial" || data.type === "transcript") {
+      showLiveTranscript(data.text);
+    } else if (data.type === "live_unavailable") {
+      showLiveTranscript("");
+    } else if (socket.submitted) {
+      socket.resolveResult(data);
+    }
+  };
+
+  socket.onclose = () => {
+    socket.resolveResult(null);
+    if (liveSocket === socket) {
+      liveSocket = null;
+      // Lost before the recording was submitted: upload it instead
+      if (!socket.submitted && chunks === audioChunks) {
+        startChunkedUpload(chunks, mimeType);
+      }
+    }
+  };
+  return socket;
+}
+
+// Resumable upload of the recording in progress; chunks are sent while
+// recording, and resent from the server's offset after a failure
+let recordingUpload = null;
+
+async function startRecordingUpload(chunks, mimeType) {
+  const formData = new FormData();
+  formData.append("content_type", mimeType);
+  try {
+    const response = await fetch("/recordings/uploads/", {
+      method: "POST",
+      body: formData,
+      headers: {
+        "X-CSRFToken": getCSRFToken(),
+      },
+    });
+    if (!response.ok) {
+      throw new Error(`Upload could not be started (${response.status})`);
+    }
+    const upload = await response.json();
+    upload.chunks = chunks;
+    upload.sending = Promise.resolve();
+    upload.error = null;
+    return upload;
+  } catch (error) {
+    // The recording is sent in one request when it is submitted instead
+    return null;
+  }
+}
+
+// Send everything recorded past the acknowledged offset
+async function sendPendingChunks(upload, maxRetries = 5) {
+  for (let attempt = 0; ; ) {
+    const recorded = new Blob(upload.chunks);
+    if (recorded.size <= upload.offset) {
+      upload.error = null;
+      return;
+    }
+    try {
+      const response = await fetch(upload.upload_url, {
+        method: "PATCH",
+        body: recorded.slice(upload.offset),
+        headers: {
+          "Content-Type": "application/offset+octet-stream",
+          "Upload-Offset": String(upload.offset),
+          "X-CSRFToken": getCSRFToken(),
+        },
+      });
+      // A 409 means the server has a different offset; carry on from there
+      if (!response.ok && response.status !== 409) {
+        throw new Error(`Chunk upload failed (${response.status})`);
+      }
+      upload.offset = (await response.json()).offset;
+      attempt = 0;
+    } catch (error) {
+      if (++attempt > maxRetries) {
+        throw error;
+      }
+      await new Promise((resolve) => setTimeout(resolve, Math.min(500 * 2 ** attempt, 10000)));
+    }
+  }
+}
+
+// Start a resumable upload for `chunks`, abandoning the previous one
+function startChunkedUpload(chunks, mimeType) {
+  if (recordingUpload) {
+    fetch(recordingUpload.upload_url, {
+      method: "DELETE",
+      headers: { "X-CSRFToken": getCSRFToken() },
+    }).catch(() => {});
+    recordingUpload = null;
+  }
+  startRecordingUpload(chunks, mimeType).then((upload) => {
+    if (upload && chunks === audioChunks) {
+      recordingUpload = upload;
+      queueRecordingUpload(upload);
+    }
+  });
+}
+
+function queueRecordingUpload(upload) {
+  upload.sending = upload.sending
+    .then(() => sendPendingChunks(upload))
+    .catch((error) => {
+      upload.error = error;
+    });
+  return upload.sending;
+}
+
 async function toggleRecording() {
   const recordButton = document.getElementById("recordButton");
   const recordingStatus = document.getElementById("recordingStatus");
@@ -122,15 +277,40 @@ async function toggleRecording() {
       mediaRecorder = new MediaRecorder(stream, {
         mimeType: "audio/webm;codecs=opus",
       });
-      audioChunks = [];
+      const chunks = (audioChunks = []);
+      const mimeType = mediaRecorder.mimeType;
+
+      // Stream the recording for live transcription, or upload it as it is made
+      if (liveSocket) {
+        const previous = liveSocket;
+        liveSocket = null;
+        previous.close();
+      }
+      showLiveTranscript("");
+      liveSocket = openLiveTranscription(chunks, mimeType);
+      if (!liveSocket) {
+        startChunkedUpload(chunks, mimeType);
+      }
 
       mediaRecorder.ondataavailable = (event) => {
         if (event.data.size > 0) {
-          audioChunks.push(event.data);
+          chunks.push(event.data);
+          if (liveSocket && liveSocket.chunks === chunks) {
+            if (liveSocket.readyState === WebSocket.OPEN) {
+              liveSocket.send(event.data);
+            }
+          } else if (recordingUpload && recordingUpload.chunks === chunks) {
+            queueRecordingUpload(recordingUpload);
+          }
         }
       };
 
       mediaRecorder.onstop = () => {
+        if (liveSocket && liveSocket.chunks === audioChunks
+            && liveSocket.readyState === WebSocket.OPEN) {
+          liveSocket.send(JSON.stringify({ type: "end" }));
+        }
+
         if (audioChunks.length === 0) {
           recordingStatus.textContent = "Error: No audio data recorded";
           recordingStatus.className = "text-sm text-red-400";
@@ -152,7 +332,7 @@ async function toggleRecording() {
         submitButton.className =
           "github-button px-4 py-2 rounded-lg text-white font-medium mt-3 flex items-center space-x-2";
         submitButton.innerHTML = '<i data-lucide="send" class="icon-sm"></i><span>Submit Recording</span>';
-        submitButton.onclick = () => submitRecordedAudio(audioUrl);
+        submitButton.onclick = () => submitRecordedAudio(audioBlob);
 
         // Clear previous content and add new content
         recordingPreview.innerHTML = "";
@@ -216,62 +396,83 @@ async function toggleRecording() {
     }
 }
 
-async function submitRecordedAudio(audioUrl) {
-  try {
-    // Convert audio URL to blob
-    const response = await fetch(audioUrl);
-    const audioBlob = await response.blob();
-
-    // Convert blob to base64
-    const reader = new FileReader();
-    reader.readAsDataURL(audioBlob);
-    reader.onloadend = async function () {
-      const base64Audio = reader.result;
-
-      // Get description prompt
-      const descriptionPrompt =
-        document.getElementById("description-prompt").value;
+// Submit the live recording, finish the resumable upload, or send the whole
+// recording if neither worked out; returns the response data
+async function sendRecording(audioBlob, descriptionPrompt) {
+  const socket = liveSocket;
+  if (socket && socket.chunks === audioChunks && socket.readyState === WebSocket.OPEN) {
+    socket.submitted = true;
+    socket.send(JSON.stringify({ type: "submit", description_prompt: descriptionPrompt }));
+    const data = await socket.result;
+    if (data) {
+      liveSocket = null;
+      return data;
+    }
+  }
 
-      // Create form data
+  const upload = recordingUpload;
+  if (upload && upload.chunks === audioChunks) {
+    await queueRecordingUpload(upload);
+    if (!upload.error) {
       const formData = new FormData();
-      formData.append("recorded_audio", base64Audio);
       formData.append("description_prompt", descriptionPrompt);
-
-      // Show loader
-      const audioLoader = document.getElementById("audio-conversion-loader");
-      if (audioLoader) {
-        audioLoader.classList.remove("hidden");
-      }
-
-      // Send to server
-      const response = await fetch("/", {
+      const response = await fetch(upload.complete_url, {
         method: "POST",
         body: formData,
         headers: {
           "X-CSRFToken": getCSRFToken(),
         },
       });
+      if (response.status !== 404) {
+        recordingUpload = null;
+        return response.json();
+      }
+    }
+  }
 
-      const data = await response.json();
+  const response = await fetch(`/recordings/?description_prompt=${encodeURIComponent(descriptionPrompt)}`, {
+    method: "POST",
+    body: audioBlob,
+    headers: {
+      "Content-Type": audioBlob.type || "application/octet-stream",
+      "X-CSRFToken": getCSRFToken(),
+    },
+  });
+  return response.json();
+}
 
-      if (data.type === "image") {
-        displayGeneratedImage(data);
-        toast.show("Image generated successfully!", "success");
-      } else if (data.type === "error") {
-        toast.show(`Error: ${data.error}`, "error");
-      } else if (data.type === "quota_error") {
-        toast.show(`OpenAI API Quota Error: ${data.error}. Please check your OpenAI billing and try again later.`, "error");
-      } else {
-        toast.show("An unexpected error occurred. Please try again.", "error");
-      }
+async function submitRecordedAudio(audioBlob) {
+  // Show loader
+  const audioLoader = document.getElementById("audio-conversion-loader");
+  if (audioLoader) {
+    audioLoader.classList.remove("hidden");
+  }
 
-      // Hide loader
-      if (audioLoader) {
-        audioLoader.classList.add("hidden");
-      }
-    };
+  try {
+    // Get description prompt
+    const descriptionPrompt =
+      document.getElementById("description-prompt").value;
+
+    // Send to server
+    const data = await waitForConversion(await sendRecording(audioBlob, descriptionPrompt));
+
+    if (data.type === "image") {
+      displayGeneratedImage(data);
+      toast.show("Image generated successfully!", "success");
+    } else if (data.type === "error") {
+      toast.show(`Error: ${data.error}`, "error");
+    } else if (data.type === "quota_error") {
+      toast.show(`OpenAI API Quota Error: ${data.error}. Please check your OpenAI billing and try again later.`, "error");
+    } else {
+      toast.show("An unexpected error occurred. Please try again.", "error");
+    }
   } catch (error) {
     toast.show("An error occurred while submitting the recorded audio. Please try again.", "error");
+  } finally {
+    // Hide loader
+    if (audioLoader) {
+      audioLoader.classList.add("hidden");
+    }
   }
 }
 
@@ -283,7 +484,13 @@ function displayGeneratedImage(data) {
 
   // Create image element
   const img = document.createElement("img");
-  img.src = `data:image/png;base64,${data.image}`;
+  // Resized WebP/AVIF variants; the browser picks the width it needs
+  img.src = data.image_url;
+  img.srcset = (data.variants || [])
+    .map((variant) => `${variant.url} ${variant.width}w`)
+    .concat(`${data.image_url} 1024w`)
+    .join(", ");
+  img.sizes = "(min-width: 1024px) 512px, 100vw";
   img.className = "w-full h-auto rounded-lg";
   img.alt = "Generated Image";
 
@@ -322,25 +529,53 @@ function displayGeneratedImage(data) {
 // Display generated audio
 function displayGeneratedAudio(data) {
   const outputDiv = document.getElementById("image-output");
+
+  // Opus or AAC transcodes, a fraction of the MP3's size; the browser
+  // downloads only the first source it can play
+  showAudioPlayer(
+    (data.variants || [])
+      .map((variant) => ({ src: variant.url, type: variant.content_type }))
+      .concat({ src: data.original.url, type: data.original.content_type })
+  );
+  displayAudioMetadata(data);
+
+  // Show output section
+  outputDiv.classList.remove("hidden");
+
+  // Scroll to output
+  outputDiv.scrollIntoView({ behavior: "smooth" });
+  
+  // Show success message
+  toast.show("Audio generated and displayed successfully!", "success");
+}
+
+// Replace the generated audio player with one playing the first of
+// `sources` ({src, type}) the browser supports
+function showAudioPlayer(sources) {
   const generatedAudio = document.getElementById("generated-audio");
-  const metadata = document.getElementById("image-metadata");
 
   // Create audio element
   const audio = document.createElement("audio");
   audio.controls = true;
   audio.className = "w-full";
 
-  const source = document.createElement("source");
-  source.src = `data:audio/mp3;base64,${data.audio}`;
-  source.type = "audio/mp3";
-
-  audio.appendChild(source);
+  for (const { src, type } of sources) {
+    const source = document.createElement("source");
+    source.src = src;
+    source.type = type;
+    audio.appendChild(source);
+  }
 
   // Clear previous content and add new audio
   generatedAudio.innerHTML = "";
   generatedAudio.appendChild(audio);
+  return audio;
+}
+
+// Show the details of a finished image-to-audio conversion
+function displayAudioMetadata(data) {
+  const metadata = document.getElementById("image-metadata");
 
-  // Add metadata
   metadata.innerHTML = `
     <div class="space-y-2">
       <p><strong class="text-github-text">Image Description:</strong> <span class="text-github-muted">${
@@ -357,15 +592,61 @@ function displayGeneratedAudio(data) {
       }</span></p>
     </div>
   `;
+}
 
-  // Show output section
-  outputDiv.classList.remove("hidden");
+// Whether the browser can play MP3 from a MediaSource while it downloads
+function canStreamAudio() {
+  return "MediaSource" in window && MediaSource.isTypeSupported("audio/mpeg");
+}
 
-  // Scroll to output
+// Play the narration while it is still being generated, then resolve with
+// the conversion's metadata from the status endpoint
+async function streamImageToAudio(formData) {
+  const response = await fetch("/stream/image-to-audio/", {
+    method: "POST",
+    body: formData,
+    headers: {
+      "X-CSRFToken": getCSRFToken(),
+    },
+  });
+
+  const contentType = response.headers.get("Content-Type") || "";
+  if (!response.ok || !contentType.startsWith("audio/")) {
+    return response.json();
+  }
+
+  // Start playback as soon as the first MP3 frames arrive
+  const mediaSource = new MediaSource();
+  const audio = showAudioPlayer([
+    { src: URL.createObjectURL(mediaSource), type: "audio/mpeg" },
+  ]);
+  const outputDiv = document.getElementById("image-output");
+  outputDiv.classList.remove("hidden");
   outputDiv.scrollIntoView({ behavior: "smooth" });
-  
-  // Show success message
-  toast.show("Audio generated and displayed successfully!", "success");
+
+  await new Promise((resolve) =>
+    mediaSource.addEventListener("sourceopen", resolve, { once: true })
+  );
+  const sourceBuffer = mediaSource.addSourceBuffer("audio/mpeg");
+  audio.play().catch(() => {}); // Autoplay may be blocked; the controls still work
+
+  const reader = response.body.getReader();
+  while (true) {
+    const { done, value } = await reader.read();
+    if (done) {
+      break;
+    }
+    sourceBuffer.appendBuffer(value);
+    await new Promise((resolve) =>
+      sourceBuffer.addEventListener("updateend", resolve, { once: true })
+    );
+  }
+  mediaSource.endOfStream();
+
+  const statusResponse = await fetch(response.headers.get("X-Status-Url"));
+  const data = await waitForConversion(await statusResponse.json());
+  data.streamed = true;
+  return data;
 }
 
 // On document load
@@ -404,19 +685,28 @@ document.addEventListener("DOMContentLoaded", function () {
         imageLoader.classList.remove("hidden");
       }
 
-      // Send POST request to server with CSRF token
-      fetch("/", {
-        method: "POST",
-        body: formData,
-        headers: {
-          "X-CSRFToken": getCSRFToken(),
-        },
-      })
-        .then((response) => {
-          return response.json();
-        })
+      // Stream the narration when the browser can play it progressively,
+      // otherwise queue the conversion and wait for the finished file
+      const conversion = canStreamAudio()
+        ? streamImageToAudio(formData)
+        : fetch("/", {
+            method: "POST",
+            body: formData,
+            headers: {
+              "X-CSRFToken": getCSRFToken(),
+            },
+          })
+            .then((response) => {
+              return response.json();
+            })
+            .then(waitForConversion);
+
+      conversion
         .then((data) => {
-          if (data.type === "audio") {
+          if (data.type === "audio" && data.streamed) {
+            displayAudioMetadata(data);
+            toast.show("Audio generated successfully!", "success");
+          } else if (data.type === "audio") {
             displayGeneratedAudio(data);
             toast.show("Audio generated successfully!", "success");
           } else if (data.type === "error") {
@@ -478,6 +768,7 @@ document.addEventListener("DOMContentLoaded", function () {
         .then((response) => {
           return response.json();
         })
+        .then(waitForConversion)
         .then((data) => {
           if (data.type === "image") {
             displayGeneratedImage(data);